@@ -32,11 +32,13 @@ from utils.utils import (
     get_admin_user,
 )
 from utils.misc import calculate_sha256
+from utils.uploads import save_upload, UploadTooLargeError
 
 from config import (
     SRC_LOG_LEVELS,
     CACHE_DIR,
     UPLOAD_DIR,
+    AUDIO_FILE_MAX_SIZE,
     WHISPER_MODEL,
     WHISPER_MODEL_DIR,
     WHISPER_MODEL_AUTO_UPDATE,
@@ -170,10 +172,7 @@ def transcribe(
     try:
         filename = file.filename
         file_path = f"{UPLOAD_DIR}/{filename}"
-        contents = file.file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-            f.close()
+        save_upload(file.file, file_path, max_size=AUDIO_FILE_MAX_SIZE * 1024 * 1024)
 
         whisper_kwargs = {
             "model_size_or_path": WHISPER_MODEL,
@@ -204,6 +203,11 @@ def transcribe(
 
         return {"text": transcript.strip()}
 
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=ERROR_MESSAGES.FILE_TOO_LARGE(f"{AUDIO_FILE_MAX_SIZE} MB"),
+        )
     except Exception as e:
         log.exception(e)
 
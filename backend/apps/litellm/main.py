@@ -18,8 +18,16 @@ from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 
 from utils.utils import get_verified_user, get_current_user, get_admin_user
-from config import SRC_LOG_LEVELS, ENV
+from config import (
+    SRC_LOG_LEVELS,
+    ENV,
+    MODEL_REGISTRY_TTL,
+    MODEL_REGISTRY_REFRESH_INTERVAL,
+    MODEL_REGISTRY_MAX_BACKOFF,
+)
 from constants import MESSAGES
+from utils.http_client import HTTPClientPool
+from utils.model_registry import ModelRegistry
 
 import os
 
@@ -168,6 +176,8 @@ async def restart_litellm():
         asyncio.create_task(start_litellm_background())
         log.info("litellm service restart complete.")
 
+        app.state.MODEL_REGISTRY.invalidate(reset_backoff=True)
+
         return {
             "status": "success",
             "message": "litellm service restarted successfully.",
@@ -209,6 +219,55 @@ async def update_config(form_data: LiteLLMConfigForm, user=Depends(get_admin_use
     return app.state.CONFIG
 
 
+app.state.HTTP_CLIENTS = HTTPClientPool()
+
+
+async def fetch_models(idx, url):
+    try:
+        session = app.state.HTTP_CLIENTS.get_session(url)
+        async with session.get(f"{url}/models") as response:
+            response.raise_for_status()
+            return await response.json()
+    except Exception as e:
+        log.exception(e)
+        return None
+
+
+def merge_models_responses(responses):
+    data = responses[0] if responses else None
+    if data is not None:
+        return data
+
+    # Fall back to the configured models while the proxy is unreachable
+    return {
+        "data": [
+            {
+                "id": model["model_name"],
+                "object": "model",
+                "created": int(time.time()),
+                "owned_by": "openai",
+            }
+            for model in app.state.CONFIG["model_list"]
+        ],
+        "object": "list",
+    }
+
+
+app.state.MODEL_REGISTRY = ModelRegistry(
+    "litellm",
+    get_urls=lambda: [f"http://localhost:{LITELLM_PROXY_PORT}/v1"],
+    fetch=fetch_models,
+    merge=merge_models_responses,
+    ttl=MODEL_REGISTRY_TTL,
+    max_backoff=MODEL_REGISTRY_MAX_BACKOFF,
+)
+
+
+async def start_model_registry():
+    if app.state.ENABLE:
+        await app.state.MODEL_REGISTRY.run(MODEL_REGISTRY_REFRESH_INTERVAL)
+
+
 @app.get("/models")
 @app.get("/v1/models")
 async def get_models(user=Depends(get_current_user)):
@@ -217,48 +276,18 @@ async def get_models(user=Depends(get_current_user)):
         while not background_process:
             await asyncio.sleep(0.1)
 
-        url = f"http://localhost:{LITELLM_PROXY_PORT}/v1"
-        r = None
-        try:
-            r = requests.request(method="GET", url=f"{url}/models")
-            r.raise_for_status()
-
-            data = r.json()
-
-            if app.state.ENABLE_MODEL_FILTER:
-                if user and user.role == "user":
-                    data["data"] = list(
-                        filter(
-                            lambda model: model["id"] in app.state.MODEL_FILTER_LIST,
-                            data["data"],
-                        )
+        data = await app.state.MODEL_REGISTRY.get()
+
+        if app.state.ENABLE_MODEL_FILTER:
+            if user and user.role == "user":
+                data["data"] = list(
+                    filter(
+                        lambda model: model["id"] in app.state.MODEL_FILTER_LIST,
+                        data["data"],
                     )
+                )
 
-            return data
-        except Exception as e:
-
-            log.exception(e)
-            error_detail = "Open WebUI: Server Connection Error"
-            if r is not None:
-                try:
-                    res = r.json()
-                    if "error" in res:
-                        error_detail = f"External: {res['error']}"
-                except:
-                    error_detail = f"External: {e}"
-
-            return {
-                "data": [
-                    {
-                        "id": model["model_name"],
-                        "object": "model",
-                        "created": int(time.time()),
-                        "owned_by": "openai",
-                    }
-                    for model in app.state.CONFIG["model_list"]
-                ],
-                "object": "list",
-            }
+        return data
     else:
         return {
             "data": [],
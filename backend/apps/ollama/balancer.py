@@ -0,0 +1,198 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["OLLAMA"])
+
+
+BALANCER_STRATEGIES = [
+    "least_inflight",
+    "ewma_latency",
+    "weighted_round_robin",
+    "random",
+]
+
+
+class BackendStats:
+    def __init__(self, weight: float = 1.0):
+        self.weight = weight
+        self.in_flight = 0
+        self.total = 0
+        self.failures = 0
+        self.ewma_ttft: Optional[float] = None
+        self.last_ttft: Optional[float] = None
+        # current weight used by the smooth weighted round-robin
+        self.current_weight = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "total": self.total,
+            "failures": self.failures,
+            "ewma_ttft": self.ewma_ttft,
+            "last_ttft": self.last_ttft,
+        }
+
+
+class RequestTracker:
+    """Accounts a single proxied request against the backend it was sent to."""
+
+    def __init__(self, balancer: "LoadBalancer", url: str):
+        self.balancer = balancer
+        self.url = url
+        self.start_time = time.monotonic()
+        self.first_token_time: Optional[float] = None
+        self.finished = False
+
+    def first_token(self):
+        if self.first_token_time is None:
+            self.first_token_time = time.monotonic()
+            self.balancer.record_ttft(self.url, self.first_token_time - self.start_time)
+
+    def done(self, failed: bool = False):
+        if not self.finished:
+            self.finished = True
+            self.balancer.release(self.url, failed=failed)
+
+
+class LoadBalancer:
+    """
+    Picks an upstream for a request among the backends serving a model.
+
+    Strategies:
+    - least_inflight: fewest requests in flight relative to the backend weight
+    - ewma_latency: lowest EWMA of time-to-first-token, scaled by the load
+    - weighted_round_robin: smooth weighted round-robin over the candidates
+    - random: uniform random choice (the previous behaviour)
+    """
+
+    def __init__(
+        self,
+        strategy: str = "least_inflight",
+        weights: Optional[Dict[str, float]] = None,
+        alpha: float = 0.3,
+        warm_max_in_flight: float = 4,
+    ):
+        if strategy not in BALANCER_STRATEGIES:
+            raise ValueError(f"Unknown load balancer strategy: {strategy}")
+
+        self.strategy = strategy
+        self.weights = weights or {}
+        self.alpha = alpha
+        self.warm_max_in_flight = warm_max_in_flight
+        self._stats: Dict[str, BackendStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, url: str) -> BackendStats:
+        stats = self._stats.get(url)
+        if stats is None:
+            stats = BackendStats(weight=self.weights.get(url, 1.0))
+            self._stats[url] = stats
+        return stats
+
+    def set_strategy(self, strategy: str):
+        if strategy not in BALANCER_STRATEGIES:
+            raise ValueError(f"Unknown load balancer strategy: {strategy}")
+        self.strategy = strategy
+
+    def set_weights(self, weights: Dict[str, float]):
+        with self._lock:
+            self.weights = weights
+            for url, stats in self._stats.items():
+                stats.weight = weights.get(url, 1.0)
+
+    def _get_candidates(
+        self, stats: List[BackendStats], warm: Optional[List[bool]]
+    ) -> List[int]:
+        """
+        Positions to choose from: the warm backends while one of them has
+        fewer than `warm_max_in_flight` requests in flight per unit of
+        weight, every backend once they are all that busy.
+        """
+        everything = list(range(len(stats)))
+        if not warm or all(warm) or not any(warm):
+            return everything
+
+        warm_idxs = [i for i in everything if warm[i]]
+        if any(
+            stats[i].in_flight / max(stats[i].weight, 1e-6) < self.warm_max_in_flight
+            for i in warm_idxs
+        ):
+            return warm_idxs
+        return everything
+
+    def choose(self, urls: List[str], warm: Optional[List[bool]] = None) -> int:
+        """
+        Returns the position in `urls` of the backend to use. `warm` flags
+        the backends that already have the model loaded, preferred until
+        they get busy.
+        """
+        if len(urls) == 1:
+            return 0
+
+        with self._lock:
+            all_stats = [self._get_stats(url) for url in urls]
+            candidates = self._get_candidates(all_stats, warm)
+            stats = [all_stats[i] for i in candidates]
+
+            if self.strategy == "least_inflight":
+                scores = [
+                    (s.in_flight / max(s.weight, 1e-6), s.ewma_ttft or 0.0)
+                    for s in stats
+                ]
+            elif self.strategy == "ewma_latency":
+                # Backends without samples score 0 so they get probed first.
+                scores = [
+                    (s.ewma_ttft or 0.0) * (s.in_flight + 1) / max(s.weight, 1e-6)
+                    for s in stats
+                ]
+            elif self.strategy == "weighted_round_robin":
+                total = sum(s.weight for s in stats)
+                for s in stats:
+                    s.current_weight += s.weight
+                best = max(range(len(stats)), key=lambda i: stats[i].current_weight)
+                stats[best].current_weight -= total
+                return candidates[best]
+            else:
+                return random.choice(candidates)
+
+            best_score = min(scores)
+            return random.choice(
+                [candidates[i] for i, score in enumerate(scores) if score == best_score]
+            )
+
+    def track(self, url: str) -> RequestTracker:
+        with self._lock:
+            stats = self._get_stats(url)
+            stats.in_flight += 1
+            stats.total += 1
+        return RequestTracker(self, url)
+
+    def record_ttft(self, url: str, ttft: float):
+        with self._lock:
+            stats = self._get_stats(url)
+            stats.last_ttft = ttft
+            if stats.ewma_ttft is None:
+                stats.ewma_ttft = ttft
+            else:
+                stats.ewma_ttft = self.alpha * ttft + (1 - self.alpha) * stats.ewma_ttft
+
+    def release(self, url: str, failed: bool = False):
+        with self._lock:
+            stats = self._get_stats(url)
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            if failed:
+                stats.failures += 1
+
+    def get_stats(self, urls: List[str]) -> List[dict]:
+        with self._lock:
+            return [
+                {"idx": idx, "url": url, **self._get_stats(url).to_dict()}
+                for idx, url in enumerate(urls)
+            ]
@@ -11,14 +11,13 @@ from fastapi import (
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 
 from pydantic import BaseModel, ConfigDict
 
 import os
 import re
 import copy
-import random
 import requests
 import json
 import uuid
@@ -26,7 +25,7 @@ import aiohttp
 import asyncio
 import logging
 from urllib.parse import urlparse
-from typing import Optional, List, Union
+from typing import Callable, Optional, List, Union
 
 
 from apps.web.models.users import Users
@@ -40,8 +39,38 @@ from config import (
     ENABLE_MODEL_FILTER,
     MODEL_FILTER_LIST,
     UPLOAD_DIR,
+    MODEL_FILE_MAX_SIZE,
+    OLLAMA_CLIENT_MAX_CONNECTIONS,
+    OLLAMA_CLIENT_KEEPALIVE_TIMEOUT,
+    OLLAMA_CLIENT_CONNECT_TIMEOUT,
+    OLLAMA_CLIENT_READ_TIMEOUT,
+    OLLAMA_LOAD_BALANCER_STRATEGY,
+    OLLAMA_BASE_URL_WEIGHTS,
+    OLLAMA_RESIDENCY_POLL_INTERVAL,
+    OLLAMA_WARM_MAX_INFLIGHT,
+    MODEL_REGISTRY_TTL,
+    MODEL_REGISTRY_REFRESH_INTERVAL,
+    MODEL_REGISTRY_MAX_BACKOFF,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_TIMEOUT,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES,
+    CANCELLATION_BACKEND,
+    CANCELLATION_REDIS_URL,
 )
 from utils.misc import calculate_sha256
+from utils.uploads import save_upload, UploadTooLargeError
+from utils.http_client import HTTPClientPool
+from utils.model_registry import ModelRegistry
+from utils.health import HealthChecker
+from utils.cancellation import (
+    CancellationRegistry,
+    CancellableStreamingResponse,
+    get_cancellation_backend,
+)
+from apps.ollama.balancer import LoadBalancer, RequestTracker, BALANCER_STRATEGIES
+from apps.ollama.residency import ModelResidency
 
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["OLLAMA"])
@@ -62,19 +91,30 @@ app.state.MODEL_FILTER_LIST = MODEL_FILTER_LIST
 app.state.OLLAMA_BASE_URLS = OLLAMA_BASE_URLS
 app.state.MODELS = {}
 
+app.state.HTTP_CLIENTS = HTTPClientPool(
+    limit=OLLAMA_CLIENT_MAX_CONNECTIONS,
+    keepalive_timeout=OLLAMA_CLIENT_KEEPALIVE_TIMEOUT,
+    connect_timeout=OLLAMA_CLIENT_CONNECT_TIMEOUT,
+    read_timeout=OLLAMA_CLIENT_READ_TIMEOUT,
+)
 
-REQUEST_POOL = []
+app.state.CANCELLATION = CancellationRegistry(
+    get_cancellation_backend(CANCELLATION_BACKEND, CANCELLATION_REDIS_URL)
+)
 
 
-# TODO: Implement a more intelligent load balancing mechanism for distributing requests among multiple backend instances.
-# Current implementation uses a simple round-robin approach (random.choice). Consider incorporating algorithms like weighted round-robin,
-# least connections, or least response time for better resource utilization and performance optimization.
+app.state.BALANCER = LoadBalancer(
+    strategy=OLLAMA_LOAD_BALANCER_STRATEGY,
+    weights=dict(zip(OLLAMA_BASE_URLS, OLLAMA_BASE_URL_WEIGHTS)),
+    warm_max_in_flight=OLLAMA_WARM_MAX_INFLIGHT,
+)
+app.state.RESIDENCY = ModelResidency()
 
 
 @app.middleware("http")
 async def check_url(request: Request, call_next):
     if len(app.state.MODELS) == 0:
-        await get_all_models()
+        await app.state.MODEL_REGISTRY.get()
     else:
         pass
 
@@ -100,32 +140,308 @@ class UrlUpdateForm(BaseModel):
 @app.post("/urls/update")
 async def update_ollama_api_url(form_data: UrlUpdateForm, user=Depends(get_admin_user)):
     app.state.OLLAMA_BASE_URLS = form_data.urls
+    app.state.MODEL_REGISTRY.invalidate(reset_backoff=True)
 
     log.info(f"app.state.OLLAMA_BASE_URLS: {app.state.OLLAMA_BASE_URLS}")
     return {"OLLAMA_BASE_URLS": app.state.OLLAMA_BASE_URLS}
 
 
+def get_balancer_status():
+    return {
+        "strategy": app.state.BALANCER.strategy,
+        "strategies": BALANCER_STRATEGIES,
+        "backends": app.state.BALANCER.get_stats(app.state.OLLAMA_BASE_URLS),
+    }
+
+
+@app.get("/balancer")
+async def get_balancer(user=Depends(get_admin_user)):
+    return get_balancer_status()
+
+
+class BalancerUpdateForm(BaseModel):
+    strategy: Optional[str] = None
+    weights: Optional[List[float]] = None
+
+
+@app.post("/balancer/update")
+async def update_balancer(form_data: BalancerUpdateForm, user=Depends(get_admin_user)):
+    try:
+        if form_data.strategy is not None:
+            app.state.BALANCER.set_strategy(form_data.strategy)
+        if form_data.weights is not None:
+            app.state.BALANCER.set_weights(
+                dict(zip(app.state.OLLAMA_BASE_URLS, form_data.weights))
+            )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_MESSAGES.DEFAULT(e),
+        )
+
+    return get_balancer_status()
+
+
+@app.get("/health")
+async def get_backends_health(user=Depends(get_admin_user)):
+    return {"backends": app.state.HEALTH.get_status(app.state.OLLAMA_BASE_URLS)}
+
+
+@app.get("/residency")
+async def get_model_residency(user=Depends(get_admin_user)):
+    return {"backends": app.state.RESIDENCY.get_status(app.state.OLLAMA_BASE_URLS)}
+
+
+async def start_cancellation_listener():
+    await app.state.CANCELLATION.run()
+
+
 @app.get("/cancel/{request_id}")
 async def cancel_ollama_request(request_id: str, user=Depends(get_current_user)):
     if user:
-        if request_id in REQUEST_POOL:
-            REQUEST_POOL.remove(request_id)
+        await app.state.CANCELLATION.cancel(request_id)
         return True
     else:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=ERROR_MESSAGES.ACCESS_PROHIBITED)
 
 
-async def fetch_url(url):
+async def fetch_url(url, path):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.json()
+        session = app.state.HTTP_CLIENTS.get_session(url)
+        async with session.get(f"{url}{path}") as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
         return None
 
 
+async def probe_url(idx, url) -> bool:
+    session = app.state.HTTP_CLIENTS.get_session(url)
+    async with session.get(
+        f"{url}/api/version",
+        timeout=aiohttp.ClientTimeout(total=HEALTH_CHECK_TIMEOUT),
+    ) as response:
+        return response.ok
+
+
+app.state.HEALTH = HealthChecker(
+    "ollama",
+    get_urls=lambda: app.state.OLLAMA_BASE_URLS,
+    probe=probe_url,
+    failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    half_open_successes=CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES,
+)
+
+
+async def start_health_checks():
+    if HEALTH_CHECK_INTERVAL > 0:
+        await app.state.HEALTH.run(HEALTH_CHECK_INTERVAL)
+
+
+async def send_request(
+    url: str,
+    path: str,
+    method: str = "POST",
+    data: Optional[Union[str, bytes]] = None,
+    headers: Optional[dict] = None,
+) -> aiohttp.ClientResponse:
+    r = None
+    try:
+        session = app.state.HTTP_CLIENTS.get_session(url)
+        r = await session.request(method, f"{url}{path}", data=data, headers=headers)
+    except Exception as e:
+        log.exception(e)
+        app.state.HEALTH.record_failure(url, str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Open WebUI: Server Connection Error",
+        )
+
+    # Client errors (unknown model, bad payload) say nothing about the backend
+    if r.status >= 500:
+        app.state.HEALTH.record_failure(url, f"HTTP {r.status}")
+    else:
+        app.state.HEALTH.record_success(url)
+
+    if not r.ok:
+        error_detail = "Open WebUI: Server Connection Error"
+        try:
+            res = await r.json(content_type=None)
+            if "error" in res:
+                error_detail = f"Ollama: {res['error']}"
+        except Exception as e:
+            error_detail = f"Ollama: {e}"
+        finally:
+            r.release()
+
+        raise HTTPException(status_code=r.status, detail=error_detail)
+
+    return r
+
+
+def mark_loaded(url: str, model: Optional[str]):
+    """Records that `url` holds `model` once it answered a request for it."""
+    if model:
+        if ":" not in model:
+            model = f"{model}:latest"
+        app.state.RESIDENCY.mark_loaded(url, model)
+
+
+async def send_json_request(
+    url: str,
+    path: str,
+    method: str = "POST",
+    data: Optional[str] = None,
+    model: Optional[str] = None,
+):
+    r = await send_request(url, path, method=method, data=data)
+    mark_loaded(url, model)
+    try:
+        return await r.json(content_type=None)
+    except Exception as e:
+        log.exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ollama: {e}",
+        )
+    finally:
+        r.release()
+
+
+async def stream_lines(
+    r: aiohttp.ClientResponse,
+    request_id: Optional[str] = None,
+    prefix: Optional[str] = None,
+    tracker: Optional[RequestTracker] = None,
+):
+    # Re-chunk the upstream body on newlines so every yielded chunk is a
+    # complete NDJSON/SSE line, whatever the transport chunking was.
+    try:
+        if prefix:
+            yield prefix.encode("utf-8")
+
+        buffer = b""
+        async for data in r.content.iter_any():
+            if tracker:
+                tracker.first_token()
+
+            lines = (buffer + data).split(b"\n")
+            buffer = lines.pop()
+
+            for line in lines:
+                yield line + b"\n"
+
+        if buffer:
+            yield buffer
+    except aiohttp.ClientError:
+        # A cancellation closes the response under the pending read
+        if request_id and not app.state.CANCELLATION.is_active(request_id):
+            log.warning("User: canceled request")
+            return
+        raise
+    finally:
+        r.release()
+        if tracker:
+            tracker.done()
+        if request_id:
+            app.state.CANCELLATION.unregister(request_id)
+
+
+async def cleanup_response(
+    r: Optional[aiohttp.ClientResponse],
+    tracker: Optional[RequestTracker] = None,
+    on_done: Optional[Callable[[], None]] = None,
+    request_id: Optional[str] = None,
+):
+    # Runs after the response is sent or the client went away; closing an
+    # unfinished response aborts the upstream generation.
+    if request_id:
+        app.state.CANCELLATION.unregister(request_id)
+    if r is not None:
+        r.close()
+    if tracker:
+        tracker.done()
+    if on_done:
+        on_done()
+
+
+async def send_streaming_request(
+    url: str,
+    path: str,
+    data: Optional[Union[str, bytes]] = None,
+    method: str = "POST",
+    headers: Optional[dict] = None,
+    request_id: Optional[str] = None,
+    prefix: Optional[str] = None,
+    track: bool = False,
+    on_done: Optional[Callable[[], None]] = None,
+    model: Optional[str] = None,
+):
+    # Generation requests are accounted against the backend for load balancing
+    tracker = app.state.BALANCER.track(url) if track else None
+
+    try:
+        r = await send_request(url, path, method=method, data=data, headers=headers)
+    except Exception:
+        if tracker:
+            tracker.done(failed=True)
+        raise
+
+    mark_loaded(url, model)
+
+    if request_id:
+        app.state.CANCELLATION.register(request_id, r.close)
+
+    return CancellableStreamingResponse(
+        stream_lines(r, request_id=request_id, prefix=prefix, tracker=tracker),
+        status_code=r.status,
+        headers=dict(r.headers),
+        background=BackgroundTask(
+            cleanup_response,
+            r=r,
+            tracker=tracker,
+            on_done=on_done,
+            request_id=request_id,
+        ),
+        on_disconnect=(
+            (lambda: app.state.CANCELLATION.cancel_local(request_id))
+            if request_id
+            else r.close
+        ),
+    )
+
+
+def select_url_idx(model: str, url_idxs: List[int]) -> int:
+    url_idxs = [
+        idx
+        for idx in url_idxs
+        if app.state.HEALTH.is_available(app.state.OLLAMA_BASE_URLS[idx])
+    ]
+    if not url_idxs:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=ERROR_MESSAGES.BACKEND_UNAVAILABLE(model),
+        )
+
+    # Prefer backends that already have the model loaded, a cold start costs
+    # far more than queueing behind a few requests on a warm node, until the
+    # warm nodes get busy.
+    urls = [app.state.OLLAMA_BASE_URLS[idx] for idx in url_idxs]
+    warm = [app.state.RESIDENCY.is_warm(url, model) for url in urls]
+    return url_idxs[app.state.BALANCER.choose(urls, warm=warm)]
+
+
+async def start_residency_monitor():
+    if OLLAMA_RESIDENCY_POLL_INTERVAL > 0:
+        await app.state.RESIDENCY.run(
+            lambda: app.state.OLLAMA_BASE_URLS,
+            fetch_url,
+            OLLAMA_RESIDENCY_POLL_INTERVAL,
+        )
+
+
 def merge_models_lists(model_lists):
     merged_models = {}
 
@@ -145,20 +461,32 @@ def merge_models_lists(model_lists):
 # user=Depends(get_current_user)
 
 
-async def get_all_models():
-    log.info("get_all_models()")
-    tasks = [fetch_url(f"{url}/api/tags") for url in app.state.OLLAMA_BASE_URLS]
-    responses = await asyncio.gather(*tasks)
+def update_models(models: dict):
+    app.state.MODELS = {model["model"]: model for model in models["models"]}
+
 
-    models = {
+app.state.MODEL_REGISTRY = ModelRegistry(
+    "ollama",
+    get_urls=lambda: app.state.OLLAMA_BASE_URLS,
+    fetch=lambda idx, url: fetch_url(url, "/api/tags"),
+    merge=lambda responses: {
         "models": merge_models_lists(
             map(lambda response: response["models"] if response else None, responses)
         )
-    }
+    },
+    on_update=update_models,
+    ttl=MODEL_REGISTRY_TTL,
+    max_backoff=MODEL_REGISTRY_MAX_BACKOFF,
+)
 
-    app.state.MODELS = {model["model"]: model for model in models["models"]}
 
-    return models
+async def get_all_models(force: bool = False):
+    log.info("get_all_models()")
+    return await app.state.MODEL_REGISTRY.get(force=force)
+
+
+async def start_model_registry():
+    await app.state.MODEL_REGISTRY.run(MODEL_REGISTRY_REFRESH_INTERVAL)
 
 
 @app.get("/api/tags")
@@ -181,26 +509,7 @@ async def get_ollama_tags(
         return models
     else:
         url = app.state.OLLAMA_BASE_URLS[url_idx]
-        try:
-            r = requests.request(method="GET", url=f"{url}/api/tags")
-            r.raise_for_status()
-
-            return r.json()
-        except Exception as e:
-            log.exception(e)
-            error_detail = "Open WebUI: Server Connection Error"
-            if r is not None:
-                try:
-                    res = r.json()
-                    if "error" in res:
-                        error_detail = f"Ollama: {res['error']}"
-                except:
-                    error_detail = f"Ollama: {e}"
-
-            raise HTTPException(
-                status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=error_detail,
-            )
+        return await send_json_request(url, "/api/tags", method="GET")
 
 
 @app.get("/api/version")
@@ -210,7 +519,7 @@ async def get_ollama_versions(url_idx: Optional[int] = None):
     if url_idx == None:
 
         # returns lowest version
-        tasks = [fetch_url(f"{url}/api/version") for url in app.state.OLLAMA_BASE_URLS]
+        tasks = [fetch_url(url, "/api/version") for url in app.state.OLLAMA_BASE_URLS]
         responses = await asyncio.gather(*tasks)
         responses = list(filter(lambda x: x is not None, responses))
 
@@ -230,26 +539,7 @@ async def get_ollama_versions(url_idx: Optional[int] = None):
             )
     else:
         url = app.state.OLLAMA_BASE_URLS[url_idx]
-        try:
-            r = requests.request(method="GET", url=f"{url}/api/version")
-            r.raise_for_status()
-
-            return r.json()
-        except Exception as e:
-            log.exception(e)
-            error_detail = "Open WebUI: Server Connection Error"
-            if r is not None:
-                try:
-                    res = r.json()
-                    if "error" in res:
-                        error_detail = f"Ollama: {res['error']}"
-                except:
-                    error_detail = f"Ollama: {e}"
-
-            raise HTTPException(
-                status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=error_detail,
-            )
+        return await send_json_request(url, "/api/version", method="GET")
 
 
 class ModelNameForm(BaseModel):
@@ -264,67 +554,15 @@ async def pull_model(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    r = None
-
-    def get_request():
-        nonlocal url
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    yield json.dumps({"id": request_id, "done": False}) + "\n"
-
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/api/pull",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    request_id = str(uuid.uuid4())
+    return await send_streaming_request(
+        url,
+        "/api/pull",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        request_id=request_id,
+        prefix=json.dumps({"id": request_id, "done": False}) + "\n",
+        on_done=app.state.MODEL_REGISTRY.invalidate,
+    )
 
 
 class PushModelForm(BaseModel):
@@ -352,50 +590,9 @@ async def push_model(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.debug(f"url: {url}")
 
-    r = None
-
-    def get_request():
-        nonlocal url
-        nonlocal r
-        try:
-
-            def stream_content():
-                for chunk in r.iter_content(chunk_size=8192):
-                    yield chunk
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/api/push",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-            )
-
-            r.raise_for_status()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    return await send_streaming_request(
+        url, "/api/push", form_data.model_dump_json(exclude_none=True).encode()
+    )
 
 
 class CreateModelForm(BaseModel):
@@ -414,53 +611,12 @@ async def create_model(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    r = None
-
-    def get_request():
-        nonlocal url
-        nonlocal r
-        try:
-
-            def stream_content():
-                for chunk in r.iter_content(chunk_size=8192):
-                    yield chunk
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/api/create",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            log.debug(f"r: {r}")
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    return await send_streaming_request(
+        url,
+        "/api/create",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        on_done=app.state.MODEL_REGISTRY.invalidate,
+    )
 
 
 class CopyModelForm(BaseModel):
@@ -487,32 +643,13 @@ async def copy_model(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/copy",
-            data=form_data.model_dump_json(exclude_none=True).encode(),
-        )
-        r.raise_for_status()
-
-        log.debug(f"r.text: {r.text}")
-
-        return True
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
+    r = await send_request(
+        url, "/api/copy", data=form_data.model_dump_json(exclude_none=True).encode()
+    )
+    r.release()
+    app.state.MODEL_REGISTRY.invalidate()
 
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    return True
 
 
 @app.delete("/api/delete")
@@ -534,32 +671,16 @@ async def delete_model(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    try:
-        r = requests.request(
-            method="DELETE",
-            url=f"{url}/api/delete",
-            data=form_data.model_dump_json(exclude_none=True).encode(),
-        )
-        r.raise_for_status()
-
-        log.debug(f"r.text: {r.text}")
-
-        return True
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
+    r = await send_request(
+        url,
+        "/api/delete",
+        method="DELETE",
+        data=form_data.model_dump_json(exclude_none=True).encode(),
+    )
+    r.release()
+    app.state.MODEL_REGISTRY.invalidate()
 
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    return True
 
 
 @app.post("/api/show")
@@ -570,35 +691,68 @@ async def show_model_info(form_data: ModelNameForm, user=Depends(get_current_use
             detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.name),
         )
 
-    url_idx = random.choice(app.state.MODELS[form_data.name]["urls"])
+    url_idx = select_url_idx(form_data.name, app.state.MODELS[form_data.name]["urls"])
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/show",
-            data=form_data.model_dump_json(exclude_none=True).encode(),
-        )
-        r.raise_for_status()
+    return await send_json_request(
+        url, "/api/show", data=form_data.model_dump_json(exclude_none=True).encode()
+    )
+
+
+class PrewarmModelForm(BaseModel):
+    model: str
+    nodes: int = 1
+    keep_alive: Optional[Union[int, str]] = None
 
-        return r.json()
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
 
+@app.post("/models/prewarm")
+async def prewarm_model(form_data: PrewarmModelForm, user=Depends(get_admin_user)):
+    model = form_data.model
+
+    if ":" not in model:
+        model = f"{model}:latest"
+
+    if model not in app.state.MODELS:
         raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
         )
 
+    # Warm nodes come first so only the missing replicas pay for a load,
+    # the request also extends their keep_alive.
+    url_idxs = sorted(
+        app.state.MODELS[model]["urls"],
+        key=lambda idx: not app.state.RESIDENCY.is_warm(
+            app.state.OLLAMA_BASE_URLS[idx], model
+        ),
+    )[: max(form_data.nodes, 1)]
+
+    # A generate request without a prompt only loads the model into memory
+    payload = json.dumps(
+        {
+            "model": model,
+            "stream": False,
+            **(
+                {"keep_alive": form_data.keep_alive}
+                if form_data.keep_alive is not None
+                else {}
+            ),
+        }
+    )
+
+    async def load_model(url_idx: int):
+        url = app.state.OLLAMA_BASE_URLS[url_idx]
+        try:
+            await send_json_request(url, "/api/generate", data=payload)
+            app.state.RESIDENCY.mark_loaded(url, model)
+            return {"idx": url_idx, "url": url, "status": True}
+        except HTTPException as e:
+            return {"idx": url_idx, "url": url, "status": False, "error": e.detail}
+
+    results = await asyncio.gather(*[load_model(idx) for idx in url_idxs])
+    return {"model": model, "nodes": results}
+
 
 class GenerateEmbeddingsForm(BaseModel):
     model: str
@@ -621,7 +775,7 @@ async def generate_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model, app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -631,30 +785,12 @@ async def generate_embeddings(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/embeddings",
-            data=form_data.model_dump_json(exclude_none=True).encode(),
-        )
-        r.raise_for_status()
-
-        return r.json()
-    except Exception as e:
-        log.exception(e)
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    return await send_json_request(
+        url,
+        "/api/embeddings",
+        data=form_data.model_dump_json(exclude_none=True).encode(),
+        model=form_data.model,
+    )
 
 
 def generate_ollama_embeddings(
@@ -671,7 +807,7 @@ def generate_ollama_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model, app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -688,6 +824,7 @@ def generate_ollama_embeddings(
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
+        mark_loaded(url, form_data.model)
 
         data = r.json()
 
@@ -740,7 +877,7 @@ async def generate_completion(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model, app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -750,66 +887,20 @@ async def generate_completion(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    r = None
-
-    def get_request():
-        nonlocal form_data
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    if form_data.stream:
-                        yield json.dumps({"id": request_id, "done": False}) + "\n"
-
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/api/generate",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    request_id = str(uuid.uuid4())
+    return await send_streaming_request(
+        url,
+        "/api/generate",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        request_id=request_id,
+        track=True,
+        model=form_data.model,
+        prefix=(
+            json.dumps({"id": request_id, "done": False}) + "\n"
+            if form_data.stream
+            else None
+        ),
+    )
 
 
 class ChatMessage(BaseModel):
@@ -843,7 +934,7 @@ async def generate_chat_completion(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model, app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -853,76 +944,23 @@ async def generate_chat_completion(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    r = None
-
-    log.debug(
-        "form_data.model_dump_json(exclude_none=True).encode(): {0} ".format(
-            form_data.model_dump_json(exclude_none=True).encode()
-        )
+    log.info(f"ACTUAL PAYLOAD: {form_data.model_dump_json(exclude_none=True)}")
+
+    request_id = str(uuid.uuid4())
+    return await send_streaming_request(
+        url,
+        "/api/chat",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        request_id=request_id,
+        track=True,
+        model=form_data.model,
+        prefix=(
+            json.dumps({"id": request_id, "done": False}) + "\n"
+            if form_data.stream
+            else None
+        ),
     )
 
-    def get_request():
-        nonlocal form_data
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    if form_data.stream:
-                        yield json.dumps({"id": request_id, "done": False}) + "\n"
-
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-
-            log.info(f'ACTUAL PAYLOAD: {form_data.model_dump_json(exclude_none=True)}')
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/api/chat",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            log.exception(e)
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
-
 
 # TODO: we should update this part once Ollama supports other types
 class OpenAIChatMessage(BaseModel):
@@ -954,7 +992,7 @@ async def generate_openai_chat_completion(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(model, app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -964,70 +1002,22 @@ async def generate_openai_chat_completion(
     url = app.state.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    r = None
-
-    def get_request():
-        nonlocal form_data
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    if form_data.stream:
-                        yield json.dumps(
-                            {"request_id": request_id, "done": False}
-                        ) + "\n"
-
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-            
-            log.info(f'TOOLS PAYLOAD: {form_data.model_dump_json(exclude_none=True)}')
-
-            r = requests.request(
-                method="POST",
-                url=f"{url}/v1/chat/completions",
-                data=form_data.model_dump_json(exclude_none=True).encode(),
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    log.info(f"TOOLS PAYLOAD: {form_data.model_dump_json(exclude_none=True)}")
+
+    request_id = str(uuid.uuid4())
+    return await send_streaming_request(
+        url,
+        "/v1/chat/completions",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        request_id=request_id,
+        track=True,
+        model=form_data.model,
+        prefix=(
+            json.dumps({"request_id": request_id, "done": False}) + "\n"
+            if form_data.stream
+            else None
+        ),
+    )
 
 
 class UrlForm(BaseModel):
@@ -1148,12 +1138,18 @@ def upload_model(file: UploadFile = File(...), url_idx: Optional[int] = None):
         url_idx = 0
     ollama_url = app.state.OLLAMA_BASE_URLS[url_idx]
 
-    file_path = f"{UPLOAD_DIR}/{file.filename}"
+    file_path = f"{UPLOAD_DIR}/{os.path.basename(file.filename)}"
 
-    # Save file in chunks
-    with open(file_path, "wb+") as f:
-        for chunk in file.file:
-            f.write(chunk)
+    # Save file in chunks, hashed as it is written
+    try:
+        upload = save_upload(
+            file.file, file_path, max_size=MODEL_FILE_MAX_SIZE * 1024 * 1024
+        )
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=ERROR_MESSAGES.FILE_TOO_LARGE(f"{MODEL_FILE_MAX_SIZE} MB"),
+        )
 
     def file_process_stream():
         nonlocal ollama_url
@@ -1181,8 +1177,7 @@ def upload_model(file: UploadFile = File(...), url_idx: Optional[int] = None):
                     yield f"data: {json.dumps(res)}\n\n"
 
                 if done:
-                    f.seek(0)
-                    hashed = calculate_sha256(f)
+                    hashed = upload.sha256
                     f.seek(0)
 
                     url = f"{ollama_url}/api/blobs/sha256:{hashed}"
@@ -1247,7 +1242,6 @@ def upload_model(file: UploadFile = File(...), url_idx: Optional[int] = None):
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def deprecated_proxy(path: str, request: Request, user=Depends(get_current_user)):
     url = app.state.OLLAMA_BASE_URLS[0]
-    target_url = f"{url}/{path}"
 
     body = await request.body()
     headers = dict(request.headers)
@@ -1270,71 +1264,24 @@ async def deprecated_proxy(path: str, request: Request, user=Depends(get_current
     headers.pop("origin", None)
     headers.pop("referer", None)
 
-    r = None
-
-    def get_request():
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    if path == "generate":
-                        data = json.loads(body.decode("utf-8"))
-
-                        if not ("stream" in data and data["stream"] == False):
-                            yield json.dumps({"id": request_id, "done": False}) + "\n"
-
-                    elif path == "chat":
-                        yield json.dumps({"id": request_id, "done": False}) + "\n"
-
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-
-            r = requests.request(
-                method=request.method,
-                url=target_url,
-                data=body,
-                headers=headers,
-                stream=True,
-            )
-
-            r.raise_for_status()
-
-            # r.close()
-
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
-
-    try:
-        return await run_in_threadpool(get_request)
-    except Exception as e:
-        error_detail = "Open WebUI: Server Connection Error"
-        if r is not None:
-            try:
-                res = r.json()
-                if "error" in res:
-                    error_detail = f"Ollama: {res['error']}"
-            except:
-                error_detail = f"Ollama: {e}"
-
-        raise HTTPException(
-            status_code=r.status_code if r else status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=error_detail,
-        )
+    request_id = str(uuid.uuid4())
+    prefix = None
+    if path == "generate":
+        data = json.loads(body.decode("utf-8"))
+
+        if not ("stream" in data and data["stream"] == False):
+            prefix = json.dumps({"id": request_id, "done": False}) + "\n"
+
+    elif path == "chat":
+        prefix = json.dumps({"id": request_id, "done": False}) + "\n"
+
+    return await send_streaming_request(
+        url,
+        f"/{path}",
+        body,
+        method=request.method,
+        headers=headers,
+        request_id=request_id,
+        prefix=prefix,
+        track=path in ["generate", "chat"],
+    )
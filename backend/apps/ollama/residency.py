@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["OLLAMA"])
+
+
+class ModelResidency:
+    """
+    Tracks which models each Ollama backend currently holds in memory, as
+    reported by its /api/ps endpoint.
+    """
+
+    def __init__(self):
+        # url -> model -> running model info from /api/ps
+        self._resident: Dict[str, Dict[str, dict]] = {}
+        self._updated_at: Dict[str, float] = {}
+
+    def update(self, url: str, models: List[dict]):
+        self._resident[url] = {model["model"]: model for model in models}
+        self._updated_at[url] = time.time()
+
+    def clear(self, url: str):
+        self._resident.pop(url, None)
+        self._updated_at.pop(url, None)
+
+    def mark_loaded(self, url: str, model: str):
+        # The backend just answered a request for the model, so treat it as
+        # warm until the next poll says otherwise.
+        self._resident.setdefault(url, {}).setdefault(model, {"model": model})
+
+    def is_warm(self, url: str, model: str) -> bool:
+        return model in self._resident.get(url, {})
+
+    def get_status(self, urls: List[str]) -> List[dict]:
+        return [
+            {
+                "idx": idx,
+                "url": url,
+                "models": list(self._resident.get(url, {}).values()),
+                "updated_at": self._updated_at.get(url),
+            }
+            for idx, url in enumerate(urls)
+        ]
+
+    async def refresh(
+        self,
+        urls: List[str],
+        fetch: Callable[[str, str], Awaitable[Optional[dict]]],
+    ):
+        responses = await asyncio.gather(*[fetch(url, "/api/ps") for url in urls])
+        for url, response in zip(urls, responses):
+            if response is not None and "models" in response:
+                self.update(url, response["models"] or [])
+            else:
+                self.clear(url)
+
+    async def run(
+        self,
+        get_urls: Callable[[], List[str]],
+        fetch: Callable[[str, str], Awaitable[Optional[dict]]],
+        interval: float,
+    ):
+        log.info(f"model residency monitor started, polling every {interval}s")
+        while True:
+            try:
+                await self.refresh(get_urls(), fetch)
+            except Exception as e:
+                log.exception(e)
+            await asyncio.sleep(interval)
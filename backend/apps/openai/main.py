@@ -26,7 +26,18 @@ from config import (
     CACHE_DIR,
     ENABLE_MODEL_FILTER,
     MODEL_FILTER_LIST,
+    MODEL_REGISTRY_TTL,
+    MODEL_REGISTRY_REFRESH_INTERVAL,
+    MODEL_REGISTRY_MAX_BACKOFF,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_TIMEOUT,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES,
 )
+from utils.http_client import HTTPClientPool
+from utils.model_registry import ModelRegistry
+from utils.health import HealthChecker
 from typing import List, Optional
 
 
@@ -53,11 +64,13 @@ app.state.OPENAI_API_KEYS = OPENAI_API_KEYS
 
 app.state.MODELS = {}
 
+app.state.HTTP_CLIENTS = HTTPClientPool()
+
 
 @app.middleware("http")
 async def check_url(request: Request, call_next):
     if len(app.state.MODELS) == 0:
-        await get_all_models()
+        await app.state.MODEL_REGISTRY.get()
     else:
         pass
 
@@ -80,8 +93,8 @@ async def get_openai_urls(user=Depends(get_admin_user)):
 
 @app.post("/urls/update")
 async def update_openai_urls(form_data: UrlsUpdateForm, user=Depends(get_admin_user)):
-    await get_all_models()
     app.state.OPENAI_API_BASE_URLS = form_data.urls
+    app.state.MODEL_REGISTRY.invalidate(reset_backoff=True)
     return {"OPENAI_API_BASE_URLS": app.state.OPENAI_API_BASE_URLS}
 
 
@@ -93,6 +106,7 @@ async def get_openai_keys(user=Depends(get_admin_user)):
 @app.post("/keys/update")
 async def update_openai_key(form_data: KeysUpdateForm, user=Depends(get_admin_user)):
     app.state.OPENAI_API_KEYS = form_data.keys
+    app.state.MODEL_REGISTRY.invalidate(reset_backoff=True)
     return {"OPENAI_API_KEYS": app.state.OPENAI_API_KEYS}
 
 
@@ -158,18 +172,50 @@ async def speech(request: Request, user=Depends(get_verified_user)):
         raise HTTPException(status_code=401, detail=ERROR_MESSAGES.OPENAI_NOT_FOUND)
 
 
-async def fetch_url(url, key):
+async def fetch_url(url, path, key):
     try:
         headers = {"Authorization": f"Bearer {key}"}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        session = app.state.HTTP_CLIENTS.get_session(url)
+        async with session.get(f"{url}{path}", headers=headers) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
         return None
 
 
+async def probe_url(idx, url) -> bool:
+    headers = {"Authorization": f"Bearer {app.state.OPENAI_API_KEYS[idx]}"}
+    session = app.state.HTTP_CLIENTS.get_session(url)
+    async with session.get(
+        f"{url}/models",
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=HEALTH_CHECK_TIMEOUT),
+    ) as response:
+        # An authentication error still means the upstream is reachable
+        return response.status < 500
+
+
+app.state.HEALTH = HealthChecker(
+    "openai",
+    get_urls=lambda: app.state.OPENAI_API_BASE_URLS,
+    probe=probe_url,
+    failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    half_open_successes=CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES,
+)
+
+
+async def start_health_checks():
+    if HEALTH_CHECK_INTERVAL > 0:
+        await app.state.HEALTH.run(HEALTH_CHECK_INTERVAL)
+
+
+@app.get("/health")
+async def get_backends_health(user=Depends(get_admin_user)):
+    return {"backends": app.state.HEALTH.get_status(app.state.OPENAI_API_BASE_URLS)}
+
+
 def merge_models_lists(model_lists):
     log.info(f"merge_models_lists {model_lists}")
     merged_list = []
@@ -188,39 +234,60 @@ def merge_models_lists(model_lists):
     return merged_list
 
 
-async def get_all_models():
+async def fetch_models(idx, url):
+    if app.state.OPENAI_API_KEYS[idx] == "":
+        return None
+    return await fetch_url(url, "/models", app.state.OPENAI_API_KEYS[idx])
+
+
+def merge_models_responses(responses):
+    log.info(f"get_all_models:responses() {responses}")
+
+    models = {
+        "data": merge_models_lists(
+            list(
+                map(
+                    lambda response: (
+                        response["data"]
+                        if (response and "data" in response)
+                        else (response if isinstance(response, list) else None)
+                    ),
+                    responses,
+                )
+            )
+        )
+    }
+
+    log.info(f"models: {models}")
+    return models
+
+
+def update_models(models: dict):
+    app.state.MODELS = {model["id"]: model for model in models["data"]}
+
+
+app.state.MODEL_REGISTRY = ModelRegistry(
+    "openai",
+    get_urls=lambda: app.state.OPENAI_API_BASE_URLS,
+    fetch=fetch_models,
+    merge=merge_models_responses,
+    on_update=update_models,
+    ttl=MODEL_REGISTRY_TTL,
+    max_backoff=MODEL_REGISTRY_MAX_BACKOFF,
+)
+
+
+async def get_all_models(force: bool = False):
     log.info("get_all_models()")
 
     if len(app.state.OPENAI_API_KEYS) == 1 and app.state.OPENAI_API_KEYS[0] == "":
-        models = {"data": []}
-    else:
-        tasks = [
-            fetch_url(f"{url}/models", app.state.OPENAI_API_KEYS[idx])
-            for idx, url in enumerate(app.state.OPENAI_API_BASE_URLS)
-        ]
-
-        responses = await asyncio.gather(*tasks)
-        log.info(f"get_all_models:responses() {responses}")
-
-        models = {
-            "data": merge_models_lists(
-                list(
-                    map(
-                        lambda response: (
-                            response["data"]
-                            if (response and "data" in response)
-                            else (response if isinstance(response, list) else None)
-                        ),
-                        responses,
-                    )
-                )
-            )
-        }
+        return {"data": []}
 
-        log.info(f"models: {models}")
-        app.state.MODELS = {model["id"]: model for model in models["data"]}
+    return await app.state.MODEL_REGISTRY.get(force=force)
 
-        return models
+
+async def start_model_registry():
+    await app.state.MODEL_REGISTRY.run(MODEL_REGISTRY_REFRESH_INTERVAL)
 
 
 @app.get("/models")
@@ -311,6 +378,11 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
     if key == "":
         raise HTTPException(status_code=401, detail=ERROR_MESSAGES.API_KEY_NOT_FOUND)
 
+    if not app.state.HEALTH.is_available(url):
+        raise HTTPException(
+            status_code=503, detail=ERROR_MESSAGES.BACKEND_UNAVAILABLE(url)
+        )
+
     headers = {}
     headers["Authorization"] = f"Bearer {key}"
     headers["Content-Type"] = "application/json"
@@ -326,6 +398,11 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
             stream=True,
         )
 
+        if r.status_code >= 500:
+            app.state.HEALTH.record_failure(url, f"HTTP {r.status_code}")
+        else:
+            app.state.HEALTH.record_success(url)
+
         r.raise_for_status()
 
         # Check if response is SSE
@@ -348,6 +425,8 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
                     error_detail = f"External: {res['error']['message'] if 'message' in res['error'] else res['error']}"
             except:
                 error_detail = f"External: {e}"
+        else:
+            app.state.HEALTH.record_failure(url, str(e))
 
         raise HTTPException(
             status_code=r.status_code if r else 500, detail=error_detail
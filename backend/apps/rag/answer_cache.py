@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import SRC_LOG_LEVELS
+from utils.misc import cosine_similarity
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+def get_docs_scope(docs: List[dict]) -> Tuple[List[str], str]:
+    """Collection names referenced by `docs` and a digest of the docs themselves."""
+    collection_names = set()
+    digest = hashlib.sha256()
+
+    for doc in docs:
+        if doc.get("type") == "collection":
+            collection_names.update(doc.get("collection_names", []))
+        elif doc.get("type") == "text":
+            digest.update(doc.get("content", "").encode("utf-8"))
+        elif "collection_name" in doc:
+            collection_names.add(doc["collection_name"])
+
+    collection_names = sorted(collection_names)
+    digest.update(json.dumps(collection_names).encode("utf-8"))
+    return collection_names, digest.hexdigest()
+
+
+class CachedAnswer:
+    def __init__(
+        self,
+        embedding: List[float],
+        content: str,
+        collection_names: List[str],
+        citations: Optional[list] = None,
+    ):
+        self.embedding = embedding
+        self.content = content
+        self.collection_names = collection_names
+        self.citations = citations
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """
+    Completions of RAG questions, looked up by similarity of the question
+    embedding among the answers given for the same docs, model and RAG
+    template (the scope).
+    """
+
+    def __init__(
+        self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # scope -> cached answers, scopes ordered least recently used first
+        self._scopes: "OrderedDict[str, List[CachedAnswer]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_scope(self, docs: List[dict], model: str, template: str) -> str:
+        _, docs_digest = get_docs_scope(docs)
+        return hashlib.sha256(
+            f"{docs_digest}:{model}:{template}".encode("utf-8")
+        ).hexdigest()
+
+    def _expire(self, now: float):
+        for scope in list(self._scopes):
+            answers = [
+                answer
+                for answer in self._scopes[scope]
+                if now - answer.created_at < self.ttl
+            ]
+            if answers:
+                self._scopes[scope] = answers
+            else:
+                del self._scopes[scope]
+
+    def lookup(self, scope: str, embedding: List[float]) -> Optional[CachedAnswer]:
+        with self._lock:
+            now = time.time()
+            best, best_score = None, self.threshold
+            for answer in self._scopes.get(scope, []):
+                if now - answer.created_at >= self.ttl:
+                    continue
+                score = cosine_similarity(embedding, answer.embedding)
+                if score >= best_score:
+                    best, best_score = answer, score
+
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._scopes.move_to_end(scope)
+            return best
+
+    def store(self, scope: str, answer: CachedAnswer):
+        with self._lock:
+            self._scopes.setdefault(scope, []).append(answer)
+            self._scopes.move_to_end(scope)
+
+            if len(self) > self.max_entries:
+                self._expire(time.time())
+            while len(self) > self.max_entries:
+                self._scopes.popitem(last=False)
+
+    def invalidate_collection(self, collection_name: str):
+        """Drops the answers grounded on a collection, e.g. after it changed."""
+        with self._lock:
+            for scope in list(self._scopes):
+                answers = [
+                    answer
+                    for answer in self._scopes[scope]
+                    if collection_name not in answer.collection_names
+                ]
+                self.invalidations += len(self._scopes[scope]) - len(answers)
+                if answers:
+                    self._scopes[scope] = answers
+                else:
+                    del self._scopes[scope]
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def __len__(self):
+        return sum(len(answers) for answers in self._scopes.values())
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self),
+                "scopes": len(self._scopes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+def get_answer_content(body: bytes, content_type: str) -> Optional[str]:
+    """Extracts the completion text from a proxied Ollama or OpenAI response."""
+    try:
+        text = body.decode("utf-8")
+
+        if "text/event-stream" in content_type:
+            content = ""
+            for line in text.split("\n"):
+                line = line.strip()
+                if not line.startswith("data:") or line == "data: [DONE]":
+                    continue
+                data = json.loads(line[len("data:") :])
+                if "choices" in data and data["choices"]:
+                    content += data["choices"][0].get("delta", {}).get("content") or ""
+            return content or None
+
+        if "application/x-ndjson" in content_type:
+            content = ""
+            for line in text.split("\n"):
+                if line.strip():
+                    data = json.loads(line)
+                    if "error" in data:
+                        return None
+                    content += data.get("message", {}).get("content", "")
+            return content or None
+
+        data = json.loads(text)
+        if "choices" in data:
+            return data["choices"][0]["message"]["content"]
+        return data.get("message", {}).get("content")
+    except Exception as e:
+        log.debug(f"Could not extract the answer to cache: {e}")
+        return None
+
+
+def get_cached_answer_chunks(
+    content: str, model: str, openai: bool, stream: bool
+) -> Tuple[List[bytes], str]:
+    """
+    Renders a cached answer the way the Ollama or OpenAI proxy would have
+    streamed it, returns the body chunks and the media type.
+    """
+    created = int(time.time())
+
+    if openai:
+        id = f"chatcmpl-{uuid.uuid4()}"
+        if not stream:
+            completion = {
+                "id": id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            return [json.dumps(completion).encode("utf-8")], "application/json"
+
+        def sse(delta: dict, finish_reason: Optional[str]) -> bytes:
+            chunk = {
+                "id": id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+        return [
+            sse({"role": "assistant", "content": content}, None),
+            sse({}, "stop"),
+            b"data: [DONE]\n\n",
+        ], "text/event-stream"
+
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(created))
+    message = {
+        "model": model,
+        "created_at": created_at,
+        "message": {"role": "assistant", "content": content},
+        "done": not stream,
+    }
+    if not stream:
+        return [json.dumps(message).encode("utf-8")], "application/json"
+
+    done = {
+        "model": model,
+        "created_at": created_at,
+        "message": {"role": "assistant", "content": ""},
+        "done_reason": "stop",
+        "done": True,
+    }
+    return [
+        f"{json.dumps(message)}\n".encode("utf-8"),
+        f"{json.dumps(done)}\n".encode("utf-8"),
+    ], "application/x-ndjson"
@@ -0,0 +1,287 @@
+import math
+import os
+import pickle
+import re
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import SRC_LOG_LEVELS, CACHE_DIR, RAG_BM25_MAX_CACHED_CHUNKS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index that can be updated in place, so adding
+    or removing chunks never re-tokenizes the rest of the collection.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        # term -> chunk id -> term frequency
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Tuple[str, dict]] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        self.remove([id for id in ids if id in self.documents])
+
+        for id, text, metadata in zip(ids, texts, metadatas):
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, {})[id] = tf
+
+            self.lengths[id] = len(tokens)
+            self.total_length += len(tokens)
+            self.documents[id] = (text, metadata or {})
+
+    def remove(self, ids: List[str]):
+        for id in ids:
+            if id not in self.documents:
+                continue
+
+            text, _ = self.documents.pop(id)
+            for term in set(tokenize(text)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(id, None)
+                    if not postings:
+                        del self.postings[term]
+
+            self.total_length -= self.lengths.pop(id)
+
+    def snapshot(self, query: str) -> "BM25Snapshot":
+        return BM25Snapshot(self, query)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        return self.snapshot(query).search(k)
+
+
+class BM25Snapshot:
+    """
+    The statistics of an index needed to score one query, copied so that
+    scoring runs while the index is being updated.
+    """
+
+    def __init__(self, index: BM25Index, query: str):
+        self.k1 = index.k1
+        self.b = index.b
+        self.n = len(index.documents)
+        self.avg_length = index.total_length / self.n if self.n else 0.0
+
+        # (chunk id, term frequency, chunk length) per query term
+        self.terms: List[List[Tuple[str, int, int]]] = []
+        for term in set(tokenize(query)):
+            postings = index.postings.get(term)
+            if postings:
+                self.terms.append(
+                    [(id, tf, index.lengths[id]) for id, tf in postings.items()]
+                )
+
+    def search(self, k: int) -> List[Tuple[str, float]]:
+        if self.n == 0:
+            return []
+
+        scores: Dict[str, float] = {}
+        for postings in self.terms:
+            df = len(postings)
+            idf = math.log((self.n - df + 0.5) / (df + 0.5) + 1)
+            for id, tf, length in postings:
+                norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+                score = idf * tf * (self.k1 + 1) / (tf + norm)
+                scores[id] = scores.get(id, 0.0) + score
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class BM25IndexStore:
+    """
+    One persisted BM25Index per collection under `path`. Indexes are loaded
+    lazily on first use and evicted least-recently-used once the loaded
+    indexes hold more than `max_chunks` chunks.
+
+    Updates are kept in memory until `flush`, called once an ingest is done;
+    an index with unsaved updates is never evicted. An index lost before it
+    was flushed is rebuilt from its collection, as it no longer matches it.
+    """
+
+    def __init__(self, path: str, max_chunks: int = 50000):
+        self.path = path
+        self.max_chunks = max_chunks
+
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+        # Collections whose index changed since it was saved
+        self._dirty = set()
+        # Guards the loaded indexes, each index is guarded by a lock of its
+        # own so that collections are searched and updated independently
+        self._lock = threading.Lock()
+        self._locks: Dict[str, threading.RLock] = {}
+
+        os.makedirs(self.path, exist_ok=True)
+
+    def _get_path(self, collection_name: str) -> str:
+        return os.path.join(self.path, f"{collection_name}.pkl")
+
+    def _save(self, collection_name: str, index: BM25Index):
+        path = self._get_path(collection_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _load(self, collection_name: str) -> Optional[BM25Index]:
+        try:
+            with open(self._get_path(collection_name), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error(f"Error loading BM25 index of {collection_name}: {e}")
+            return None
+
+    def _get_lock(self, collection_name: str) -> threading.RLock:
+        with self._lock:
+            return self._locks.setdefault(collection_name, threading.RLock())
+
+    def _get(self, collection_name: str) -> Optional[BM25Index]:
+        with self._lock:
+            index = self._indexes.get(collection_name)
+        if index is None:
+            index = self._load(collection_name)
+        return index
+
+    def _put(self, collection_name: str, index: BM25Index, dirty: bool = False):
+        with self._lock:
+            self._indexes[collection_name] = index
+            self._indexes.move_to_end(collection_name)
+            if dirty:
+                self._dirty.add(collection_name)
+            else:
+                self._dirty.discard(collection_name)
+
+            total = sum(len(index) for index in self._indexes.values())
+            for name in list(self._indexes):
+                if total <= self.max_chunks:
+                    break
+                if name == collection_name or name in self._dirty:
+                    continue
+                total -= len(self._indexes.pop(name))
+                log.debug(f"Evicted BM25 index of {name}")
+
+    def get(self, collection) -> BM25Index:
+        """
+        Returns the index of a Chroma collection, rebuilding it from the
+        collection when it is missing or out of sync with it.
+        """
+        with self._get_lock(collection.name):
+            index = self._get(collection.name)
+            if index is None or len(index) != collection.count():
+                log.info(f"Building BM25 index of {collection.name}")
+                index = self.build(collection)
+                self._save(collection.name, index)
+                self._put(collection.name, index)
+            else:
+                with self._lock:
+                    dirty = collection.name in self._dirty
+                self._put(collection.name, index, dirty=dirty)
+            return index
+
+    def search(
+        self, collection, query: str, k: int
+    ) -> List[Tuple[str, str, dict, float]]:
+        """Returns the (chunk id, text, metadata, score) of the best k chunks."""
+        lock = self._get_lock(collection.name)
+        with lock:
+            index = self.get(collection)
+            snapshot = index.snapshot(query)
+
+        results = snapshot.search(k)
+
+        with lock:
+            # Chunks removed while scoring are left out
+            return [
+                (id, *index.documents[id], score)
+                for id, score in results
+                if id in index.documents
+            ]
+
+    def build(self, collection) -> BM25Index:
+        documents = collection.get(include=["documents", "metadatas"])
+        index = BM25Index()
+        index.add(documents["ids"], documents["documents"], documents["metadatas"])
+        return index
+
+    def add(self, collection_name: str, ids, texts, metadatas):
+        with self._get_lock(collection_name):
+            index = self._get(collection_name)
+            if index is None:
+                index = BM25Index()
+
+            index.add(ids, texts, metadatas)
+            self._put(collection_name, index, dirty=True)
+
+    def remove(self, collection_name: str, ids):
+        with self._get_lock(collection_name):
+            index = self._get(collection_name)
+            if index is not None:
+                index.remove(ids)
+                self._put(collection_name, index, dirty=True)
+
+    def flush(self, collection_name: str):
+        """Saves the updates of the index of a collection, if any."""
+        with self._get_lock(collection_name):
+            with self._lock:
+                index = self._indexes.get(collection_name)
+                if collection_name not in self._dirty or index is None:
+                    return
+
+            self._save(collection_name, index)
+            self._put(collection_name, index)
+
+    def delete(self, collection_name: str):
+        with self._get_lock(collection_name):
+            with self._lock:
+                self._indexes.pop(collection_name, None)
+                self._dirty.discard(collection_name)
+            try:
+                os.remove(self._get_path(collection_name))
+            except FileNotFoundError:
+                pass
+
+    def rename(self, collection_name: str, new_name: str):
+        """Moves the index of a collection to another name, replacing its index."""
+        self.flush(collection_name)
+        with self._get_lock(collection_name), self._get_lock(new_name):
+            with self._lock:
+                self._indexes.pop(collection_name, None)
+                self._indexes.pop(new_name, None)
+                self._dirty.discard(new_name)
+            try:
+                os.replace(self._get_path(collection_name), self._get_path(new_name))
+            except FileNotFoundError:
+                # Built from the collection when it is next searched
+                self.delete(new_name)
+
+    def reset(self):
+        with self._lock:
+            self._indexes.clear()
+            self._dirty.clear()
+            for filename in os.listdir(self.path):
+                if filename.endswith(".pkl"):
+                    os.remove(os.path.join(self.path, filename))
+
+
+BM25_INDEXES = BM25IndexStore(f"{CACHE_DIR}/bm25", RAG_BM25_MAX_CACHED_CHUNKS)
@@ -0,0 +1,216 @@
+import re
+import threading
+import weakref
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Separator between the content of consecutive documents of a chunk
+PAGE_SEPARATOR = "\n"
+
+# Value types a chunk's metadata can hold in the vector store
+METADATA_TYPES = (str, int, float, bool)
+
+# Text splitters, measuring CHUNK_SIZE and CHUNK_OVERLAP in characters or in
+# tokens of the embedding model
+CHARACTER = "character"
+TOKEN = "token"
+TEXT_SPLITTERS = [CHARACTER, TOKEN]
+
+# Words, numbers and punctuation marks, as counted by approximate_token_count
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+# Pieces counted by a tokenizer are mostly words, which repeat a lot
+TOKEN_COUNT_CACHE_SIZE = 10000
+
+
+def approximate_token_count(text: str) -> int:
+    """
+    Token count close to that of common subword tokenizers, without loading
+    one: about 4 characters per token for ASCII words and numbers, 2 for
+    other scripts (Arabic, CJK, ...) and one per punctuation mark.
+    """
+    count = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        count += -(-len(word) // (4 if word.isascii() else 2))
+    return count
+
+
+# Token counters of the local models, dropped along with a replaced model
+_token_counters = weakref.WeakKeyDictionary()
+
+
+def get_token_counter(
+    embedding_engine: str, model: Any = None
+) -> Tuple[Callable[[str], int], Optional[int]]:
+    """
+    Returns a token counter for the embedding model, and the most tokens the
+    model embeds if known. A local SentenceTransformer counts with the
+    tokenizer it already loaded, Ollama and OpenAI models fall back to
+    approximate_token_count.
+    """
+    tokenizer = getattr(model, "tokenizer", None) if embedding_engine == "" else None
+    if tokenizer is None:
+        return approximate_token_count, None
+
+    if model not in _token_counters:
+        _token_counters[model] = create_token_counter(model, tokenizer)
+    return _token_counters[model]
+
+
+def create_token_counter(
+    model: Any, tokenizer: Any
+) -> Tuple[Callable[[str], int], Optional[int]]:
+    # Fast tokenizers raise when used from several threads at once
+    lock = threading.Lock()
+
+    @lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+    def count_tokens(text: str) -> int:
+        with lock:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+
+    max_length = getattr(model, "max_seq_length", None)
+    if max_length:
+        # Room for the special tokens added around every text
+        max_length -= len(tokenizer.encode("", add_special_tokens=True))
+    return count_tokens, max_length
+
+
+def get_metadata(document: Document, file_path: Optional[str] = None) -> dict:
+    metadata = {
+        key: value
+        for key, value in document.metadata.items()
+        if isinstance(value, METADATA_TYPES)
+    }
+    if "source" not in metadata and file_path is not None:
+        metadata["source"] = str(file_path)
+    return metadata
+
+
+class Piece:
+    __slots__ = ("text", "length", "metadata", "start_index")
+
+    def __init__(self, text: str, length: int, metadata: dict, start_index: int):
+        self.text = text
+        self.length = length
+        self.metadata = metadata
+        self.start_index = start_index
+
+
+def make_chunk(pieces: Iterable[Piece]) -> Optional[Document]:
+    pieces = list(pieces)
+    content = "".join(piece.text for piece in pieces)
+    stripped = content.lstrip()
+    if not stripped.strip():
+        return None
+
+    # The first piece holding content, not the whitespace before it
+    skipped = len(content) - len(stripped)
+    first = pieces[0]
+    for piece in pieces:
+        if skipped < len(piece.text):
+            first = piece
+            break
+        skipped -= len(piece.text)
+
+    metadata = {**first.metadata, "start_index": first.start_index + skipped}
+    last_page = pieces[-1].metadata.get("page")
+    if "page" in metadata and last_page != metadata["page"]:
+        metadata["page_end"] = last_page
+    return Document(page_content=stripped.rstrip(), metadata=metadata)
+
+
+class Window:
+    """Pieces of the chunk being built, packed up to `chunk_size`."""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.pieces = deque()
+        self.length = 0
+
+    def add(self, piece: Piece) -> Optional[Document]:
+        """Adds `piece`, returns the chunk completed to make room for it."""
+        chunk = None
+        if self.pieces and self.length + piece.length > self.chunk_size:
+            chunk = make_chunk(self.pieces)
+
+            # Carry the tail of the chunk over as the start of the next
+            while self.pieces and (
+                self.length > self.chunk_overlap
+                or self.length + piece.length > self.chunk_size
+            ):
+                self.length -= self.pieces.popleft().length
+
+        self.pieces.append(piece)
+        self.length += piece.length
+        return chunk
+
+    def flush(self) -> Optional[Document]:
+        chunk = make_chunk(self.pieces) if self.pieces else None
+        self.pieces.clear()
+        self.length = 0
+        return chunk
+
+
+def iter_chunks(
+    documents: Iterable[Document],
+    chunk_size: int,
+    chunk_overlap: int,
+    length_function: Callable[[str], int] = len,
+    file_path: Optional[str] = None,
+) -> Iterator[Document]:
+    """
+    Chunks `documents` (pages, table extracts, ...) as they are loaded.
+
+    Each document is cut into small pieces on paragraph, line and word
+    boundaries, and pieces are packed into chunks of up to `chunk_size`,
+    overlapping by up to `chunk_overlap`, including across documents: a
+    sentence running over a page break ends up in one chunk. Only the pieces
+    of the chunks being built are held in memory.
+
+    Chunks keep the metadata of the document they start in, with the
+    `start_index` in that document and, for a chunk running over several
+    pages, the last one as `page_end`. Documents with a `type`, like the
+    tables of a PDF, are chunked on their own, and the text around them
+    flows on as if they were not there.
+    """
+    piece_size = max(1, min(chunk_overlap, chunk_size // 4) or chunk_size // 4)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=piece_size,
+        chunk_overlap=0,
+        length_function=length_function,
+        keep_separator=True,
+        strip_whitespace=False,
+    )
+
+    text_window = Window(chunk_size, chunk_overlap)
+
+    for document in documents:
+        metadata = get_metadata(document, file_path)
+        is_text = metadata.get("type") is None
+        window = text_window if is_text else Window(chunk_size, chunk_overlap)
+
+        pieces = []
+        if window.pieces:
+            pieces.append(
+                Piece(PAGE_SEPARATOR, length_function(PAGE_SEPARATOR), metadata, 0)
+            )
+
+        start_index = 0
+        for text in splitter.split_text(document.page_content):
+            pieces.append(Piece(text, length_function(text), metadata, start_index))
+            start_index += len(text)
+
+        chunks = [window.add(piece) for piece in pieces]
+        if not is_text:
+            chunks.append(window.flush())
+        yield from (chunk for chunk in chunks if chunk is not None)
+
+    chunk = text_window.flush()
+    if chunk is not None:
+        yield chunk
@@ -0,0 +1,374 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    SRC_LOG_LEVELS,
+    CACHE_DIR,
+    RAG_DEDUP_MAX_DISTANCE,
+    RAG_DEDUP_DROP_BOILERPLATE,
+    RAG_DEDUP_BOILERPLATE_COLLECTIONS,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+# A 64 bit SimHash is cut into 4 bands of 16 bits, two hashes at most 3 bits
+# apart always have an equal band
+BANDS = 4
+BAND_BITS = 64 // BANDS
+MAX_DISTANCE = BANDS - 1
+
+SHINGLE_SIZE = 3
+
+# Bit i of every shingle hash is counted in a 24 bit field of one big integer,
+# so a shingle is added to the 64 counters at once
+FIELD_BITS = 24
+_SPREAD = [
+    [
+        sum(((value >> bit) & 1) << (FIELD_BITS * (8 * byte + bit)) for bit in range(8))
+        for value in range(256)
+    ]
+    for byte in range(8)
+]
+
+# Rows of other collections looked at per chunk, boilerplate matches many
+MAX_CANDIDATES = 200
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_simhash(text: str) -> int:
+    """64 bit SimHash of the lowercased word 3-shingles of `text`."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return 0
+
+    shingles = [
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    ]
+
+    counts = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for byte, value in enumerate(digest):
+            counts += _SPREAD[byte][value]
+
+    simhash = 0
+    half = len(shingles) / 2
+    mask = (1 << FIELD_BITS) - 1
+    for bit in range(64):
+        if (counts >> (FIELD_BITS * bit)) & mask > half:
+            simhash |= 1 << bit
+    return simhash
+
+
+def get_bands(simhash: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(simhash >> (BAND_BITS * band)) & mask for band in range(BANDS)]
+
+
+def get_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class Fingerprint:
+    __slots__ = ("text_hash", "simhash")
+
+    def __init__(self, text: str):
+        self.text_hash = get_text_hash(text)
+        self.simhash = get_simhash(text)
+
+
+class Match:
+    """A stored chunk with the text of a new one, whose embedding is reused."""
+
+    __slots__ = ("collection_name", "chunk_id")
+
+    def __init__(self, collection_name: str, chunk_id: str):
+        self.collection_name = collection_name
+        self.chunk_id = chunk_id
+
+
+class ChunkDeduplicator:
+    """
+    Deduplication state of one collection being stored, fed its chunks in
+    order.
+
+    - An exact duplicate of an earlier chunk of the collection is dropped.
+    - An exact duplicate of a chunk of another collection is kept with its
+      embedding.
+    - Near duplicates are only counted: their wording differs, so they are
+      embedded like any other chunk.
+    - With `drop_boilerplate`, a chunk found, exactly or nearly, in
+      `boilerplate_collections` other collections (headers, footers,
+      signature blocks) is dropped.
+    """
+
+    def __init__(
+        self, store: "ChunkFingerprintStore", namespace: str, collection_name: str
+    ):
+        self.store = store
+        self.namespace = namespace
+        self.collection_name = collection_name
+
+        self._hashes = set()
+        # band -> band value -> (simhash, chunk id) of the chunks kept so far
+        self._bands: List[Dict[int, List[Tuple[int, str]]]] = [
+            defaultdict(list) for _ in range(BANDS)
+        ]
+
+        self.exact = 0
+        self.near = 0
+        self.boilerplate = 0
+        self.reused = 0
+
+    def _has_near_duplicate(self, simhash: int) -> bool:
+        for band, value in enumerate(get_bands(simhash)):
+            for other, _ in self._bands[band].get(value, []):
+                if get_distance(simhash, other) <= self.store.max_distance:
+                    return True
+        return False
+
+    def check(
+        self, fingerprint: Fingerprint, chunk_id: str
+    ) -> Tuple[bool, Optional[Match]]:
+        """Whether to keep the chunk, and the stored chunk to reuse if any."""
+        if fingerprint.text_hash in self._hashes:
+            self.exact += 1
+            return False, None
+
+        match, collections = self.store.find(
+            self.namespace, fingerprint, exclude_collection=self.collection_name
+        )
+        if (
+            self.store.drop_boilerplate
+            and collections >= self.store.boilerplate_collections
+        ):
+            self.boilerplate += 1
+            return False, None
+
+        if (match is None and collections) or self._has_near_duplicate(
+            fingerprint.simhash
+        ):
+            self.near += 1
+
+        self.register(fingerprint, chunk_id)
+        if match is not None:
+            self.reused += 1
+        return True, match
+
+    def register(self, fingerprint: Fingerprint, chunk_id: str):
+        """Records a chunk of the collection, kept or already stored."""
+        self._hashes.add(fingerprint.text_hash)
+        for band, value in enumerate(get_bands(fingerprint.simhash)):
+            self._bands[band][value].append((fingerprint.simhash, chunk_id))
+
+    def add(self, ids: List[str], fingerprints: List[Fingerprint]):
+        self.store.add(self.namespace, self.collection_name, ids, fingerprints)
+
+    def get_stats(self) -> dict:
+        return {
+            "exact": self.exact,
+            "near": self.near,
+            "boilerplate": self.boilerplate,
+            "reused": self.reused,
+        }
+
+
+class ChunkFingerprintStore:
+    """
+    SHA-256 and SimHash of every stored chunk, per embedding model namespace
+    and collection, persisted in sqlite to find duplicates across
+    collections: the same boilerplate in many documents, or another version
+    of an edited document.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_distance: int = 3,
+        drop_boilerplate: bool = False,
+        boilerplate_collections: int = 5,
+    ):
+        self.path = path
+        self.max_distance = min(max_distance, MAX_DISTANCE)
+        self.drop_boilerplate = drop_boilerplate
+        self.boilerplate_collections = boilerplate_collections
+
+        self._lock = threading.Lock()
+        self.totals = {"exact": 0, "near": 0, "boilerplate": 0, "reused": 0}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (namespace TEXT, "
+            "collection_name TEXT, chunk_id TEXT, text_hash TEXT, simhash TEXT, "
+            + ", ".join(f"band{band} INTEGER" for band in range(BANDS))
+            + ")"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS fingerprints_collection "
+            "ON fingerprints (collection_name)"
+        )
+        for band in range(BANDS):
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS fingerprints_band{band} "
+                f"ON fingerprints (band{band})"
+            )
+        self._db.commit()
+
+    def deduplicator(self, namespace: str, collection_name: str) -> ChunkDeduplicator:
+        return ChunkDeduplicator(self, namespace, collection_name)
+
+    def find(
+        self,
+        namespace: str,
+        fingerprint: Fingerprint,
+        exclude_collection: Optional[str] = None,
+    ) -> Tuple[Optional[Match], int]:
+        """
+        Returns a chunk with the text of `fingerprint` stored by another
+        collection, and the number of collections holding a duplicate of it,
+        exact or near.
+        """
+        bands = get_bands(fingerprint.simhash)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT collection_name, chunk_id, text_hash, simhash "
+                "FROM fingerprints WHERE ("
+                + " OR ".join(f"band{band} = ?" for band in range(BANDS))
+                + ") AND namespace = ? AND collection_name != ? LIMIT ?",
+                [*bands, namespace, exclude_collection or "", MAX_CANDIDATES],
+            ).fetchall()
+
+        match = None
+        collections = set()
+        for collection_name, chunk_id, text_hash, simhash in rows:
+            if text_hash == fingerprint.text_hash:
+                if match is None:
+                    match = Match(collection_name, chunk_id)
+            elif (
+                get_distance(fingerprint.simhash, int(simhash, 16)) > self.max_distance
+            ):
+                continue
+            collections.add(collection_name)
+        return match, len(collections)
+
+    def add(
+        self,
+        namespace: str,
+        collection_name: str,
+        ids: List[str],
+        fingerprints: List[Fingerprint],
+    ):
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?" + ", ?" * BANDS + ")",
+                [
+                    (
+                        namespace,
+                        collection_name,
+                        id,
+                        fingerprint.text_hash,
+                        f"{fingerprint.simhash:016x}",
+                        *get_bands(fingerprint.simhash),
+                    )
+                    for id, fingerprint in zip(ids, fingerprints)
+                ],
+            )
+            self._db.commit()
+
+    def remove(self, collection_name: str, ids: List[str]):
+        with self._lock:
+            # sqlite caps the number of bound parameters of a statement
+            for i in range(0, len(ids), 500):
+                batch = ids[i : i + 500]
+                self._db.execute(
+                    "DELETE FROM fingerprints WHERE collection_name = ? "
+                    f"AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [collection_name, *batch],
+                )
+            self._db.commit()
+
+    def record(self, deduplicator: ChunkDeduplicator):
+        """Adds the counts of a finished ingest to the totals."""
+        with self._lock:
+            for key, value in deduplicator.get_stats().items():
+                self.totals[key] += value
+
+    def delete(self, collection_name: str):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM fingerprints WHERE collection_name = ?",
+                (collection_name,),
+            )
+            self._db.commit()
+
+    def rename(self, collection_name: str, new_name: str):
+        """Moves the fingerprints of a collection to another name."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM fingerprints WHERE collection_name = ?", (new_name,)
+            )
+            self._db.execute(
+                "UPDATE fingerprints SET collection_name = ? "
+                "WHERE collection_name = ?",
+                (new_name, collection_name),
+            )
+            self._db.commit()
+
+    def reset(self):
+        with self._lock:
+            self._db.execute("DELETE FROM fingerprints")
+            self._db.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            chunks = self._db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+            return {"chunks": chunks, "duplicates": dict(self.totals)}
+
+
+def get_reused_embeddings(client, matches: Dict[int, Match]) -> Dict[int, List[float]]:
+    """
+    Fetches the embeddings of the matched chunks from their collections,
+    keyed like `matches`. Chunks deleted since, or not stored yet, are left
+    out to be embedded.
+    """
+    by_collection = defaultdict(list)
+    for position, match in matches.items():
+        by_collection[match.collection_name].append((position, match.chunk_id))
+
+    embeddings = {}
+    for collection_name, positions in by_collection.items():
+        try:
+            collection = client.get_collection(name=collection_name)
+            result = collection.get(
+                ids=[chunk_id for _, chunk_id in positions], include=["embeddings"]
+            )
+        except Exception as e:
+            log.debug(f"Not reusing embeddings of {collection_name}: {e}")
+            continue
+
+        found = dict(zip(result["ids"], result["embeddings"]))
+        for position, chunk_id in positions:
+            if chunk_id in found:
+                embeddings[position] = list(found[chunk_id])
+    return embeddings
+
+
+CHUNK_FINGERPRINTS = ChunkFingerprintStore(
+    f"{CACHE_DIR}/dedup/fingerprints.db",
+    max_distance=RAG_DEDUP_MAX_DISTANCE,
+    drop_boilerplate=RAG_DEDUP_DROP_BOILERPLATE,
+    boilerplate_collections=RAG_DEDUP_BOILERPLATE_COLLECTIONS,
+)
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two tier embedding cache keyed by (engine, model, sha256(text)): an
+    in-process LRU in front of a sqlite store shared by every worker.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (namespace TEXT, hash TEXT, "
+            "embedding BLOB, PRIMARY KEY (namespace, hash))"
+        )
+        self._db.commit()
+
+    def get_many(self, namespace: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        missing = []
+
+        with self._lock:
+            for hash in hashes:
+                embedding = self._memory.get(f"{namespace}:{hash}")
+                if embedding is not None:
+                    self._memory.move_to_end(f"{namespace}:{hash}")
+                    found[hash] = embedding
+                    self.memory_hits += 1
+                else:
+                    missing.append(hash)
+
+            # sqlite caps the number of bound parameters of a statement
+            for i in range(0, len(missing), 500):
+                batch = missing[i : i + 500]
+                rows = self._db.execute(
+                    "SELECT hash, embedding FROM embeddings WHERE namespace = ? "
+                    f"AND hash IN ({','.join('?' * len(batch))})",
+                    [namespace, *batch],
+                ).fetchall()
+
+                for hash, blob in rows:
+                    embedding = array("f", blob).tolist()
+                    found[hash] = embedding
+                    self._remember(f"{namespace}:{hash}", embedding)
+                    self.disk_hits += 1
+
+            self.misses += len(hashes) - len(found)
+
+        return found
+
+    def set_many(self, namespace: str, embeddings: Dict[str, List[float]]):
+        with self._lock:
+            for hash, embedding in embeddings.items():
+                self._remember(f"{namespace}:{hash}", embedding)
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, hash, embedding) "
+                "VALUES (?, ?, ?)",
+                [
+                    (namespace, hash, array("f", embedding).tobytes())
+                    for hash, embedding in embeddings.items()
+                ],
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, keep_namespace: Optional[str] = None):
+        """Drops every entry, except those of `keep_namespace` if given."""
+        with self._lock:
+            if keep_namespace is None:
+                self._memory.clear()
+                self._db.execute("DELETE FROM embeddings")
+            else:
+                prefix = f"{keep_namespace}:"
+                self._memory = OrderedDict(
+                    (key, embedding)
+                    for key, embedding in self._memory.items()
+                    if key.startswith(prefix)
+                )
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE namespace != ?", (keep_namespace,)
+                )
+            self._db.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (
+                    (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+                ),
+            }
+
+
+def get_cached_embedding_function(
+    func: Callable, cache: EmbeddingCache, namespace: str
+) -> Callable:
+    """Wraps an embedding function to only embed the texts missing from `cache`."""
+
+    def cached(query, progress: Optional[Callable[[int, int], None]] = None):
+        texts = query if isinstance(query, list) else [query]
+        hashes = [get_text_hash(text) for text in texts]
+
+        found = cache.get_many(namespace, list(set(hashes)))
+
+        missing = {}
+        for text, hash in zip(texts, hashes):
+            if hash not in found:
+                missing[hash] = text
+
+        if missing:
+            hits = len(texts) - len(missing)
+            embeddings = func(
+                list(missing.values()),
+                progress=(
+                    (lambda done, total: progress(hits + done, len(texts)))
+                    if progress
+                    else None
+                ),
+            )
+            new = dict(zip(missing.keys(), embeddings))
+            cache.set_many(
+                namespace,
+                {hash: embedding for hash, embedding in new.items() if embedding},
+            )
+            found.update(new)
+        elif progress:
+            progress(len(texts), len(texts))
+
+        embeddings = [found[hash] for hash in hashes]
+        return embeddings if isinstance(query, list) else embeddings[0]
+
+    return cached
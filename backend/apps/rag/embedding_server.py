@@ -0,0 +1,201 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+# Lanes in priority order, queued interactive texts are always batched first
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = [INTERACTIVE, BULK]
+
+
+class LaneStats:
+    def __init__(self):
+        self.requests = 0
+        self.texts = 0
+        self.queued = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # Share of the encoding time spent on this lane's texts
+        self.encode_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "queued": self.queued,
+            "average_latency": self.total_latency / self.texts if self.texts else 0.0,
+            "max_latency": self.max_latency,
+            "texts_per_second": (
+                self.texts / self.encode_seconds if self.encode_seconds else 0.0
+            ),
+        }
+
+
+class EmbeddingServer:
+    """
+    In-process embedding server in front of the local SentenceTransformer.
+
+    - Texts of concurrent callers are coalesced into one `encode` batch: the
+      dispatcher waits up to `max_wait` seconds after the first queued text
+      for more, up to `max_batch_size` texts.
+    - Texts are queued per lane, interactive queries are batched before bulk
+      ingestion still waiting, so an ingest never delays a chat by more than
+      the batch being encoded.
+    - With `processes` > 1 batches are encoded by a multi-process pool of the
+      model, using every CPU core.
+    """
+
+    def __init__(
+        self,
+        model: Any = None,
+        max_batch_size: int = 64,
+        max_wait: float = 0.01,
+        processes: int = 0,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.processes = processes
+
+        self.model = None
+        self._pool = None
+        self._model_lock = threading.Lock()
+
+        # (lane priority, sequence, text, future, lane, queued at)
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._worker: Optional[threading.Thread] = None
+
+        self._stats_lock = threading.Lock()
+        self.lanes: Dict[str, LaneStats] = {lane: LaneStats() for lane in LANES}
+        self.batches = 0
+        self.batched_texts = 0
+
+        self.set_model(model)
+
+    def set_model(self, model: Any):
+        with self._model_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+            self.model = model
+            if model is not None and self.processes > 1:
+                log.info(f"Starting {self.processes} embedding processes")
+                self._pool = model.start_multi_process_pool(
+                    target_devices=["cpu"] * self.processes
+                )
+
+    def close(self):
+        self.set_model(None)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name="rag-embedding-server", daemon=True
+            )
+            self._worker.start()
+
+    def _next_batch(self) -> list:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        # Drain whatever is already queued into the batch without waiting
+        while len(items) < self.max_batch_size:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        with self._model_lock:
+            if self._pool is not None:
+                embeddings = self.model.encode_multi_process(
+                    texts, self._pool, batch_size=self.max_batch_size
+                )
+            else:
+                embeddings = self.model.encode(texts, batch_size=self.max_batch_size)
+        return embeddings.tolist()
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+
+            started_at = time.monotonic()
+            try:
+                embeddings = self._encode([text for _, _, text, _, _, _ in items])
+            except Exception as e:
+                log.exception(f"Error embedding a batch of {len(items)} texts")
+                for _, _, _, future, lane, _ in items:
+                    with self._stats_lock:
+                        self.lanes[lane].queued -= 1
+                    future.set_exception(e)
+                continue
+
+            done_at = time.monotonic()
+            share = (done_at - started_at) / len(items)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.batched_texts += len(items)
+                for _, _, _, _, lane, queued_at in items:
+                    stats = self.lanes[lane]
+                    latency = done_at - queued_at
+                    stats.queued -= 1
+                    stats.texts += 1
+                    stats.total_latency += latency
+                    stats.max_latency = max(stats.max_latency, latency)
+                    stats.encode_seconds += share
+
+            for (_, _, _, future, _, _), embedding in zip(items, embeddings):
+                future.set_result(embedding)
+
+    def embed(self, texts: List[str], lane: str = INTERACTIVE) -> List[List[float]]:
+        if self.model is None:
+            raise ValueError("No local embedding model is loaded")
+
+        self._ensure_worker()
+
+        priority = LANES.index(lane)
+        queued_at = time.monotonic()
+        with self._stats_lock:
+            self.lanes[lane].requests += 1
+            self.lanes[lane].queued += len(texts)
+
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put(
+                (priority, next(self._sequence), text, future, lane, queued_at)
+            )
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "processes": self.processes if self._pool is not None else 0,
+                "batches": self.batches,
+                "average_batch_size": (
+                    self.batched_texts / self.batches if self.batches else 0.0
+                ),
+                "lanes": {lane: stats.to_dict() for lane, stats in self.lanes.items()},
+            }
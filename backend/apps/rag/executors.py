@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from config import (
+    SRC_LOG_LEVELS,
+    RAG_EMBEDDING_WORKERS,
+    RAG_RERANKING_WORKERS,
+    RAG_REQUEST_WORKERS,
+    RAG_RETRIEVAL_CONCURRENCY,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class MonitoredExecutor:
+    """
+    Bounded thread pool that keeps track of its queue depth, so a saturated
+    stage of the RAG pipeline shows up in the metrics instead of as a
+    stalled event loop.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        # Set in the worker threads, calls made from them run inline
+        self._local = threading.local()
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        submitted_at = time.monotonic()
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += time.monotonic() - submitted_at
+
+            self._local.active = True
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                self._local.active = False
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+            return result
+
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if future.cancelled():
+            # Never started, so it is still counted as queued
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Runs `fn` on the pool and blocks until it returns."""
+        if getattr(self._local, "active", False):
+            # Waiting on our own pool from one of its workers could deadlock
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def arun(self, fn: Callable, *args, **kwargs):
+        """Runs `fn` on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Returns `fn` with every call routed through the pool."""
+
+        def wrapped(*args, **kwargs):
+            return self.run(fn, *args, **kwargs)
+
+        return wrapped
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "max_queued": self.max_queued,
+                "average_wait": self.total_wait / started if started else 0.0,
+            }
+
+
+# Shared by every request, each stage is bounded on its own so a burst of
+# reranking cannot starve query embedding and vice versa
+EMBEDDING_EXECUTOR = MonitoredExecutor("rag-embedding", RAG_EMBEDDING_WORKERS)
+RERANKING_EXECUTOR = MonitoredExecutor("rag-reranking", RAG_RERANKING_WORKERS)
+# Concurrent Chroma queries, so concurrent chats cannot flood Chroma
+RETRIEVAL_EXECUTOR = MonitoredExecutor("rag-retrieval", RAG_RETRIEVAL_CONCURRENCY)
+# Whole RAG requests, which wait on the stages above: sharing a pool with
+# them could leave every worker waiting on work queued behind it
+REQUEST_EXECUTOR = MonitoredExecutor("rag-request", RAG_REQUEST_WORKERS)
+
+
+def get_executor_stats() -> dict:
+    return {
+        "embedding": EMBEDDING_EXECUTOR.get_stats(),
+        "reranking": RERANKING_EXECUTOR.get_stats(),
+        "retrieval": RETRIEVAL_EXECUTOR.get_stats(),
+        "request": REQUEST_EXECUTOR.get_stats(),
+    }
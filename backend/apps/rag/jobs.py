@@ -0,0 +1,419 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestionJob(BaseModel):
+    id: str
+    type: str
+    user_id: Optional[str] = None
+    status: str
+    payload: dict
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    attempts: int
+    stage: Optional[str] = None
+    progress: float = 0.0
+    # stage -> seconds spent in it by the last attempt
+    timings: Dict[str, float] = {}
+
+    created_at: float
+    updated_at: float
+    run_after: float = 0.0
+
+
+class JobContext:
+    """Handed to a job handler to report its stage and progress."""
+
+    def __init__(self, queue: "IngestionJobQueue", job: IngestionJob):
+        self.queue = queue
+        self.job = job
+        # Time spent in nested stages, excluded from the enclosing one
+        self._nested: List[float] = []
+
+    @property
+    def payload(self) -> dict:
+        return self.job.payload
+
+    def _add_timing(self, name: str, started_at: float):
+        elapsed = time.monotonic() - started_at
+        nested = self._nested.pop()
+        if self._nested:
+            self._nested[-1] += elapsed
+
+        self.job.timings[name] = round(
+            self.job.timings.get(name, 0.0) + elapsed - nested, 3
+        )
+
+    @contextmanager
+    def stage(self, name: str):
+        self.job.stage = name
+        self.job.progress = 0.0
+        self.queue._update(self.job)
+
+        started_at = time.monotonic()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            self._add_timing(name, started_at)
+            self.queue._update(self.job)
+
+    def timed(self, name: str, iterable: Iterable) -> Iterator:
+        """
+        Yields from `iterable`, adding the time spent producing its items to
+        the timings of `name`, for stages streamed into one another.
+        """
+        iterator = iter(iterable)
+        while True:
+            started_at = time.monotonic()
+            self._nested.append(0.0)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._add_timing(name, started_at)
+            yield item
+
+    def set_progress(self, done: int, total: Optional[int]):
+        """Progress of the current stage, ignored when the total is unknown."""
+        if total is None:
+            return
+        self.job.progress = done / total if total else 1.0
+        self.queue._update(self.job)
+
+
+class IngestionJobQueue:
+    """
+    Document ingestion jobs persisted in sqlite and run by background worker
+    threads, so uploads return as soon as the file is stored and jobs survive
+    a restart.
+
+    Handlers are registered per job type. A handler raising is retried with
+    exponential backoff up to `max_retries` times, except for a ValueError
+    (bad input, empty content) which fails the job right away.
+
+    Several processes (uvicorn workers) may share the database: a job is
+    claimed with a conditional update, so only one of them runs it, and is
+    leased for `lease` seconds, renewed while it runs. A running job whose
+    lease expired, its process having died, is queued again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        workers: int = 2,
+        max_retries: int = 2,
+        backoff: float = 5,
+        lease: float = 60,
+        poll_interval: float = 5,
+    ):
+        self.path = path
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.lease = lease
+        # Jobs submitted by other processes are not notified, only polled
+        self.poll_interval = poll_interval
+
+        self.handlers: Dict[str, Callable[[JobContext], Optional[dict]]] = {}
+
+        # Identifies the jobs leased by this queue among processes
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, type TEXT, "
+            "user_id TEXT, status TEXT, run_after REAL, created_at REAL, "
+            "data TEXT, owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, type in [("owner", "TEXT"), ("lease_until", "REAL")]:
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {type}")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)"
+        )
+        self._db.commit()
+
+    def register(self, type: str, handler: Callable[[JobContext], Optional[dict]]):
+        self.handlers[type] = handler
+
+    def _save(self, job: IngestionJob) -> bool:
+        """
+        Saves a job claimed by this queue, False if its lease was lost to
+        another process meanwhile.
+        """
+        job.updated_at = time.time()
+        cursor = self._db.execute(
+            "UPDATE jobs SET status = ?, run_after = ?, data = ? "
+            "WHERE id = ? AND owner = ?",
+            (job.status, job.run_after, job.model_dump_json(), job.id, self.owner),
+        )
+        self._db.commit()
+        if cursor.rowcount == 0:
+            log.warning(f"Ingestion job {job.id} is no longer leased by {self.owner}")
+            return False
+        return True
+
+    def _update(self, job: IngestionJob):
+        with self._lock:
+            self._save(job)
+
+    def submit(self, type: str, payload: dict, user_id: Optional[str] = None) -> str:
+        if type not in self.handlers:
+            raise ValueError(f"Unknown ingestion job type: {type}")
+
+        now = time.time()
+        job = IngestionJob(
+            id=str(uuid.uuid4()),
+            type=type,
+            user_id=user_id,
+            status=JobStatus.QUEUED,
+            payload=payload,
+            attempts=0,
+            created_at=now,
+            updated_at=now,
+        )
+
+        with self._wakeup:
+            self._db.execute(
+                "INSERT INTO jobs "
+                "(id, type, user_id, status, run_after, created_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.type,
+                    job.user_id,
+                    job.status,
+                    job.run_after,
+                    job.created_at,
+                    job.model_dump_json(),
+                ),
+            )
+            self._db.commit()
+            self._wakeup.notify()
+        return job.id
+
+    def get(self, id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM jobs WHERE id = ?", (id,)
+            ).fetchone()
+        return IngestionJob.model_validate_json(row[0]) if row else None
+
+    def get_jobs(
+        self, user_id: Optional[str] = None, limit: int = 50
+    ) -> List[IngestionJob]:
+        with self._lock:
+            if user_id is None:
+                rows = self._db.execute(
+                    "SELECT data FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT data FROM jobs WHERE user_id = ? "
+                    "ORDER BY created_at DESC LIMIT ?",
+                    (user_id, limit),
+                ).fetchall()
+        return [IngestionJob.model_validate_json(row[0]) for row in rows]
+
+    def get_pending_payloads(self, type: str) -> List[dict]:
+        """Payloads of the queued and running jobs of `type`."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM jobs WHERE type = ? AND status IN (?, ?)",
+                (type, JobStatus.QUEUED, JobStatus.RUNNING),
+            ).fetchall()
+        return [IngestionJob.model_validate_json(row[0]).payload for row in rows]
+
+    def has_pending(self, type: str) -> bool:
+        """Whether a job of `type` is queued or running."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM jobs WHERE type = ? AND status IN (?, ?) LIMIT 1",
+                (type, JobStatus.QUEUED, JobStatus.RUNNING),
+            ).fetchone()
+        return row is not None
+
+    def _claim_due(self, now: float) -> Optional[IngestionJob]:
+        """Leases the oldest due job, unless another process took it first."""
+        row = self._db.execute(
+            "SELECT id FROM jobs WHERE status = ? AND run_after <= ? "
+            "ORDER BY created_at LIMIT 1",
+            (JobStatus.QUEUED, now),
+        ).fetchone()
+        if row is None:
+            return None
+
+        cursor = self._db.execute(
+            "UPDATE jobs SET status = ?, owner = ?, lease_until = ? "
+            "WHERE id = ? AND status = ?",
+            (JobStatus.RUNNING, self.owner, now + self.lease, row[0], JobStatus.QUEUED),
+        )
+        self._db.commit()
+        if cursor.rowcount == 0:
+            # Claimed by another process, the caller looks again
+            return None
+
+        (data,) = self._db.execute(
+            "SELECT data FROM jobs WHERE id = ?", (row[0],)
+        ).fetchone()
+        job = IngestionJob.model_validate_json(data)
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.timings = {}
+        self._save(job)
+        return job
+
+    def _claim(self) -> Optional[IngestionJob]:
+        """Takes the oldest due job, or waits until one might be due."""
+        with self._wakeup:
+            while not self._stopping:
+                now = time.time()
+                job = self._claim_due(now)
+                if job is not None:
+                    return job
+
+                if self._db.execute(
+                    "SELECT 1 FROM jobs WHERE status = ? AND run_after <= ? LIMIT 1",
+                    (JobStatus.QUEUED, now),
+                ).fetchone():
+                    # Lost the race for a job, there are more
+                    continue
+
+                # Retries become due without a notification
+                next_run = self._db.execute(
+                    "SELECT MIN(run_after) FROM jobs WHERE status = ?",
+                    (JobStatus.QUEUED,),
+                ).fetchone()[0]
+                timeout = self.poll_interval
+                if next_run:
+                    timeout = min(max(next_run - now, 0.1), timeout)
+                self._wakeup.wait(timeout=timeout)
+        return None
+
+    def _requeue_expired(self):
+        """Queues again the running jobs of processes that stopped renewing them."""
+        jobs = []
+        rows = self._db.execute(
+            "SELECT data FROM jobs WHERE status = ? "
+            "AND (lease_until IS NULL OR lease_until < ?)",
+            (JobStatus.RUNNING, time.time()),
+        ).fetchall()
+        for (data,) in rows:
+            job = IngestionJob.model_validate_json(data)
+            job.status = JobStatus.QUEUED
+            job.updated_at = time.time()
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, "
+                "data = ? WHERE id = ? AND status = ? "
+                "AND (lease_until IS NULL OR lease_until < ?)",
+                (
+                    job.status,
+                    job.model_dump_json(),
+                    job.id,
+                    JobStatus.RUNNING,
+                    job.updated_at,
+                ),
+            )
+            if cursor.rowcount:
+                jobs.append(job.id)
+        self._db.commit()
+
+        if jobs:
+            log.info(f"Queued again ingestion jobs with an expired lease: {jobs}")
+            self._wakeup.notify_all()
+
+    def _renew_leases(self):
+        """Keeps the jobs of this queue leased, and recovers abandoned ones."""
+        with self._wakeup:
+            while not self._stopping:
+                self._db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                    (time.time() + self.lease, self.owner, JobStatus.RUNNING),
+                )
+                self._db.commit()
+                self._requeue_expired()
+                self._wakeup.wait(timeout=self.lease / 3)
+
+    def _run(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                return
+
+            context = JobContext(self, job)
+            try:
+                log.info(f"Running {job.type} ingestion job {job.id}")
+                job.result = self.handlers[job.type](context)
+                job.status = JobStatus.COMPLETED
+                job.progress = 1.0
+                job.error = None
+            except Exception as e:
+                log.exception(f"Ingestion job {job.id} failed: {e}")
+                job.error = str(e)
+
+                if isinstance(e, ValueError) or job.attempts > self.max_retries:
+                    job.status = JobStatus.FAILED
+                else:
+                    job.status = JobStatus.QUEUED
+                    job.run_after = time.time() + self.backoff * 2 ** (job.attempts - 1)
+
+            with self._wakeup:
+                self._save(job)
+                self._wakeup.notify()
+
+    def start(self):
+        with self._wakeup:
+            self._stopping = False
+            # Jobs interrupted by a restart are run again, not those other
+            # processes are still running
+            self._requeue_expired()
+
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"rag-ingestion-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(
+            target=self._renew_leases, name="rag-ingestion-leases", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._threads = []
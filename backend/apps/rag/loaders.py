@@ -0,0 +1,140 @@
+from typing import Optional
+
+from langchain_community.document_loaders import (
+    TextLoader,
+    CSVLoader,
+    BSHTMLLoader,
+    Docx2txtLoader,
+    UnstructuredEPubLoader,
+    UnstructuredMarkdownLoader,
+    UnstructuredXMLLoader,
+    UnstructuredRSTLoader,
+    UnstructuredExcelLoader,
+)
+
+from apps.rag.pdf import PDFPageLoader
+
+# Kept free of the app and config imports, so loading can run in the
+# processes of a pool without loading models or opening the vector store
+
+
+def get_loader(
+    filename: str,
+    file_content_type: str,
+    file_path: str,
+    extract_images: bool = False,
+    extract_tables: bool = True,
+    pdf_processes: int = 0,
+    pdf_cache_dir: Optional[str] = None,
+):
+    file_ext = filename.split(".")[-1].lower()
+    known_type = True
+
+    known_source_ext = [
+        "go",
+        "py",
+        "java",
+        "sh",
+        "bat",
+        "ps1",
+        "cmd",
+        "js",
+        "ts",
+        "css",
+        "cpp",
+        "hpp",
+        "h",
+        "c",
+        "cs",
+        "sql",
+        "log",
+        "ini",
+        "pl",
+        "pm",
+        "r",
+        "dart",
+        "dockerfile",
+        "env",
+        "php",
+        "hs",
+        "hsc",
+        "lua",
+        "nginxconf",
+        "conf",
+        "m",
+        "mm",
+        "plsql",
+        "perl",
+        "rb",
+        "rs",
+        "db2",
+        "scala",
+        "bash",
+        "swift",
+        "vue",
+        "svelte",
+    ]
+
+    if file_ext == "pdf":
+        loader = PDFPageLoader(
+            file_path,
+            extract_images=extract_images,
+            extract_tables=extract_tables,
+            processes=pdf_processes,
+            cache_dir=pdf_cache_dir,
+        )
+    elif file_ext == "csv":
+        loader = CSVLoader(file_path)
+    elif file_ext == "rst":
+        loader = UnstructuredRSTLoader(file_path, mode="elements")
+    elif file_ext == "xml":
+        loader = UnstructuredXMLLoader(file_path)
+    elif file_ext in ["htm", "html"]:
+        loader = BSHTMLLoader(file_path, open_encoding="unicode_escape")
+    elif file_ext == "md":
+        loader = UnstructuredMarkdownLoader(file_path)
+    elif file_content_type == "application/epub+zip":
+        loader = UnstructuredEPubLoader(file_path)
+    elif (
+        file_content_type
+        == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        or file_ext in ["doc", "docx"]
+    ):
+        loader = Docx2txtLoader(file_path)
+    elif file_content_type in [
+        "application/vnd.ms-excel",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ] or file_ext in ["xls", "xlsx"]:
+        loader = UnstructuredExcelLoader(file_path)
+    elif file_ext in known_source_ext or (
+        file_content_type and file_content_type.find("text/") >= 0
+    ):
+        loader = TextLoader(file_path, autodetect_encoding=True)
+    else:
+        loader = TextLoader(file_path, autodetect_encoding=True)
+        known_type = False
+
+    return loader, known_type
+
+
+def load_file(
+    filename: str,
+    file_content_type: str,
+    file_path: str,
+    extract_images: bool = False,
+    extract_tables: bool = True,
+    pdf_cache_dir: Optional[str] = None,
+):
+    """
+    Loads a file into documents, picklable for a process pool. Already in a
+    pool process, PDF pages are extracted in-process.
+    """
+    loader, known_type = get_loader(
+        filename,
+        file_content_type,
+        file_path,
+        extract_images=extract_images,
+        extract_tables=extract_tables,
+        pdf_cache_dir=pdf_cache_dir,
+    )
+    return loader.load(), known_type
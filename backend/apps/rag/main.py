@@ -9,6 +9,8 @@ from fastapi import (
 )
 from fastapi.middleware.cors import CORSMiddleware
 import os, shutil, logging, re
+import itertools
+import asyncio
 
 from pathlib import Path
 from typing import List
@@ -19,36 +21,23 @@ from langchain.docstore.document import Document
 
 from langchain_community.document_loaders import (
     WebBaseLoader,
-    TextLoader,
-    PyPDFLoader,
-    CSVLoader,
-    BSHTMLLoader,
-    Docx2txtLoader,
-    UnstructuredEPubLoader,
-    UnstructuredWordDocumentLoader,
-    UnstructuredMarkdownLoader,
-    UnstructuredXMLLoader,
-    UnstructuredRSTLoader,
-    UnstructuredExcelLoader,
     YoutubeLoader,
-    PDFPlumberLoader,
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-import camelot
 import validators
 import urllib.parse
 import socket
 
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import Callable, Optional, Tuple
 import mimetypes
-import uuid
 import json
 
 import sentence_transformers
 
+from apps.web.models.users import Users
 from apps.web.models.documents import (
     Documents,
     DocumentForm,
@@ -63,6 +52,33 @@ from apps.rag.utils import (
     query_collection,
     query_collection_with_hybrid_search,
 )
+from apps.rag.bm25 import BM25_INDEXES
+from apps.rag.dedup import (
+    CHUNK_FINGERPRINTS,
+    Fingerprint,
+    get_reused_embeddings,
+)
+from apps.rag.reindex import (
+    ADDED,
+    MOVED,
+    NAMESPACE_KEY,
+    ChunkDiff,
+    get_collection_metadata,
+    get_stamped_metadata,
+    get_staging_collection_name,
+    is_same_embedding,
+    is_same_namespace,
+)
+from apps.rag.embedding_cache import EmbeddingCache
+from apps.rag.answer_cache import AnswerCache
+from apps.rag.reranker import RerankingService
+from apps.rag.embedding_server import EmbeddingServer, BULK
+from apps.rag.executors import get_executor_stats
+from apps.rag.jobs import IngestionJob, IngestionJobQueue, JobContext
+from apps.rag import loaders
+from apps.rag.pdf import PDFPageCache
+from apps.rag.chunker import TEXT_SPLITTERS, TOKEN, get_token_counter, iter_chunks
+from apps.rag.scanner import ScanManifest, diff_docs_dir, get_file_hash, load_files
 
 from utils.misc import (
     calculate_sha256,
@@ -71,10 +87,13 @@ from utils.misc import (
     extract_folders_after_data_docs,
 )
 from utils.utils import get_current_user, get_admin_user
+from utils.uploads import save_upload, UploadTooLargeError
 
 from config import (
     SRC_LOG_LEVELS,
+    DATA_DIR,
     UPLOAD_DIR,
+    RAG_FILE_MAX_SIZE,
     DOCS_DIR,
     RAG_TOP_K,
     RAG_RELEVANCE_THRESHOLD,
@@ -82,17 +101,40 @@ from config import (
     RAG_EMBEDDING_MODEL,
     RAG_EMBEDDING_MODEL_AUTO_UPDATE,
     RAG_EMBEDDING_MODEL_TRUST_REMOTE_CODE,
+    CACHE_DIR,
+    ENABLE_RAG_EMBEDDING_CACHE,
+    RAG_EMBEDDING_CACHE_SIZE,
+    RAG_EMBEDDING_SERVER_BATCH_SIZE,
+    RAG_EMBEDDING_SERVER_MAX_WAIT,
+    RAG_EMBEDDING_SERVER_PROCESSES,
+    ENABLE_RAG_ANSWER_CACHE,
+    RAG_ANSWER_CACHE_THRESHOLD,
+    RAG_ANSWER_CACHE_TTL,
+    RAG_ANSWER_CACHE_MAX_ENTRIES,
     ENABLE_RAG_HYBRID_SEARCH,
+    ENABLE_RAG_DEDUP,
     RAG_RERANKING_MODEL,
     PDF_EXTRACT_IMAGES,
     RAG_RERANKING_MODEL_AUTO_UPDATE,
     RAG_RERANKING_MODEL_TRUST_REMOTE_CODE,
+    RAG_RERANKING_BATCH_SIZE,
+    RAG_RERANKING_MAX_WAIT,
+    RAG_RERANKING_CACHE_SIZE,
+    RAG_INGESTION_WORKERS,
+    RAG_INGESTION_MAX_RETRIES,
+    RAG_SCAN_PROCESSES,
+    RAG_SCAN_WATCH_INTERVAL,
+    RAG_PDF_PROCESSES,
+    RAG_PDF_EXTRACT_TABLES,
+    RAG_PDF_CACHE_MAX_FILES,
     RAG_OPENAI_API_BASE_URL,
     RAG_OPENAI_API_KEY,
     DEVICE_TYPE,
     CHROMA_CLIENT,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
+    RAG_TEXT_SPLITTER,
+    RAG_INGESTION_BATCH_SIZE,
     RAG_TEMPLATE,
     ENABLE_LOCAL_WEB_FETCH,
 )
@@ -100,7 +142,6 @@ from config import (
 from constants import ERROR_MESSAGES
 import threading
 
-lock = threading.Lock()
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["RAG"])
 
@@ -110,9 +151,11 @@ app.state.TOP_K = RAG_TOP_K
 app.state.RELEVANCE_THRESHOLD = RAG_RELEVANCE_THRESHOLD
 
 app.state.ENABLE_RAG_HYBRID_SEARCH = ENABLE_RAG_HYBRID_SEARCH
+app.state.ENABLE_RAG_DEDUP = ENABLE_RAG_DEDUP
 
 app.state.CHUNK_SIZE = CHUNK_SIZE
 app.state.CHUNK_OVERLAP = CHUNK_OVERLAP
+app.state.TEXT_SPLITTER = RAG_TEXT_SPLITTER
 
 app.state.RAG_EMBEDDING_ENGINE = RAG_EMBEDDING_ENGINE
 app.state.RAG_EMBEDDING_MODEL = RAG_EMBEDDING_MODEL
@@ -138,6 +181,8 @@ def update_embedding_model(
     else:
         app.state.sentence_transformer_ef = None
 
+    app.state.EMBEDDING_SERVER.set_model(app.state.sentence_transformer_ef)
+
 
 def update_reranking_model(
     reranking_model: str,
@@ -152,6 +197,28 @@ def update_reranking_model(
     else:
         app.state.sentence_transformer_rf = None
 
+    app.state.RERANKING_SERVICE.set_model(app.state.sentence_transformer_rf)
+    app.state.RERANKING_FUNCTION = (
+        app.state.RERANKING_SERVICE
+        if app.state.sentence_transformer_rf is not None
+        else None
+    )
+
+
+# Coalesces the local embedding calls of concurrent requests into batches,
+# queries ahead of ingestion
+app.state.EMBEDDING_SERVER = EmbeddingServer(
+    max_batch_size=RAG_EMBEDDING_SERVER_BATCH_SIZE,
+    max_wait=RAG_EMBEDDING_SERVER_MAX_WAIT,
+    processes=RAG_EMBEDDING_SERVER_PROCESSES,
+)
+
+# Batches the cross-encoder calls of concurrent requests and caches scores
+app.state.RERANKING_SERVICE = RerankingService(
+    max_batch_size=RAG_RERANKING_BATCH_SIZE,
+    max_wait=RAG_RERANKING_MAX_WAIT,
+    cache_size=RAG_RERANKING_CACHE_SIZE,
+)
 
 update_embedding_model(
     app.state.RAG_EMBEDDING_MODEL,
@@ -164,12 +231,40 @@ update_reranking_model(
 )
 
 
+app.state.EMBEDDING_CACHE = (
+    EmbeddingCache(f"{CACHE_DIR}/embeddings/cache.db", RAG_EMBEDDING_CACHE_SIZE)
+    if ENABLE_RAG_EMBEDDING_CACHE
+    else None
+)
+
+app.state.ANSWER_CACHE = (
+    AnswerCache(
+        threshold=RAG_ANSWER_CACHE_THRESHOLD,
+        ttl=RAG_ANSWER_CACHE_TTL,
+        max_entries=RAG_ANSWER_CACHE_MAX_ENTRIES,
+    )
+    if ENABLE_RAG_ANSWER_CACHE
+    else None
+)
+
+# Files of DOCS_DIR already ingested, so scans only process what changed
+app.state.SCAN_MANIFEST = ScanManifest(f"{DATA_DIR}/ingestion/scan_manifest.json")
+
+# Persistent queue of the uploads, web pages and scans being ingested,
+# started by the main app
+app.state.INGESTION_JOBS = IngestionJobQueue(
+    f"{DATA_DIR}/ingestion/jobs.db",
+    workers=RAG_INGESTION_WORKERS,
+    max_retries=RAG_INGESTION_MAX_RETRIES,
+)
+
 app.state.EMBEDDING_FUNCTION = get_embedding_function(
     app.state.RAG_EMBEDDING_ENGINE,
     app.state.RAG_EMBEDDING_MODEL,
-    app.state.sentence_transformer_ef,
+    app.state.EMBEDDING_SERVER,
     app.state.OPENAI_API_KEY,
     app.state.OPENAI_API_BASE_URL,
+    cache=app.state.EMBEDDING_CACHE,
 )
 
 origins = ["*"]
@@ -198,6 +293,7 @@ async def get_status():
         "status": True,
         "chunk_size": app.state.CHUNK_SIZE,
         "chunk_overlap": app.state.CHUNK_OVERLAP,
+        "text_splitter": app.state.TEXT_SPLITTER,
         "template": app.state.RAG_TEMPLATE,
         "embedding_engine": app.state.RAG_EMBEDDING_ENGINE,
         "embedding_model": app.state.RAG_EMBEDDING_MODEL,
@@ -228,6 +324,50 @@ class OpenAIConfigForm(BaseModel):
     key: str
 
 
+@app.get("/embedding/cache")
+async def get_embedding_cache_stats(user=Depends(get_admin_user)):
+    if app.state.EMBEDDING_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **app.state.EMBEDDING_CACHE.get_stats()}
+
+
+@app.get("/dedup/stats")
+async def get_dedup_stats(user=Depends(get_admin_user)):
+    return {"enabled": app.state.ENABLE_RAG_DEDUP, **CHUNK_FINGERPRINTS.get_stats()}
+
+
+@app.get("/reranking/stats")
+async def get_reranking_stats(user=Depends(get_admin_user)):
+    return {
+        "enabled": app.state.RERANKING_FUNCTION is not None,
+        **app.state.RERANKING_SERVICE.get_stats(),
+    }
+
+
+@app.get("/embedding/stats")
+async def get_embedding_stats(user=Depends(get_admin_user)):
+    return app.state.EMBEDDING_SERVER.get_stats()
+
+
+@app.get("/retrieval/stats")
+async def get_retrieval_stats(user=Depends(get_admin_user)):
+    return get_executor_stats()
+
+
+@app.get("/answer/cache")
+async def get_answer_cache_stats(user=Depends(get_admin_user)):
+    if app.state.ANSWER_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **app.state.ANSWER_CACHE.get_stats()}
+
+
+@app.post("/answer/cache/clear")
+async def clear_answer_cache(user=Depends(get_admin_user)):
+    if app.state.ANSWER_CACHE is not None:
+        app.state.ANSWER_CACHE.clear()
+    return {"status": True}
+
+
 class EmbeddingModelUpdateForm(BaseModel):
     openai_config: Optional[OpenAIConfigForm] = None
     embedding_engine: str
@@ -242,6 +382,9 @@ async def update_embedding_config(
         f"Updating embedding model: {app.state.RAG_EMBEDDING_MODEL} to {form_data.embedding_model}"
     )
     try:
+        previous_namespace = (
+            f"{app.state.RAG_EMBEDDING_ENGINE}:{app.state.RAG_EMBEDDING_MODEL}"
+        )
         app.state.RAG_EMBEDDING_ENGINE = form_data.embedding_engine
         app.state.RAG_EMBEDDING_MODEL = form_data.embedding_model
 
@@ -252,12 +395,26 @@ async def update_embedding_config(
 
         update_embedding_model(app.state.RAG_EMBEDDING_MODEL, True)
 
+        if app.state.EMBEDDING_CACHE:
+            # Vectors of another model are never looked up again
+            namespace = (
+                f"{app.state.RAG_EMBEDDING_ENGINE}:{app.state.RAG_EMBEDDING_MODEL}"
+            )
+            app.state.EMBEDDING_CACHE.invalidate(keep_namespace=namespace)
+
+        if app.state.ANSWER_CACHE and previous_namespace != (
+            f"{app.state.RAG_EMBEDDING_ENGINE}:{app.state.RAG_EMBEDDING_MODEL}"
+        ):
+            # Cached answers are matched on query embeddings of the old model
+            app.state.ANSWER_CACHE.clear()
+
         app.state.EMBEDDING_FUNCTION = get_embedding_function(
             app.state.RAG_EMBEDDING_ENGINE,
             app.state.RAG_EMBEDDING_MODEL,
-            app.state.sentence_transformer_ef,
+            app.state.EMBEDDING_SERVER,
             app.state.OPENAI_API_KEY,
             app.state.OPENAI_API_BASE_URL,
+            cache=app.state.EMBEDDING_CACHE,
         )
 
         return {
@@ -313,6 +470,7 @@ async def get_rag_config(user=Depends(get_admin_user)):
         "chunk": {
             "chunk_size": app.state.CHUNK_SIZE,
             "chunk_overlap": app.state.CHUNK_OVERLAP,
+            "text_splitter": app.state.TEXT_SPLITTER,
         },
     }
 
@@ -320,6 +478,7 @@ async def get_rag_config(user=Depends(get_admin_user)):
 class ChunkParamUpdateForm(BaseModel):
     chunk_size: int
     chunk_overlap: int
+    text_splitter: Optional[str] = None
 
 
 class ConfigUpdateForm(BaseModel):
@@ -333,12 +492,23 @@ async def update_rag_config(form_data: ConfigUpdateForm, user=Depends(get_admin_
     app.state.CHUNK_SIZE = form_data.chunk.chunk_size
     app.state.CHUNK_OVERLAP = form_data.chunk.chunk_overlap
 
+    if form_data.chunk.text_splitter is not None:
+        if form_data.chunk.text_splitter not in TEXT_SPLITTERS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=ERROR_MESSAGES.DEFAULT(
+                    f"Unknown text splitter {form_data.chunk.text_splitter}"
+                ),
+            )
+        app.state.TEXT_SPLITTER = form_data.chunk.text_splitter
+
     return {
         "status": True,
         "pdf_extract_images": app.state.PDF_EXTRACT_IMAGES,
         "chunk": {
             "chunk_size": app.state.CHUNK_SIZE,
             "chunk_overlap": app.state.CHUNK_OVERLAP,
+            "text_splitter": app.state.TEXT_SPLITTER,
         },
     }
 
@@ -406,7 +576,7 @@ def query_doc_handler(
                 query=form_data.query,
                 embedding_function=app.state.EMBEDDING_FUNCTION,
                 k=form_data.k if form_data.k else app.state.TOP_K,
-                reranking_function=app.state.sentence_transformer_rf,
+                reranking_function=app.state.RERANKING_FUNCTION,
                 r=form_data.r if form_data.r else app.state.RELEVANCE_THRESHOLD,
             )
         else:
@@ -444,7 +614,7 @@ def query_collection_handler(
                 query=form_data.query,
                 embedding_function=app.state.EMBEDDING_FUNCTION,
                 k=form_data.k if form_data.k else app.state.TOP_K,
-                reranking_function=app.state.sentence_transformer_rf,
+                reranking_function=app.state.RERANKING_FUNCTION,
                 r=form_data.r if form_data.r else app.state.RELEVANCE_THRESHOLD,
             )
         else:
@@ -466,18 +636,23 @@ def query_collection_handler(
 @app.post("/youtube")
 def store_youtube_video(form_data: UrlForm, user=Depends(get_current_user)):
     try:
-        loader = YoutubeLoader.from_youtube_url(form_data.url, add_video_info=False)
-        data = loader.load()
+        # Rejects URLs without a video id before queueing
+        YoutubeLoader.from_youtube_url(form_data.url, add_video_info=False)
 
         collection_name = form_data.collection_name
         if collection_name == "":
             collection_name = calculate_sha256_string(form_data.url)[:63]
 
-        store_data_in_vector_db(data, collection_name, overwrite=True)
+        job_id = app.state.INGESTION_JOBS.submit(
+            "youtube",
+            {"url": form_data.url, "collection_name": collection_name},
+            user_id=user.id,
+        )
         return {
             "status": True,
             "collection_name": collection_name,
             "filename": form_data.url,
+            "job_id": job_id,
         }
     except Exception as e:
         log.exception(e)
@@ -491,18 +666,23 @@ def store_youtube_video(form_data: UrlForm, user=Depends(get_current_user)):
 def store_web(form_data: UrlForm, user=Depends(get_current_user)):
     # "https://www.gutenberg.org/files/1727/1727-h/1727-h.htm"
     try:
-        loader = get_web_loader(form_data.url)
-        data = loader.load()
+        # Rejects invalid and private URLs before queueing
+        get_web_loader(form_data.url)
 
         collection_name = form_data.collection_name
         if collection_name == "":
             collection_name = calculate_sha256_string(form_data.url)[:63]
 
-        store_data_in_vector_db(data, collection_name, overwrite=True)
+        job_id = app.state.INGESTION_JOBS.submit(
+            "web",
+            {"url": form_data.url, "collection_name": collection_name},
+            user_id=user.id,
+        )
         return {
             "status": True,
             "collection_name": collection_name,
             "filename": form_data.url,
+            "job_id": job_id,
         }
     except Exception as e:
         log.exception(e)
@@ -542,207 +722,335 @@ def resolve_hostname(hostname):
 
     return ipv4_addresses, ipv6_addresses
 
-def split_by_commas(value):
-    return [item.strip() for item in value.split(',')]
-
-
-def extract_and_process_tables(file_path):
-    with lock:  # Ensure that only one instance of this block runs at a time
-        # Extract tables using Camelot
-        tables = camelot.read_pdf(file_path, pages='all')
-        
-        structured_data = []
-        for idx, table in enumerate(tables):
-            df = table.df
-            if len(df) > 1 and len(df.columns) > 1:
-                headers = df.iloc[0]
-                if not any(header == '' for header in headers):
-                    df = df.drop(0).reset_index(drop=True)
-                    df.columns = headers
-                    rows = df.values
-                    for row in rows:
-                        row_dict = {headers[i]: row[i] for i in range(len(headers))}
-                        structured_data.append(row_dict)
-                    structured_data.append("\n\n")
-        
-        table_texts = []
-        for entry in structured_data:
-            if isinstance(entry, dict):
-                row_text_parts = []
-                for k, v in entry.items():
-                    split_values = split_by_commas(v)
-                    for split_value in split_values:
-                        row_text_parts.append(f"{k}: {split_value}")
-                table_texts.append(' | '.join(row_text_parts))
-            else:
-                table_texts.append(entry)
-        
-        return '\n'.join(table_texts)
-
 def store_data_in_vector_db(data, collection_name, overwrite: bool = False, file_content_type = None, file_path = None) -> bool:
-    if file_content_type == 'application/pdf':
-        table_texts = extract_and_process_tables(file_path)
-        if table_texts:
-            new_document = Document(page_content=table_texts, metadata={"source": file_path, "type": "tables"})
-            data.append(new_document)
-
-    concatenated_content = "".join([doc.page_content for doc in data])
-    combined_document = Document(page_content=concatenated_content, metadata={"source": file_path})
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=app.state.CHUNK_SIZE,
-        chunk_overlap=app.state.CHUNK_OVERLAP,
-        add_start_index=True,
-    )
+    docs = split_data(data, file_content_type, file_path)
+    log.info(f"store_data_in_vector_db {collection_name}")
+    return store_docs_in_vector_db(docs, collection_name, overwrite), None
 
-    docs = text_splitter.split_documents([combined_document])
 
-    if len(docs) > 0:
-        log.info(f"store_data_in_vector_db {docs}")
-        return store_docs_in_vector_db(docs, collection_name, overwrite), None
-    else:
+def get_chunk_params() -> Tuple[int, int, Callable[[str], int]]:
+    """Chunk size, overlap and length function of the configured splitter."""
+    chunk_size = app.state.CHUNK_SIZE
+    chunk_overlap = app.state.CHUNK_OVERLAP
+    if app.state.TEXT_SPLITTER != TOKEN:
+        return chunk_size, chunk_overlap, len
+
+    count_tokens, max_length = get_token_counter(
+        app.state.RAG_EMBEDDING_ENGINE, app.state.sentence_transformer_ef
+    )
+    if max_length and chunk_size > max_length:
+        # The model would truncate the rest of the chunk
+        chunk_size = max_length
+        chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    return chunk_size, chunk_overlap, count_tokens
+
+
+def split_data(data, file_content_type=None, file_path=None):
+    """
+    Chunks the loaded documents lazily, page by page, keeping the page and
+    type (text or tables) of every chunk. Raises right away if there is no
+    content, without waiting for the chunks to be consumed.
+    """
+    chunk_size, chunk_overlap, length_function = get_chunk_params()
+    docs = iter_chunks(
+        data,
+        chunk_size,
+        chunk_overlap,
+        length_function=length_function,
+        file_path=file_path,
+    )
+
+    first = next(docs, None)
+    if first is None:
         raise ValueError(ERROR_MESSAGES.EMPTY_CONTENT)
+    return itertools.chain([first], docs)
 
 
 def store_text_in_vector_db(
     text, metadata, collection_name, overwrite: bool = False
 ) -> bool:
+    chunk_size, chunk_overlap, length_function = get_chunk_params()
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=app.state.CHUNK_SIZE,
-        chunk_overlap=app.state.CHUNK_OVERLAP,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=length_function,
         add_start_index=True,
     )
     docs = text_splitter.create_documents([text], metadatas=[metadata])
     return store_docs_in_vector_db(docs, collection_name, overwrite)
 
 
-def store_docs_in_vector_db(docs, collection_name, overwrite: bool = False) -> bool:
-    log.info(f"store_docs_in_vector_db {docs} {collection_name}")
+def is_embedded_by(collection, embedding_func) -> bool:
+    """
+    Whether the vectors of a collection come from `embedding_func`, checked
+    on its first chunk. An empty collection holds the vectors of any model.
+    """
+    stored = collection.get(limit=1, include=["embeddings", "documents"])
+    if not stored["ids"]:
+        return True
+
+    [embedding] = embedding_func([stored["documents"][0].replace("\n", " ")])
+    return is_same_embedding(stored["embeddings"][0], embedding)
+
 
-    texts = [doc.page_content for doc in docs]
-    metadatas = [doc.metadata for doc in docs]
+def get_collection_for_update(collection_name: str, namespace: str, embedding_func):
+    """
+    Returns the collection to store a new version of a document in, and the
+    metadata of its chunks by id.
 
+    A collection embedded by another model cannot hold vectors of this one:
+    the document is embedded into a staging collection instead, which
+    replaces the collection once complete, so the collection is searched as
+    it is until then.
+    """
     try:
-        if overwrite:
-            for collection in CHROMA_CLIENT.list_collections():
-                if collection_name == collection.name:
-                    log.info(f"deleting existing collection {collection_name}")
-                    CHROMA_CLIENT.delete_collection(name=collection_name)
+        collection = CHROMA_CLIENT.get_collection(name=collection_name)
+    except ValueError:
+        collection = CHROMA_CLIENT.create_collection(
+            name=collection_name, metadata=get_collection_metadata(namespace)
+        )
+        return collection, {}
+
+    if not is_same_namespace(collection.metadata, namespace):
+        if NAMESPACE_KEY not in (collection.metadata or {}) and is_embedded_by(
+            collection, embedding_func
+        ):
+            # Stored before the model was recorded, by the model in use
+            log.info(f"Recording {namespace} as the embedding model of {collection_name}")
+            collection.modify(
+                metadata=get_stamped_metadata(collection.metadata, namespace)
+            )
+        else:
+            staging_name = get_staging_collection_name(collection_name, namespace)
+            log.info(f"Embedding {collection_name} again with {namespace} into {staging_name}")
+
+            # Left over by an interrupted ingest
+            delete_collection(staging_name)
+            collection = CHROMA_CLIENT.create_collection(
+                name=staging_name, metadata=get_collection_metadata(namespace)
+            )
+            return collection, {}
+
+    existing = collection.get(include=["metadatas"])
+    return collection, dict(zip(existing["ids"], existing["metadatas"]))
 
-        collection = CHROMA_CLIENT.create_collection(name=collection_name)
 
+def swap_staging_collection(staging, collection_name: str):
+    """Replaces a collection with the staging collection it was embedded into."""
+    staging_name = staging.name
+    BM25_INDEXES.flush(staging_name)
+
+    CHROMA_CLIENT.delete_collection(name=collection_name)
+    staging.modify(name=collection_name)
+
+    BM25_INDEXES.rename(staging_name, collection_name)
+    CHUNK_FINGERPRINTS.rename(staging_name, collection_name)
+
+
+def store_docs_in_vector_db(
+    docs,
+    collection_name,
+    overwrite: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> bool:
+    """
+    Stores `docs` in the collection, streaming them a batch at a time.
+
+    With `overwrite` an existing collection is updated in place rather than
+    dropped: only chunks whose id is new are embedded and added, moved
+    chunks get their metadata updated, and the chunks left from the
+    previous content are deleted last, so readers never find the collection
+    missing or empty. A collection of another embedding model is replaced
+    once the document is embedded again in full.
+    """
+    log.info(f"store_docs_in_vector_db {collection_name}")
+
+    if progress is None:
+        progress = lambda done, total: log.info(
+            f"{collection_name}: embedded {done}/{total or '?'} chunks"
+        )
+
+    # Chunks streamed from a loader are embedded and stored a batch at a time
+    total = len(docs) if isinstance(docs, list) else None
+    docs = iter(docs)
+
+    # Name the sparse index and fingerprints are written under, the staging
+    # collection's while a collection is embedded again
+    index_name = collection_name
+
+    try:
+        namespace = f"{app.state.RAG_EMBEDDING_ENGINE}:{app.state.RAG_EMBEDDING_MODEL}"
         embedding_func = get_embedding_function(
             app.state.RAG_EMBEDDING_ENGINE,
             app.state.RAG_EMBEDDING_MODEL,
-            app.state.sentence_transformer_ef,
+            app.state.EMBEDDING_SERVER,
             app.state.OPENAI_API_KEY,
             app.state.OPENAI_API_BASE_URL,
+            cache=app.state.EMBEDDING_CACHE,
+            lane=BULK,
         )
 
-        embedding_texts = list(map(lambda x: x.replace("\n", " "), texts))
-        embeddings = embedding_func(embedding_texts)
+        if overwrite:
+            collection, previous = get_collection_for_update(
+                collection_name, namespace, embedding_func
+            )
+        else:
+            collection = CHROMA_CLIENT.create_collection(
+                name=collection_name, metadata=get_collection_metadata(namespace)
+            )
+            previous = {}
+        index_name = collection.name
+        dedup = (
+            CHUNK_FINGERPRINTS.deduplicator(namespace, index_name)
+            if app.state.ENABLE_RAG_DEDUP
+            else None
+        )
 
-        for batch in create_batches(
-            api=CHROMA_CLIENT,
-            ids=[str(uuid.uuid1()) for _ in texts],
-            metadatas=metadatas,
-            embeddings=embeddings,
-            documents=texts,
-        ):
-            collection.add(*batch)
+        diff = ChunkDiff(namespace, previous)
+        added = 0
+        updated = 0
+        unchanged = 0
+
+        stored = 0
+        while True:
+            batch_docs = list(itertools.islice(docs, RAG_INGESTION_BATCH_SIZE))
+            if not batch_docs:
+                break
+
+            consumed = len(batch_docs)
+            new_docs = []
+            moved_docs = []
+            for doc in batch_docs:
+                id, change = diff.add(doc)
+                if change == ADDED:
+                    new_docs.append((doc, id))
+                    continue
+
+                if dedup is not None:
+                    dedup.register(Fingerprint(doc.page_content), id)
+                if change == MOVED:
+                    moved_docs.append((doc, id))
+                else:
+                    unchanged += 1
+
+            if moved_docs:
+                moved_ids = [id for _, id in moved_docs]
+                moved_texts = [doc.page_content for doc, _ in moved_docs]
+                moved_metadatas = [doc.metadata for doc, _ in moved_docs]
+                collection.update(ids=moved_ids, metadatas=moved_metadatas)
+                BM25_INDEXES.remove(index_name, moved_ids)
+                BM25_INDEXES.add(index_name, moved_ids, moved_texts, moved_metadatas)
+                updated += len(moved_docs)
+
+            # Duplicates are dropped or borrow the embedding of a stored chunk
+            # with the same text
+            matches = {}
+            if dedup is not None:
+                kept = []
+                for doc, id in new_docs:
+                    fingerprint = Fingerprint(doc.page_content)
+                    keep, match = dedup.check(fingerprint, id)
+                    if keep:
+                        if match is not None:
+                            matches[len(kept)] = match
+                        kept.append((doc, id, fingerprint))
+                new_docs = [(doc, id) for doc, id, _ in kept]
+                fingerprints = [fingerprint for _, _, fingerprint in kept]
+
+            if not new_docs:
+                stored += consumed
+                continue
+
+            ids = [id for _, id in new_docs]
+            texts = [doc.page_content for doc, _ in new_docs]
+            metadatas = [doc.metadata for doc, _ in new_docs]
+
+            embeddings = get_reused_embeddings(CHROMA_CLIENT, matches)
+            missing = [i for i in range(len(texts)) if i not in embeddings]
+            if missing:
+                embedding_texts = [texts[i].replace("\n", " ") for i in missing]
+                for i, embedding in zip(
+                    missing,
+                    embedding_func(
+                        embedding_texts,
+                        progress=lambda done, _: progress(stored + done, total),
+                    ),
+                ):
+                    embeddings[i] = embedding
+            embeddings = [embeddings[i] for i in range(len(texts))]
+
+            for batch in create_batches(
+                api=CHROMA_CLIENT,
+                ids=ids,
+                metadatas=metadatas,
+                embeddings=embeddings,
+                documents=texts,
+            ):
+                collection.add(*batch)
+
+            # Keep the sparse index of hybrid search in step with the collection
+            BM25_INDEXES.add(index_name, ids, texts, metadatas)
+            if dedup is not None:
+                dedup.add(ids, fingerprints)
+            added += len(ids)
+            stored += consumed
+
+        # The previous content is dropped once the new one is complete
+        deleted = diff.get_deleted()
+        for i in range(0, len(deleted), RAG_INGESTION_BATCH_SIZE):
+            collection.delete(ids=deleted[i : i + RAG_INGESTION_BATCH_SIZE])
+        if deleted:
+            BM25_INDEXES.remove(index_name, deleted)
+            CHUNK_FINGERPRINTS.remove(index_name, deleted)
+
+        staged = index_name != collection_name
+        if staged:
+            swap_staging_collection(collection, collection_name)
+            index_name = collection_name
+
+        log.info(
+            f"{collection_name}: {added} chunks added, {updated} updated, "
+            f"{len(deleted)} deleted, {unchanged} unchanged"
+        )
+
+        if dedup is not None:
+            CHUNK_FINGERPRINTS.record(dedup)
+            log.info(f"{collection_name}: duplicate chunks {dedup.get_stats()}")
+
+        if app.state.ANSWER_CACHE and (added or updated or deleted or staged):
+            # Answers grounded on the previous content are outdated
+            app.state.ANSWER_CACHE.invalidate_collection(collection_name)
 
         return True
     except Exception as e:
         log.exception(e)
+        if index_name != collection_name:
+            # The collection stays as it was, embedded by the previous model
+            delete_collection(index_name)
+
         if e.__class__.__name__ == "UniqueConstraintError":
             return True
 
         return False
+    finally:
+        # The sparse index is persisted once per ingest, not per batch
+        BM25_INDEXES.flush(index_name)
 
 
-def get_loader(filename: str, file_content_type: str, file_path: str):
-    file_ext = filename.split(".")[-1].lower()
-    known_type = True
-
-    known_source_ext = [
-        "go",
-        "py",
-        "java",
-        "sh",
-        "bat",
-        "ps1",
-        "cmd",
-        "js",
-        "ts",
-        "css",
-        "cpp",
-        "hpp",
-        "h",
-        "c",
-        "cs",
-        "sql",
-        "log",
-        "ini",
-        "pl",
-        "pm",
-        "r",
-        "dart",
-        "dockerfile",
-        "env",
-        "php",
-        "hs",
-        "hsc",
-        "lua",
-        "nginxconf",
-        "conf",
-        "m",
-        "mm",
-        "plsql",
-        "perl",
-        "rb",
-        "rs",
-        "db2",
-        "scala",
-        "bash",
-        "swift",
-        "vue",
-        "svelte",
-    ]
-
-    if file_ext == "pdf":
-        loader = PDFPlumberLoader(file_path, extract_images=app.state.PDF_EXTRACT_IMAGES)
-    elif file_ext == "csv":
-        loader = CSVLoader(file_path)
-    elif file_ext == "rst":
-        loader = UnstructuredRSTLoader(file_path, mode="elements")
-    elif file_ext == "xml":
-        loader = UnstructuredXMLLoader(file_path)
-    elif file_ext in ["htm", "html"]:
-        loader = BSHTMLLoader(file_path, open_encoding="unicode_escape")
-    elif file_ext == "md":
-        loader = UnstructuredMarkdownLoader(file_path)
-    elif file_content_type == "application/epub+zip":
-        loader = UnstructuredEPubLoader(file_path)
-    elif (
-        file_content_type
-        == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        or file_ext in ["doc", "docx"]
-    ):
-        loader = Docx2txtLoader(file_path)
-    elif file_content_type in [
-        "application/vnd.ms-excel",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    ] or file_ext in ["xls", "xlsx"]:
-        loader = UnstructuredExcelLoader(file_path)
-    elif file_ext in known_source_ext or (
-        file_content_type and file_content_type.find("text/") >= 0
-    ):
-        loader = TextLoader(file_path, autodetect_encoding=True)
-    else:
-        loader = TextLoader(file_path, autodetect_encoding=True)
-        known_type = False
+# Pages extracted from PDFs, shared by uploads and scans
+PDF_PAGE_CACHE = PDFPageCache(f"{CACHE_DIR}/pdf")
+
 
-    return loader, known_type
+def get_loader(filename: str, file_content_type: str, file_path: str):
+    return loaders.get_loader(
+        filename,
+        file_content_type,
+        file_path,
+        extract_images=app.state.PDF_EXTRACT_IMAGES,
+        extract_tables=RAG_PDF_EXTRACT_TABLES,
+        pdf_processes=RAG_PDF_PROCESSES,
+        pdf_cache_dir=PDF_PAGE_CACHE.path,
+    )
 
 
 @app.post("/doc")
@@ -760,34 +1068,38 @@ def store_doc(
 
         file_path = f"{UPLOAD_DIR}/{filename}"
 
-        contents = file.file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-            f.close()
-
-        f = open(file_path, "rb")
+        # Hashed while it is written, no second read
+        upload = save_upload(
+            file.file, file_path, max_size=RAG_FILE_MAX_SIZE * 1024 * 1024
+        )
         if collection_name == None:
-            collection_name = calculate_sha256(f)[:63]
-        f.close()
-
-        loader, known_type = get_loader(filename, file.content_type, file_path)
-        data = loader.load()
-
-        try:
-            result = store_data_in_vector_db(data, collection_name, overwrite = True, file_content_type=file.content_type, file_path=file_path)
-
-            if result:
-                return {
-                    "status": True,
-                    "collection_name": collection_name,
-                    "filename": filename,
-                    "known_type": known_type,
-                }
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=e,
-            )
+            collection_name = upload.sha256[:63]
+
+        _, known_type = get_loader(filename, file.content_type, file_path)
+
+        # Loading, chunking and embedding run as a background job
+        job_id = app.state.INGESTION_JOBS.submit(
+            "doc",
+            {
+                "filename": filename,
+                "file_path": file_path,
+                "content_type": file.content_type,
+                "collection_name": collection_name,
+            },
+            user_id=user.id,
+        )
+        return {
+            "status": True,
+            "collection_name": collection_name,
+            "filename": filename,
+            "known_type": known_type,
+            "job_id": job_id,
+        }
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=ERROR_MESSAGES.FILE_TOO_LARGE(f"{RAG_FILE_MAX_SIZE} MB"),
+        )
     except Exception as e:
         log.exception(e)
         if "No pandoc was found" in str(e):
@@ -836,68 +1148,297 @@ def store_text(
 
 @app.get("/scan")
 def scan_docs_dir(user=Depends(get_admin_user)):
-    for path in Path(DOCS_DIR).rglob("./**/*"):
-        try:
-            if path.is_file() and not path.name.startswith("."):
-                tags = extract_folders_after_data_docs(path)
-                filename = path.name
-                file_content_type = mimetypes.guess_type(path)
+    job_id = app.state.INGESTION_JOBS.submit("scan", {}, user_id=user.id)
+    return {"status": True, "job_id": job_id}
+
+
+def lazy_load(loader):
+    try:
+        return loader.lazy_load()
+    except NotImplementedError:
+        return iter(loader.load())
+
+
+def report_pages(job: JobContext, data):
+    """Job progress of a paged document, the number of chunks is unknown."""
+    for doc in data:
+        total_pages = doc.metadata.get("total_pages")
+        if total_pages and "page" in doc.metadata:
+            job.set_progress(doc.metadata["page"] + 1, total_pages)
+        yield doc
+
+
+def ingest(job: JobContext, loader, collection_name: str, file_content_type=None, file_path=None):
+    # Pages are loaded, chunked and indexed as a stream, the stages are
+    # timed separately as their work interleaves
+    with job.stage("index"):
+        data = report_pages(job, job.timed("load", lazy_load(loader)))
+        docs = job.timed("split", split_data(data, file_content_type, file_path))
+
+        if not store_docs_in_vector_db(
+            docs, collection_name, overwrite=True, progress=job.set_progress
+        ):
+            raise Exception(ERROR_MESSAGES.DEFAULT())
+
+
+def run_doc_job(job: JobContext) -> dict:
+    payload = job.payload
+    loader, known_type = get_loader(
+        payload["filename"], payload["content_type"], payload["file_path"]
+    )
+    ingest(
+        job,
+        loader,
+        payload["collection_name"],
+        file_content_type=payload["content_type"],
+        file_path=payload["file_path"],
+    )
+    PDF_PAGE_CACHE.prune(RAG_PDF_CACHE_MAX_FILES)
+    return {
+        "collection_name": payload["collection_name"],
+        "filename": payload["filename"],
+        "known_type": known_type,
+    }
+
+
+def run_web_job(job: JobContext) -> dict:
+    ingest(job, get_web_loader(job.payload["url"]), job.payload["collection_name"])
+    return {"collection_name": job.payload["collection_name"]}
+
 
-                f = open(path, "rb")
-                collection_name = calculate_sha256(f)[:63]
-                f.close()
+def run_youtube_job(job: JobContext) -> dict:
+    loader = YoutubeLoader.from_youtube_url(job.payload["url"], add_video_info=False)
+    ingest(job, loader, job.payload["collection_name"])
+    return {"collection_name": job.payload["collection_name"]}
 
-                loader, known_type = get_loader(
-                    filename, file_content_type[0], str(path)
+
+def delete_collection(collection_name: str):
+    """
+    Drops a collection with everything derived from it: its sparse index,
+    its chunk fingerprints and the cached answers grounded on it.
+    """
+    try:
+        CHROMA_CLIENT.delete_collection(name=collection_name)
+    except ValueError:
+        pass
+    BM25_INDEXES.delete(collection_name)
+    CHUNK_FINGERPRINTS.delete(collection_name)
+    if app.state.ANSWER_CACHE:
+        app.state.ANSWER_CACHE.invalidate_collection(collection_name)
+
+
+def delete_scanned_file(path: str):
+    entry = app.state.SCAN_MANIFEST.remove(path)
+    if entry is None:
+        return
+
+    log.info(f"Removing deleted file {path}")
+    collection_name = entry["collection_name"]
+    if app.state.SCAN_MANIFEST.is_collection_used(collection_name):
+        return
+
+    doc = Documents.get_doc_by_name(entry["name"])
+    if doc and doc.collection_name == collection_name:
+        Documents.delete_doc_by_name(entry["name"])
+
+    delete_collection(collection_name)
+
+
+def ingest_scanned_file(job: JobContext, file: dict, data: list):
+    path = Path(file["path"])
+    tags = extract_folders_after_data_docs(path)
+    filename = path.name
+    file_content_type = mimetypes.guess_type(path)
+    collection_name = file["sha256"][:63]
+    user_id = job.job.user_id
+
+    with job.stage("index"):
+        docs = split_data(data, file_content_type[0], path)
+        if not store_docs_in_vector_db(
+            docs, collection_name, overwrite=True, progress=job.set_progress
+        ):
+            raise Exception(ERROR_MESSAGES.DEFAULT())
+
+    # Documents and the manifest are only updated by one file at a time
+    with scan_lock:
+        update_scanned_file(file, filename, collection_name, tags, user_id)
+        app.state.SCAN_MANIFEST.save()
+
+
+def update_scanned_file(
+    file: dict, filename: str, collection_name: str, tags: list, user_id: str
+):
+    sanitized_filename = sanitize_filename(filename)
+    doc = Documents.get_doc_by_name(sanitized_filename)
+
+    if doc == None:
+        doc = Documents.insert_new_doc(
+            user_id,
+            DocumentForm(
+                **{
+                    "name": sanitized_filename,
+                    "title": filename,
+                    "collection_name": collection_name,
+                    "filename": filename,
+                    "content": (
+                        json.dumps(
+                            {
+                                "tags": list(
+                                    map(
+                                        lambda name: {"name": name},
+                                        tags,
+                                    )
+                                )
+                            }
+                        )
+                        if len(tags)
+                        else "{}"
+                    ),
+                }
+            ),
+        )
+    elif doc.collection_name != collection_name:
+        # The file changed, point the document at its new content
+        Documents.update_doc_collection_name_by_name(sanitized_filename, collection_name)
+
+    previous = app.state.SCAN_MANIFEST.get(file["path"])
+    app.state.SCAN_MANIFEST.set(
+        file["path"],
+        {
+            "size": file["size"],
+            "mtime": file["mtime"],
+            "sha256": file["sha256"],
+            "collection_name": collection_name,
+            "name": sanitized_filename,
+        },
+    )
+
+    if previous and previous["collection_name"] != collection_name:
+        if not app.state.SCAN_MANIFEST.is_collection_used(previous["collection_name"]):
+            delete_collection(previous["collection_name"])
+
+
+# Held by scans and by the scanned files updating documents and the manifest
+scan_lock = threading.Lock()
+
+
+def run_scan_job(job: JobContext) -> dict:
+    """
+    Removes the deleted files of DOCS_DIR and queues a scan_file job per new
+    or changed file, which is reported and retried on its own.
+    """
+    # Concurrent scans would queue the same changes twice
+    with scan_lock:
+        manifest = app.state.SCAN_MANIFEST
+
+        with job.stage("diff"):
+            changed, deleted = diff_docs_dir(DOCS_DIR, manifest)
+            log.info(f"Scan found {len(changed)} new or changed, {len(deleted)} deleted files")
+
+        with job.stage("delete"):
+            for path in deleted:
+                delete_scanned_file(path)
+            manifest.save()
+
+        with job.stage("queue"):
+            # Files stay out of the manifest until ingested, an earlier scan
+            # may have queued them already
+            queued = {
+                (payload["path"], payload["sha256"])
+                for payload in app.state.INGESTION_JOBS.get_pending_payloads(
+                    "scan_file"
+                )
+            }
+            job_ids = [
+                app.state.INGESTION_JOBS.submit(
+                    "scan_file", file, user_id=job.job.user_id
                 )
-                data = loader.load()
-
-                try:
-                    result = store_data_in_vector_db(data, collection_name, overwrite = True, file_content_type=file_content_type[0],file_path=path)
-
-                    if result:
-                        sanitized_filename = sanitize_filename(filename)
-                        doc = Documents.get_doc_by_name(sanitized_filename)
-
-                        if doc == None:
-                            doc = Documents.insert_new_doc(
-                                user.id,
-                                DocumentForm(
-                                    **{
-                                        "name": sanitized_filename,
-                                        "title": filename,
-                                        "collection_name": collection_name,
-                                        "filename": filename,
-                                        "content": (
-                                            json.dumps(
-                                                {
-                                                    "tags": list(
-                                                        map(
-                                                            lambda name: {"name": name},
-                                                            tags,
-                                                        )
-                                                    )
-                                                }
-                                            )
-                                            if len(tags)
-                                            else "{}"
-                                        ),
-                                    }
-                                ),
-                            )
-                except Exception as e:
-                    log.exception(e)
-                    pass
+                for file in changed
+                if (file["path"], file["sha256"]) not in queued
+            ]
+
+    return {"deleted": len(deleted), "jobs": job_ids}
 
+
+def run_scan_file_job(job: JobContext) -> dict:
+    file = job.payload
+    try:
+        sha256 = get_file_hash(file["path"])
+    except FileNotFoundError:
+        sha256 = None
+    if sha256 != file["sha256"]:
+        # Changed or deleted since it was scanned, the next scan picks it up
+        log.info(f"Skipping {file['path']}, changed since it was scanned")
+        return {"path": file["path"], "skipped": True}
+
+    with job.stage("load"):
+        [(_, future)] = load_files(
+            [file],
+            RAG_SCAN_PROCESSES,
+            extract_images=app.state.PDF_EXTRACT_IMAGES,
+            extract_tables=RAG_PDF_EXTRACT_TABLES,
+            pdf_cache_dir=PDF_PAGE_CACHE.path,
+        )
+        data, _ = future.result()
+
+    ingest_scanned_file(job, file, data)
+    PDF_PAGE_CACHE.prune(RAG_PDF_CACHE_MAX_FILES)
+    return {"path": file["path"], "collection_name": file["sha256"][:63]}
+
+
+async def start_docs_watcher():
+    """Scans DOCS_DIR every RAG_SCAN_WATCH_INTERVAL seconds, if set."""
+    if RAG_SCAN_WATCH_INTERVAL <= 0:
+        return
+
+    log.info(f"Watching {DOCS_DIR} every {RAG_SCAN_WATCH_INTERVAL}s")
+    while True:
+        await asyncio.sleep(RAG_SCAN_WATCH_INTERVAL)
+        try:
+            if app.state.INGESTION_JOBS.has_pending("scan"):
+                continue
+
+            user = Users.get_first_user()
+            if user:
+                app.state.INGESTION_JOBS.submit("scan", {}, user_id=user.id)
         except Exception as e:
-            log.exception(e)
+            log.exception(f"Error scheduling the scan of {DOCS_DIR}: {e}")
 
-    return True
+
+app.state.INGESTION_JOBS.register("doc", run_doc_job)
+app.state.INGESTION_JOBS.register("web", run_web_job)
+app.state.INGESTION_JOBS.register("youtube", run_youtube_job)
+app.state.INGESTION_JOBS.register("scan", run_scan_job)
+app.state.INGESTION_JOBS.register("scan_file", run_scan_file_job)
+
+
+@app.get("/jobs", response_model=List[IngestionJob])
+async def get_ingestion_jobs(user=Depends(get_current_user)):
+    return app.state.INGESTION_JOBS.get_jobs(
+        user_id=None if user.role == "admin" else user.id
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(job_id: str, user=Depends(get_current_user)):
+    job = app.state.INGESTION_JOBS.get(job_id)
+    if job is None or (user.role != "admin" and job.user_id != user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ERROR_MESSAGES.NOT_FOUND,
+        )
+    return job
 
 
 @app.get("/reset/db")
 def reset_vector_db(user=Depends(get_admin_user)):
     CHROMA_CLIENT.reset()
+    BM25_INDEXES.reset()
+    CHUNK_FINGERPRINTS.reset()
+    PDF_PAGE_CACHE.clear()
+    app.state.SCAN_MANIFEST.clear()
+    if app.state.ANSWER_CACHE:
+        app.state.ANSWER_CACHE.clear()
 
 
 @app.get("/reset")
@@ -915,6 +1456,12 @@ def reset(user=Depends(get_admin_user)) -> bool:
 
     try:
         CHROMA_CLIENT.reset()
+        BM25_INDEXES.reset()
+        CHUNK_FINGERPRINTS.reset()
+        PDF_PAGE_CACHE.clear()
+        app.state.SCAN_MANIFEST.clear()
+        if app.state.ANSWER_CACHE:
+            app.state.ANSWER_CACHE.clear()
     except Exception as e:
         log.exception(e)
 
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import camelot
+import pdfplumber
+from langchain_core.documents import Document
+from langchain_community.document_loaders.parsers.pdf import PDFPlumberParser
+
+log = logging.getLogger(__name__)
+
+# Pages handed to a worker at once, the file is opened once per range
+PAGES_PER_TASK = 8
+
+# camelot is not thread safe, only pages extracted in-process need the lock
+camelot_lock = threading.Lock()
+
+
+def split_by_commas(value):
+    return [item.strip() for item in value.split(",")]
+
+
+def get_table_text(df) -> Optional[str]:
+    """Renders the rows of a table as `header: value | ...` lines."""
+    if len(df) <= 1 or len(df.columns) <= 1:
+        return None
+
+    headers = list(df.iloc[0])
+    if any(header == "" for header in headers):
+        return None
+
+    lines = []
+    for row in df.iloc[1:].itertuples(index=False):
+        lines.append(
+            " | ".join(
+                f"{header}: {value}"
+                for header, cell in zip(headers, row)
+                for value in split_by_commas(cell)
+            )
+        )
+    return "\n".join(lines)
+
+
+def extract_pages(
+    file_path: str,
+    page_numbers: List[int],
+    extract_tables: bool = True,
+    extract_images: bool = False,
+) -> Dict[int, dict]:
+    """
+    Extracts the text, and the tables unless disabled, of the 1-based
+    `page_numbers` in a single open of the file.
+    """
+    parser = PDFPlumberParser(extract_images=extract_images)
+    pages = {}
+
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number - 1]
+            text = parser._process_page_content(page)
+            if extract_images:
+                text += "\n" + parser._extract_images_from_page(page)
+            pages[page_number] = {"text": text, "tables": []}
+
+    if extract_tables:
+        with camelot_lock:
+            tables = camelot.read_pdf(
+                file_path, pages=",".join(str(n) for n in page_numbers)
+            )
+        for table in tables:
+            table_text = get_table_text(table.df)
+            if table_text:
+                pages[int(table.page)]["tables"].append(table_text)
+
+    return pages
+
+
+class PDFPageCache:
+    """
+    Extracted pages on disk, keyed by file hash, extraction mode and page.
+    Files are dropped least recently used by `prune`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _get_path(self, file_hash: str, mode: str, page_number: int) -> str:
+        return os.path.join(self.path, file_hash, f"{mode}-{page_number}.json")
+
+    def get(self, file_hash: str, mode: str, page_number: int) -> Optional[dict]:
+        try:
+            with open(self._get_path(file_hash, mode, page_number), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Ignoring unreadable cached PDF page: {e}")
+            return None
+
+    def set(self, file_hash: str, mode: str, page_number: int, page: dict):
+        path = self._get_path(file_hash, mode, page_number)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(page, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Pruned or cleared meanwhile, the page is extracted again next time
+            log.warning(f"Not caching PDF page: {e}")
+
+    def touch(self, file_hash: str):
+        """Marks the pages of a file as used, for `prune`."""
+        try:
+            os.utime(os.path.join(self.path, file_hash))
+        except OSError:
+            pass
+
+    def prune(self, max_files: int):
+        """Drops the pages of the least recently used files past `max_files`."""
+        try:
+            entries = [entry for entry in os.scandir(self.path) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[max_files:]:
+            log.debug(f"Dropping cached PDF pages of {entry.name}")
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool(processes: int) -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if processes <= 1:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def get_file_hash(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class PDFPageLoader:
+    """
+    Single pass PDF loader: text and tables are extracted page by page,
+    page ranges spread across a process pool, replacing PDFPlumberLoader
+    followed by a Camelot pass over the whole file.
+
+    Returns one document per page, in page order, followed on each page by
+    the text of its tables (metadata `type` "tables"). With `cache_dir`,
+    extracted pages are cached per file hash, so re-ingesting a file only
+    extracts the pages not seen before.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        extract_images: bool = False,
+        extract_tables: bool = True,
+        processes: int = 0,
+        cache_dir: Optional[str] = None,
+    ):
+        self.file_path = str(file_path)
+        self.extract_images = extract_images
+        self.extract_tables = extract_tables
+        self.processes = processes
+        self.cache = PDFPageCache(cache_dir) if cache_dir else None
+
+    @property
+    def mode(self) -> str:
+        return "".join(
+            [
+                "text",
+                "+tables" if self.extract_tables else "",
+                "+images" if self.extract_images else "",
+            ]
+        )
+
+    def _extract(self, page_numbers: List[int]) -> Iterator[Tuple[int, dict]]:
+        ranges = [
+            page_numbers[i : i + PAGES_PER_TASK]
+            for i in range(0, len(page_numbers), PAGES_PER_TASK)
+        ]
+        args = (self.extract_tables, self.extract_images)
+
+        # Even a single range is extracted in a pool process when there is a
+        # pool, in-process extraction serializes on camelot_lock
+        pool = get_pdf_pool(self.processes)
+        if pool is None:
+            for numbers in ranges:
+                yield from extract_pages(self.file_path, numbers, *args).items()
+            return
+
+        # In page order, so pages can be consumed while later ranges run
+        futures = [
+            pool.submit(extract_pages, self.file_path, numbers, *args)
+            for numbers in ranges
+        ]
+        for future in futures:
+            yield from future.result().items()
+
+    def lazy_load(self) -> Iterator[Document]:
+        with pdfplumber.open(self.file_path) as pdf:
+            total_pages = len(pdf.pages)
+            metadata = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+
+        file_hash = get_file_hash(self.file_path) if self.cache else None
+        cached = {}
+        if self.cache:
+            self.cache.touch(file_hash)
+            for page_number in range(1, total_pages + 1):
+                page = self.cache.get(file_hash, self.mode, page_number)
+                if page is not None:
+                    cached[page_number] = page
+
+        missing = [n for n in range(1, total_pages + 1) if n not in cached]
+        extracted = self._extract(missing)
+
+        for page_number in range(1, total_pages + 1):
+            page = cached.get(page_number)
+            if page is None:
+                _, page = next(extracted)
+                if self.cache:
+                    self.cache.set(file_hash, self.mode, page_number, page)
+
+            page_metadata = {
+                **metadata,
+                "source": self.file_path,
+                "file_path": self.file_path,
+                "page": page_number - 1,
+                "total_pages": total_pages,
+            }
+            yield Document(page_content=page["text"], metadata=page_metadata)
+            for table in page["tables"]:
+                yield Document(
+                    page_content=table, metadata={**page_metadata, "type": "tables"}
+                )
+
+    def load(self) -> List[Document]:
+        return list(self.lazy_load())
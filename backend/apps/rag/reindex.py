@@ -0,0 +1,114 @@
+import hashlib
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# Collection metadata recording the embedding model its vectors come from
+NAMESPACE_KEY = "embedding_namespace"
+
+# How a chunk of the new version of a document relates to the previous one
+ADDED = "added"
+MOVED = "moved"
+UNCHANGED = "unchanged"
+
+
+def get_collection_metadata(namespace: str) -> dict:
+    return {NAMESPACE_KEY: namespace}
+
+
+def is_same_namespace(metadata: Optional[dict], namespace: str) -> bool:
+    """
+    Whether a collection holds vectors of the `namespace` embedding model.
+    Collections stored before the model was recorded never do, they are
+    embedded again once.
+    """
+    return (metadata or {}).get(NAMESPACE_KEY) == namespace
+
+
+def get_stamped_metadata(metadata: Optional[dict], namespace: str) -> dict:
+    """
+    Metadata recording `namespace` for a collection stored before the model
+    was recorded. Chroma does not allow changing the "hnsw:" settings of a
+    collection, they are left out.
+    """
+    return {
+        **{
+            key: value
+            for key, value in (metadata or {}).items()
+            if not key.startswith("hnsw:")
+        },
+        NAMESPACE_KEY: namespace,
+    }
+
+
+def get_staging_collection_name(collection_name: str, namespace: str) -> str:
+    """
+    Collection a collection is embedded again into with the `namespace`
+    model, it replaces the collection once complete. Chroma names are at
+    most 63 characters long.
+    """
+    suffix = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:8]
+    return f"{collection_name[:51]}__{suffix}"
+
+
+def is_same_embedding(
+    a: Sequence[float], b: Sequence[float], min_similarity: float = 0.99
+) -> bool:
+    """Whether two embeddings of the same text come from the same model."""
+    if len(a) != len(b):
+        return False
+
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return norm > 0 and sum(x * y for x, y in zip(a, b)) / norm >= min_similarity
+
+
+def get_chunk_id(namespace: str, text: str, occurrence: int) -> str:
+    """
+    Deterministic chunk id: a chunk with the same text, at the same position
+    among identical chunks and embedded by the same model keeps its id from
+    one ingest to the next, wherever the rest of the document changed.
+    """
+    key = f"{namespace}\0{occurrence}\0{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class ChunkDiff:
+    """
+    Compares the chunks of a new version of a document, fed in order, with
+    the chunks stored for the previous one (metadata by chunk id).
+
+    - ADDED: no stored chunk has its id, it is embedded and added
+    - MOVED: stored with other metadata, e.g. on another page
+    - UNCHANGED: stored as it is
+
+    Stored chunks no chunk of the new version maps to are left in
+    `get_deleted`.
+    """
+
+    def __init__(self, namespace: str, previous: Dict[str, Optional[dict]]):
+        self.namespace = namespace
+        self.previous = previous
+
+        # Occurrences of every chunk text so far, by hash
+        self._occurrences = Counter()
+        self._seen = set()
+
+    def add(self, doc: Document) -> Tuple[str, str]:
+        """Returns the id of the chunk and how it changed."""
+        text_hash = hashlib.sha256(doc.page_content.encode("utf-8")).digest()
+        id = get_chunk_id(
+            self.namespace, doc.page_content, self._occurrences[text_hash]
+        )
+        self._occurrences[text_hash] += 1
+        self._seen.add(id)
+
+        if id not in self.previous:
+            return id, ADDED
+        if (self.previous[id] or {}) != doc.metadata:
+            return id, MOVED
+        return id, UNCHANGED
+
+    def get_deleted(self) -> List[str]:
+        return [id for id in self.previous if id not in self._seen]
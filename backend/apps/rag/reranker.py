@@ -0,0 +1,145 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class RerankingService:
+    """
+    Front of the cross-encoder shared by all requests.
+
+    - Scoring requests of concurrent queries are merged into one `predict`
+      batch: a worker thread waits up to `max_wait` seconds after the first
+      pending pair for more to arrive, up to `max_batch_size` pairs.
+    - Scores are cached per (query, chunk id), so a repeated question only
+      scores the chunks it has not seen.
+
+    `predict(pairs)` is compatible with `CrossEncoder.predict`.
+    """
+
+    def __init__(
+        self,
+        model: Any = None,
+        max_batch_size: int = 64,
+        max_wait: float = 0.01,
+        cache_size: int = 10000,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[Tuple[str, str], Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_pairs = 0
+
+    def set_model(self, model: Any):
+        with self._cache_lock:
+            self.model = model
+            # Scores of another model are meaningless
+            self._cache.clear()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name="rag-reranker", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            try:
+                while len(items) < self.max_batch_size:
+                    items.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+
+            try:
+                scores = self.model.predict([pair for pair, _ in items])
+                self.batches += 1
+                self.batched_pairs += len(items)
+                for (_, future), score in zip(items, scores):
+                    future.set_result(float(score))
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _submit(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        self._ensure_worker()
+
+        futures = []
+        for pair in pairs:
+            future = Future()
+            self._queue.put((pair, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def predict(
+        self,
+        pairs: List[Tuple[str, str]],
+        chunk_ids: Optional[List[Optional[str]]] = None,
+    ) -> List[float]:
+        """
+        Scores (query, text) pairs. With `chunk_ids`, scores are cached per
+        (query, chunk id); pairs with a None id are always scored.
+        """
+        if chunk_ids is None:
+            chunk_ids = [None] * len(pairs)
+
+        scores: List[Optional[float]] = [None] * len(pairs)
+        missing = []
+
+        with self._cache_lock:
+            for i, ((query, _), chunk_id) in enumerate(zip(pairs, chunk_ids)):
+                score = None
+                if chunk_id is not None:
+                    score = self._cache.get((query, chunk_id))
+                if score is None:
+                    missing.append(i)
+                    self.cache_misses += 1
+                else:
+                    self._cache.move_to_end((query, chunk_id))
+                    scores[i] = score
+                    self.cache_hits += 1
+
+        if missing:
+            for i, score in zip(missing, self._submit([pairs[i] for i in missing])):
+                scores[i] = score
+
+            with self._cache_lock:
+                for i in missing:
+                    if chunk_ids[i] is not None:
+                        self._cache[(pairs[i][0], chunk_ids[i])] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def get_stats(self) -> dict:
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "cache_entries": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+                "batches": self.batches,
+                "average_batch_size": (
+                    self.batched_pairs / self.batches if self.batches else 0.0
+                ),
+            }
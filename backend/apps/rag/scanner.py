@@ -0,0 +1,196 @@
+import json
+import logging
+import mimetypes
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from apps.rag.loaders import load_file
+from config import SRC_LOG_LEVELS
+from utils.misc import calculate_sha256
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["RAG"])
+
+
+class ScanManifest:
+    """
+    Size, mtime, sha256 and collection name of every file ingested from the
+    docs directory, keyed by path and persisted as JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.error(f"Error loading scan manifest: {e}")
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, path: str) -> Optional[dict]:
+        return self.entries.get(path)
+
+    def set(self, path: str, entry: dict):
+        with self._lock:
+            self.entries[path] = entry
+
+    def remove(self, path: str) -> Optional[dict]:
+        with self._lock:
+            return self.entries.pop(path, None)
+
+    def is_collection_used(self, collection_name: str) -> bool:
+        """Identical files share a collection, it is kept while one is left."""
+        return any(
+            entry["collection_name"] == collection_name
+            for entry in self.entries.values()
+        )
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+        self.save()
+
+
+def get_file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return calculate_sha256(f)
+
+
+def diff_docs_dir(
+    docs_dir: str, manifest: ScanManifest
+) -> Tuple[List[dict], List[str]]:
+    """
+    Returns the new or changed files of `docs_dir` and the paths of the
+    manifest that were deleted. Files are only hashed when their size or
+    mtime differs from the manifest; a touched but identical file only has
+    its manifest entry refreshed.
+    """
+    changed = []
+    seen = set()
+
+    for path in Path(docs_dir).rglob("./**/*"):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+
+        try:
+            stat = path.stat()
+            key = str(path)
+            seen.add(key)
+
+            entry = manifest.get(key)
+            if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime
+            ):
+                continue
+
+            sha256 = get_file_hash(key)
+            if entry is not None and entry["sha256"] == sha256:
+                manifest.set(
+                    key, {**entry, "size": stat.st_size, "mtime": stat.st_mtime}
+                )
+                continue
+
+            changed.append(
+                {
+                    "path": key,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "sha256": sha256,
+                }
+            )
+        except OSError as e:
+            log.warning(f"Skipping {path}: {e}")
+
+    deleted = [path for path in manifest.entries if path not in seen]
+    return changed, deleted
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_scan_pool(processes: int) -> Optional[ProcessPoolExecutor]:
+    """Process pool shared by scans, None to load in the calling thread."""
+    global _pool
+    if processes <= 1:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process running model threads is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def load_files(
+    files: List[dict],
+    processes: int,
+    extract_images: bool = False,
+    extract_tables: bool = True,
+    pdf_cache_dir: Optional[str] = None,
+) -> Iterator[Tuple[dict, Future]]:
+    """
+    Loads `files` across the scan process pool, yields every file with the
+    future of its `(documents, known_type)` as soon as it is loaded. Only a
+    few files per process are in flight, so a large scan never holds every
+    loaded document in memory.
+    """
+    pool = get_scan_pool(processes)
+
+    def get_args(file: dict) -> tuple:
+        return (
+            Path(file["path"]).name,
+            mimetypes.guess_type(file["path"])[0],
+            file["path"],
+            extract_images,
+            extract_tables,
+            pdf_cache_dir,
+        )
+
+    if pool is None:
+        for file in files:
+            future = Future()
+            try:
+                future.set_result(load_file(*get_args(file)))
+            except Exception as e:
+                future.set_exception(e)
+            yield file, future
+        return
+
+    pending = iter(files)
+    futures = {}
+    while True:
+        for file in pending:
+            futures[pool.submit(load_file, *get_args(file))] = file
+            if len(futures) >= processes * 2:
+                break
+
+        if not futures:
+            return
+
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield futures.pop(future), future
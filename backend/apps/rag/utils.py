@@ -1,8 +1,11 @@
 import os
+import time
+import heapq
 import logging
 import requests
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List
 
 from apps.ollama.main import (
     generate_ollama_embeddings,
@@ -12,14 +15,32 @@ from apps.ollama.main import (
 from huggingface_hub import snapshot_download
 
 from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
 from langchain.retrievers import (
     ContextualCompressionRetriever,
     EnsembleRetriever,
 )
 
 from typing import Optional
-from config import SRC_LOG_LEVELS, CHROMA_CLIENT
+from apps.rag.bm25 import BM25_INDEXES
+from apps.rag.embedding_cache import EmbeddingCache, get_cached_embedding_function
+from apps.rag.reranker import RerankingService
+from apps.rag.embedding_server import EmbeddingServer, INTERACTIVE
+from apps.rag.executors import (
+    EMBEDDING_EXECUTOR,
+    RERANKING_EXECUTOR,
+    REQUEST_EXECUTOR,
+    RETRIEVAL_EXECUTOR,
+)
+from config import (
+    SRC_LOG_LEVELS,
+    CHROMA_CLIENT,
+    RAG_EMBEDDING_BATCH_SIZE,
+    RAG_EMBEDDING_CONCURRENCY,
+    RAG_EMBEDDING_MAX_RETRIES,
+    RAG_EMBEDDING_RETRY_BACKOFF,
+    RAG_RETRIEVAL_TIMEOUT,
+    RAG_RERANKING_MAX_CANDIDATES,
+)
 
 
 log = logging.getLogger(__name__)
@@ -31,10 +52,12 @@ def query_doc(
     query: str,
     embedding_function,
     k: int,
+    query_embeddings: Optional[List[float]] = None,
 ):
     try:
         collection = CHROMA_CLIENT.get_collection(name=collection_name)
-        query_embeddings = embedding_function(query)
+        if query_embeddings is None:
+            query_embeddings = embedding_function(query)
 
         result = collection.query(
             query_embeddings=[query_embeddings],
@@ -55,18 +78,22 @@ def query_doc_with_hybrid_search(
 ):
     try:
         collection = CHROMA_CLIENT.get_collection(name=collection_name)
-        documents = collection.get()  # get all documents
 
-        bm25_retriever = BM25Retriever.from_texts(
-            texts=documents.get("documents"),
-            metadatas=documents.get("metadatas"),
+        # Ids and stored embeddings of the retrieved chunks, so the reranker
+        # can cache scores per chunk and the cosine path needs no re-embedding
+        candidates = RerankCandidates(collection)
+
+        # Scores postings of the persisted index instead of re-tokenizing
+        # every document of the collection
+        bm25_retriever = BM25IndexRetriever(
+            collection=collection, top_n=k, candidates=candidates
         )
-        bm25_retriever.k = k
 
         chroma_retriever = ChromaRetriever(
             collection=collection,
             embedding_function=embedding_function,
             top_n=k,
+            candidates=candidates,
         )
 
         ensemble_retriever = EnsembleRetriever(
@@ -78,6 +105,8 @@ def query_doc_with_hybrid_search(
             top_n=k,
             reranking_function=reranking_function,
             r_score=r,
+            candidates=candidates,
+            max_candidates=RAG_RERANKING_MAX_CANDIDATES,
         )
 
         compression_retriever = ContextualCompressionRetriever(
@@ -98,65 +127,96 @@ def query_doc_with_hybrid_search(
 
 
 def merge_and_sort_query_results(query_results, k, reverse=False):
-    # Initialize lists to store combined data
-    combined_distances = []
-    combined_documents = []
-    combined_metadatas = []
-
-    for data in query_results:
-        combined_distances.extend(data["distances"][0])
-        combined_documents.extend(data["documents"][0])
-        combined_metadatas.extend(data["metadatas"][0])
-
-    # Create a list of tuples (distance, document, metadata)
-    combined = list(zip(combined_distances, combined_documents, combined_metadatas))
-
-    # Sort the list based on distances
-    combined.sort(key=lambda x: x[0], reverse=reverse)
-
-    # We don't have anything :-(
-    if not combined:
-        sorted_distances = []
-        sorted_documents = []
-        sorted_metadatas = []
-    else:
-        # Unzip the sorted list
-        sorted_distances, sorted_documents, sorted_metadatas = zip(*combined)
+    # (distance, document, metadata) of every result, only the best k are kept
+    combined = (
+        item
+        for data in query_results
+        for item in zip(
+            data["distances"][0], data["documents"][0], data["metadatas"][0]
+        )
+    )
 
-        # Slicing the lists to include only k elements
-        sorted_distances = list(sorted_distances)[:k]
-        sorted_documents = list(sorted_documents)[:k]
-        sorted_metadatas = list(sorted_metadatas)[:k]
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    top_k = select(k, combined, key=lambda item: item[0])
 
     # Create the output dictionary
     result = {
-        "distances": [sorted_distances],
-        "documents": [sorted_documents],
-        "metadatas": [sorted_metadatas],
+        "distances": [[item[0] for item in top_k]],
+        "documents": [[item[1] for item in top_k]],
+        "metadatas": [[item[2] for item in top_k]],
     }
 
     return result
 
 
+def get_query_embedding_function(embedding_function, query: str, embedding):
+    """Serves the already computed embedding of `query` without re-embedding it."""
+
+    def func(text, **kwargs):
+        if isinstance(text, str) and text == query:
+            return embedding
+        return embedding_function(text, **kwargs)
+
+    return func
+
+
+def run_collection_queries(
+    collection_names: List[str], query_fn, deadline: Optional[float] = None
+) -> dict:
+    """
+    Runs `query_fn(collection_name)` for every collection on the bounded
+    retrieval pool. Collections that fail, or are still running when the
+    `deadline` (time.monotonic()) passes, are left out of the results.
+    """
+    futures = {
+        RETRIEVAL_EXECUTOR.submit(query_fn, collection_name): collection_name
+        for collection_name in collection_names
+    }
+
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    done, not_done = wait(futures, timeout=timeout)
+
+    for future in not_done:
+        future.cancel()
+        log.warning(f"Retrieval deadline exceeded, skipping {futures[future]}")
+
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            log.debug(f"Error querying {futures[future]}: {e}")
+    return results
+
+
+def get_retrieval_deadline() -> Optional[float]:
+    if RAG_RETRIEVAL_TIMEOUT > 0:
+        return time.monotonic() + RAG_RETRIEVAL_TIMEOUT
+    return None
+
+
 def query_collection(
     collection_names: List[str],
     query: str,
     embedding_function,
     k: int,
+    deadline: Optional[float] = None,
 ):
-    results = []
-    for collection_name in collection_names:
-        try:
-            result = query_doc(
-                collection_name=collection_name,
-                query=query,
-                k=k,
-                embedding_function=embedding_function,
-            )
-            results.append(result)
-        except:
-            pass
-    return merge_and_sort_query_results(results, k=k)
+    # Embed once for every collection
+    query_embeddings = embedding_function(query)
+
+    results = run_collection_queries(
+        collection_names,
+        lambda collection_name: query_doc(
+            collection_name=collection_name,
+            query=query,
+            k=k,
+            embedding_function=embedding_function,
+            query_embeddings=query_embeddings,
+        ),
+        deadline=deadline or get_retrieval_deadline(),
+    )
+    return merge_and_sort_query_results(results.values(), k=k)
 
 
 def query_collection_with_hybrid_search(
@@ -166,22 +226,25 @@ def query_collection_with_hybrid_search(
     k: int,
     reranking_function,
     r: float,
+    deadline: Optional[float] = None,
 ):
-    results = []
-    for collection_name in collection_names:
-        try:
-            result = query_doc_with_hybrid_search(
-                collection_name=collection_name,
-                query=query,
-                embedding_function=embedding_function,
-                k=k,
-                reranking_function=reranking_function,
-                r=r,
-            )
-            results.append(result)
-        except:
-            pass
-    return merge_and_sort_query_results(results, k=k, reverse=True)
+    embedding_function = get_query_embedding_function(
+        embedding_function, query, embedding_function(query)
+    )
+
+    results = run_collection_queries(
+        collection_names,
+        lambda collection_name: query_doc_with_hybrid_search(
+            collection_name=collection_name,
+            query=query,
+            embedding_function=embedding_function,
+            k=k,
+            reranking_function=reranking_function,
+            r=r,
+        ),
+        deadline=deadline or get_retrieval_deadline(),
+    )
+    return merge_and_sort_query_results(results.values(), k=k, reverse=True)
 
 
 def rag_template(template: str, context: str, query: str):
@@ -190,40 +253,104 @@ def rag_template(template: str, context: str, query: str):
     return template
 
 
+def with_retries(func, retries: int, backoff: float):
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries:
+                raise e
+            delay = backoff * 2**attempt
+            log.warning(f"Embedding request failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def embed_in_batches(
+    texts: List[str],
+    embed_batch,
+    batch_size: int,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        embeddings.extend(embed_batch(texts[i : i + batch_size]))
+        if progress:
+            progress(len(embeddings), len(texts))
+    return embeddings
+
+
 def get_embedding_function(
     embedding_engine,
     embedding_model,
     embedding_function,
     openai_key,
     openai_url,
+    batch_size: int = RAG_EMBEDDING_BATCH_SIZE,
+    concurrency: int = RAG_EMBEDDING_CONCURRENCY,
+    retries: int = RAG_EMBEDDING_MAX_RETRIES,
+    backoff: float = RAG_EMBEDDING_RETRY_BACKOFF,
+    cache: Optional[EmbeddingCache] = None,
+    lane: str = INTERACTIVE,
 ):
-    if embedding_engine == "":
-        return lambda query: embedding_function.encode(query).tolist()
-    elif embedding_engine in ["ollama", "openai"]:
-        if embedding_engine == "ollama":
-            func = lambda query: generate_ollama_embeddings(
+    """
+    Returns `func(query, progress=None)`: a string is embedded into a single
+    vector, a list of strings into a list of vectors, `batch_size` texts at a
+    time with `progress(done, total)` called after every batch. With a
+    `cache`, only texts not embedded before by the same model are embedded.
+
+    A local model behind an EmbeddingServer is queued on `lane`.
+    """
+    if embedding_engine == "" and isinstance(embedding_function, EmbeddingServer):
+        embed_batch = lambda texts: embedding_function.embed(texts, lane=lane)
+        embed_one = lambda query: embedding_function.embed([query], lane=lane)[0]
+    elif embedding_engine == "":
+        embed_batch = lambda texts: embedding_function.encode(
+            texts, batch_size=batch_size
+        ).tolist()
+        embed_one = lambda query: embedding_function.encode(query).tolist()
+    elif embedding_engine == "ollama":
+        embed_one = lambda query: with_retries(
+            lambda: generate_ollama_embeddings(
                 GenerateEmbeddingsForm(
                     **{
                         "model": embedding_model,
                         "prompt": query,
                     }
                 )
-            )
-        elif embedding_engine == "openai":
-            func = lambda query: generate_openai_embeddings(
+            ),
+            retries,
+            backoff,
+        )
+
+        # /api/embeddings takes a single prompt, fan out with a bounded pool
+        def embed_batch(texts):
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                return list(executor.map(embed_one, texts))
+
+    elif embedding_engine == "openai":
+        embed_batch = lambda texts: with_retries(
+            lambda: generate_openai_batch_embeddings(
                 model=embedding_model,
-                text=query,
+                texts=texts,
                 key=openai_key,
                 url=openai_url,
-            )
+            ),
+            retries,
+            backoff,
+        )
+        embed_one = lambda query: embed_batch([query])[0]
 
-        def generate_multiple(query, f):
-            if isinstance(query, list):
-                return [f(q) for q in query]
-            else:
-                return f(query)
+    def func(query, progress: Optional[Callable[[int, int], None]] = None):
+        if isinstance(query, list):
+            return embed_in_batches(query, embed_batch, batch_size, progress)
+        else:
+            return embed_one(query)
 
-        return lambda query: generate_multiple(query, func)
+    if cache is not None:
+        return get_cached_embedding_function(
+            func, cache, f"{embedding_engine}:{embedding_model}"
+        )
+    return func
 
 
 def rag_messages(
@@ -238,6 +365,9 @@ def rag_messages(
 ):
     log.debug(f"docs: {docs} {messages} {embedding_function} {reranking_function}")
 
+    # Embedding runs on the bounded embedding pool, shared by all requests
+    embedding_function = EMBEDDING_EXECUTOR.wrap(embedding_function)
+
     last_user_message_idx = None
     for i in range(len(messages) - 1, -1, -1):
         if messages[i]["role"] == "user":
@@ -263,12 +393,12 @@ def rag_messages(
         content_type = None
         query = ""
 
+    deadline = get_retrieval_deadline()
+
     extracted_collections = []
-    relevant_contexts = []
+    doc_collections = []
 
     for doc in docs:
-        context = None
-
         collection_names = (
             doc["collection_names"]
             if doc["type"] == "collection"
@@ -280,34 +410,69 @@ def rag_messages(
             log.debug(f"skipping {doc} as it has already been extracted")
             continue
 
+        doc_collections.append((doc, collection_names))
+        extracted_collections.extend(collection_names)
+
+    # Every collection of every doc is queried in one concurrent fan-out,
+    # with the query embedded once
+    query_names = [
+        collection_name
+        for doc, collection_names in doc_collections
+        if doc["type"] != "text"
+        for collection_name in collection_names
+    ]
+
+    results = {}
+    if query_names:
         try:
-            if doc["type"] == "text":
-                context = doc["content"]
+            query_embeddings = embedding_function(query)
+            embedding_function = get_query_embedding_function(
+                embedding_function, query, query_embeddings
+            )
+
+            if hybrid_search:
+                query_fn = lambda collection_name: query_doc_with_hybrid_search(
+                    collection_name=collection_name,
+                    query=query,
+                    embedding_function=embedding_function,
+                    k=k,
+                    reranking_function=reranking_function,
+                    r=r,
+                )
             else:
-                if hybrid_search:
-                    context = query_collection_with_hybrid_search(
-                        collection_names=collection_names,
-                        query=query,
-                        embedding_function=embedding_function,
-                        k=k,
-                        reranking_function=reranking_function,
-                        r=r,
-                    )
-                else:
-                    context = query_collection(
-                        collection_names=collection_names,
-                        query=query,
-                        embedding_function=embedding_function,
-                        k=k,
-                    )
+                query_fn = lambda collection_name: query_doc(
+                    collection_name=collection_name,
+                    query=query,
+                    embedding_function=embedding_function,
+                    k=k,
+                    query_embeddings=query_embeddings,
+                )
+
+            results = run_collection_queries(query_names, query_fn, deadline)
         except Exception as e:
             log.exception(e)
-            context = None
+
+    relevant_contexts = []
+
+    for doc, collection_names in doc_collections:
+        context = None
+
+        if doc["type"] == "text":
+            context = doc["content"]
+        else:
+            doc_results = [
+                results[collection_name]
+                for collection_name in collection_names
+                if collection_name in results
+            ]
+            if doc_results:
+                context = merge_and_sort_query_results(
+                    doc_results, k=k, reverse=hybrid_search
+                )
 
         if context:
             relevant_contexts.append({**context, "source": doc})
 
-        extracted_collections.extend(collection_names)
     context_string = ""
 
     citations = []
@@ -361,6 +526,14 @@ def rag_messages(
     return messages, citations
 
 
+async def rag_messages_async(**kwargs):
+    """
+    `rag_messages` for async callers: retrieval runs on worker threads so the
+    event loop keeps serving other requests, e.g. streaming chats.
+    """
+    return await REQUEST_EXECUTOR.arun(rag_messages, **kwargs)
+
+
 def get_model_path(model: str, update_model: bool = False):
     # Construct huggingface_hub kwargs with local_files_only to return the snapshot path
     cache_dir = os.getenv("SENTENCE_TRANSFORMERS_HOME")
@@ -399,24 +572,32 @@ def get_model_path(model: str, update_model: bool = False):
         return model
 
 
+def generate_openai_batch_embeddings(
+    model: str, texts: List[str], key: str, url: str = "https://api.openai.com/v1"
+) -> List[List[float]]:
+    r = requests.post(
+        f"{url}/embeddings",
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {key}",
+        },
+        json={"input": texts, "model": model},
+    )
+    r.raise_for_status()
+    data = r.json()
+    if "data" in data:
+        # Results are not guaranteed to come back in input order
+        items = sorted(data["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in items]
+    else:
+        raise Exception("Something went wrong :/")
+
+
 def generate_openai_embeddings(
     model: str, text: str, key: str, url: str = "https://api.openai.com/v1"
 ):
     try:
-        r = requests.post(
-            f"{url}/embeddings",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {key}",
-            },
-            json={"input": text, "model": model},
-        )
-        r.raise_for_status()
-        data = r.json()
-        if "data" in data:
-            return data["data"][0]["embedding"]
-        else:
-            raise "Something went wrong :/"
+        return generate_openai_batch_embeddings(model, [text], key, url)[0]
     except Exception as e:
         print(e)
         return None
@@ -428,10 +609,39 @@ from langchain_core.retrievers import BaseRetriever
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 
 
+class RerankCandidates:
+    """Chunk ids and stored embeddings seen by the retrievers of one query."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        # page content -> chunk id
+        self.ids = {}
+        # chunk id -> stored embedding
+        self.embeddings = {}
+
+    def add(self, ids, documents, embeddings=None):
+        for idx, id in enumerate(ids):
+            self.ids[documents[idx]] = id
+        if embeddings is not None:
+            self.add_embeddings(ids, embeddings)
+
+    def add_embeddings(self, ids, embeddings):
+        for id, embedding in zip(ids, embeddings):
+            self.embeddings[id] = list(embedding)
+
+    def get_embeddings(self, ids: List[str]) -> dict:
+        missing = [id for id in ids if id not in self.embeddings]
+        if missing:
+            result = self.collection.get(ids=missing, include=["embeddings"])
+            self.add_embeddings(result["ids"], result["embeddings"])
+        return {id: self.embeddings[id] for id in ids if id in self.embeddings}
+
+
 class ChromaRetriever(BaseRetriever):
     collection: Any
     embedding_function: Any
     top_n: int
+    candidates: Any = None
 
     def _get_relevant_documents(
         self,
@@ -441,15 +651,23 @@ class ChromaRetriever(BaseRetriever):
     ) -> List[Document]:
         query_embeddings = self.embedding_function(query)
 
+        include = ["documents", "metadatas"]
+        if self.candidates is not None:
+            include.append("embeddings")
+
         results = self.collection.query(
             query_embeddings=[query_embeddings],
             n_results=self.top_n,
+            include=include,
         )
 
         ids = results["ids"][0]
         metadatas = results["metadatas"][0]
         documents = results["documents"][0]
 
+        if self.candidates is not None:
+            self.candidates.add(ids, documents, results["embeddings"][0])
+
         results = []
         for idx in range(len(ids)):
             results.append(
@@ -461,6 +679,30 @@ class ChromaRetriever(BaseRetriever):
         return results
 
 
+class BM25IndexRetriever(BaseRetriever):
+    collection: Any
+    top_n: int
+    candidates: Any = None
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> List[Document]:
+        results = BM25_INDEXES.search(self.collection, query, self.top_n)
+
+        if self.candidates is not None:
+            self.candidates.add(
+                [id for id, _, _, _ in results], [text for _, text, _, _ in results]
+            )
+
+        return [
+            Document(metadata=metadata, page_content=text)
+            for _, text, metadata, _ in results
+        ]
+
+
 import operator
 
 from typing import Optional, Sequence
@@ -477,6 +719,8 @@ class RerankCompressor(BaseDocumentCompressor):
     top_n: int
     reranking_function: Any
     r_score: float
+    candidates: Any = None
+    max_candidates: int = 0
 
     class Config:
         extra = Extra.forbid
@@ -488,20 +732,56 @@ class RerankCompressor(BaseDocumentCompressor):
         query: str,
         callbacks: Optional[Callbacks] = None,
     ) -> Sequence[Document]:
-        reranking = self.reranking_function is not None
-
-        if reranking:
-            scores = self.reranking_function.predict(
-                [(query, doc.page_content) for doc in documents]
+        # The ensemble returns the candidates best fused rank first, the tail
+        # rarely makes it into the top n but costs as much to score
+        if self.max_candidates:
+            documents = documents[: self.max_candidates]
+
+        ids = [None] * len(documents)
+        if self.candidates is not None:
+            ids = [self.candidates.ids.get(doc.page_content) for doc in documents]
+
+        # Cross-encoder calls run on the bounded reranking pool
+        if isinstance(self.reranking_function, RerankingService):
+            scores = RERANKING_EXECUTOR.run(
+                self.reranking_function.predict,
+                [(query, doc.page_content) for doc in documents],
+                chunk_ids=ids,
             )
+        elif self.reranking_function is not None:
+            scores = RERANKING_EXECUTOR.run(
+                self.reranking_function.predict,
+                [(query, doc.page_content) for doc in documents],
+            ).tolist()
         else:
             query_embedding = self.embedding_function(query)
-            document_embedding = self.embedding_function(
-                [doc.page_content for doc in documents]
+
+            # Reuse the embeddings stored in Chroma, only chunks it does not
+            # know are embedded again
+            stored = {}
+            if self.candidates is not None:
+                stored = self.candidates.get_embeddings(
+                    [id for id in ids if id is not None]
+                )
+            missing = [
+                idx for idx, id in enumerate(ids) if id is None or id not in stored
+            ]
+            embedded = (
+                self.embedding_function(
+                    [documents[idx].page_content for idx in missing]
+                )
+                if missing
+                else []
             )
-            scores = util.cos_sim(query_embedding, document_embedding)[0]
+            embedded = dict(zip(missing, embedded))
+
+            document_embedding = [
+                embedded[idx] if idx in embedded else stored[id]
+                for idx, id in enumerate(ids)
+            ]
+            scores = util.cos_sim(query_embedding, document_embedding)[0].tolist()
 
-        docs_with_scores = list(zip(documents, scores.tolist()))
+        docs_with_scores = list(zip(documents, scores))
         if self.r_score:
             docs_with_scores = [
                 (d, s) for d, s in docs_with_scores if s >= self.r_score
@@ -29,6 +29,8 @@ app = FastAPI()
 
 origins = ["*"]
 app.state.TOOLS = {}
+# Set by the main app, which owns the RAG embedding function
+app.state.TOOLS_CLASSIFIER = None
 
 app.state.ENABLE_SIGNUP = ENABLE_SIGNUP
 app.state.JWT_EXPIRES_IN = "-1"
@@ -147,6 +147,22 @@ class DocumentsTable:
             log.exception(e)
             return None
 
+    def update_doc_collection_name_by_name(
+        self, name: str, collection_name: str
+    ) -> Optional[DocumentModel]:
+        try:
+            query = Document.update(
+                collection_name=collection_name,
+                timestamp=int(time.time()),
+            ).where(Document.name == name)
+            query.execute()
+
+            doc = Document.get(Document.name == name)
+            return DocumentModel(**model_to_dict(doc))
+        except Exception as e:
+            log.exception(e)
+            return None
+
     def delete_doc_by_name(self, name: str) -> bool:
         try:
             query = Document.delete().where((Document.name == name))
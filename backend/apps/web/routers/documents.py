@@ -14,11 +14,9 @@ from apps.web.models.documents import (
     DocumentResponse,
 )
 
-from config import (
-    CHROMA_CLIENT,
-    SRC_LOG_LEVELS
-)
+from config import SRC_LOG_LEVELS
 
+from apps.rag.main import delete_collection
 from utils.utils import get_current_user, get_admin_user
 from constants import ERROR_MESSAGES
 
@@ -168,7 +166,7 @@ async def delete_doc_by_name(name: str, user=Depends(get_admin_user)):
     if doc:
         collection_name = doc.collection_name
         log.debug(f"Deleting vector data of the collection {collection_name} of the document {name}")
-        result = CHROMA_CLIENT.delete_collection(name=collection_name)
+        delete_collection(collection_name)
     
     log.debug(f"Deleting file and metadata of the document {name}")
     result = Documents.delete_doc_by_name(name)
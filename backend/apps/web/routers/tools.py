@@ -4,7 +4,9 @@ from typing import List, Union, Optional
 
 from fastapi import APIRouter
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 import json
+import logging
 
 from apps.web.models.tools import Tools, ToolForm, ToolModel, ToolResponse
 from apps.web.utils import load_toolkit_module_by_id
@@ -15,7 +17,10 @@ from constants import ERROR_MESSAGES
 from importlib import util
 import os
 
-from config import DATA_DIR
+from config import DATA_DIR, SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
 
 
 TOOLS_DIR = f"{DATA_DIR}/tools"
@@ -24,6 +29,16 @@ os.makedirs(TOOLS_DIR, exist_ok=True)
 
 router = APIRouter()
 
+
+async def rebuild_tool_intents(request: Request, toolkit: ToolModel):
+    classifier = request.app.state.TOOLS_CLASSIFIER
+    if classifier:
+        try:
+            await run_in_threadpool(classifier.rebuild_tool, toolkit)
+        except Exception as e:
+            # Routing falls back to the LLM until the index is rebuilt
+            log.error(f"Error indexing tool intents of {toolkit.id}: {e}")
+
 ############################
 # GetToolkits
 ############################
@@ -79,6 +94,7 @@ async def create_new_toolkit(
             toolkit = Tools.insert_new_tool(form_data, specs)
 
             if toolkit:
+                await rebuild_tool_intents(request, toolkit)
                 return toolkit
             else:
                 raise HTTPException(
@@ -146,6 +162,7 @@ async def update_toolkit_by_id(
         toolkit = Tools.update_tool_by_id(id, updated)
 
         if toolkit:
+            await rebuild_tool_intents(request, toolkit)
             return toolkit
         else:
             raise HTTPException(
@@ -173,4 +190,7 @@ async def delete_toolkit_by_id(request: Request, id: str):
         TOOLS = request.app.state.TOOLS
         del TOOLS[id]
 
+        if request.app.state.TOOLS_CLASSIFIER:
+            request.app.state.TOOLS_CLASSIFIER.remove_tool(id)
+
     return result
@@ -213,6 +213,11 @@ if CUSTOM_NAME:
 UPLOAD_DIR = f"{DATA_DIR}/uploads"
 Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
 
+# Maximum upload sizes in MB (0 = unlimited), uploads are streamed to disk
+RAG_FILE_MAX_SIZE = int(os.environ.get("RAG_FILE_MAX_SIZE", "0"))
+AUDIO_FILE_MAX_SIZE = int(os.environ.get("AUDIO_FILE_MAX_SIZE", "0"))
+MODEL_FILE_MAX_SIZE = int(os.environ.get("MODEL_FILE_MAX_SIZE", "0"))
+
 
 ####################################
 # Cache DIR
@@ -306,6 +311,40 @@ OLLAMA_BASE_URLS = OLLAMA_BASE_URLS if OLLAMA_BASE_URLS != "" else OLLAMA_BASE_U
 
 OLLAMA_BASE_URLS = [url.strip() for url in OLLAMA_BASE_URLS.split(";")]
 
+# Pooled async http client used to proxy requests to the Ollama backends
+OLLAMA_CLIENT_MAX_CONNECTIONS = int(
+    os.environ.get("OLLAMA_CLIENT_MAX_CONNECTIONS", "512")
+)
+OLLAMA_CLIENT_KEEPALIVE_TIMEOUT = float(
+    os.environ.get("OLLAMA_CLIENT_KEEPALIVE_TIMEOUT", "30")
+)
+OLLAMA_CLIENT_CONNECT_TIMEOUT = float(
+    os.environ.get("OLLAMA_CLIENT_CONNECT_TIMEOUT", "10")
+)
+# Maximum time to wait between two chunks of a response (model loading included)
+OLLAMA_CLIENT_READ_TIMEOUT = float(os.environ.get("OLLAMA_CLIENT_READ_TIMEOUT", "600"))
+
+# least_inflight, ewma_latency, weighted_round_robin or random
+OLLAMA_LOAD_BALANCER_STRATEGY = os.environ.get(
+    "OLLAMA_LOAD_BALANCER_STRATEGY", "least_inflight"
+)
+
+# Semicolon separated weights matching the order of OLLAMA_BASE_URLS
+OLLAMA_BASE_URL_WEIGHTS = os.environ.get("OLLAMA_BASE_URL_WEIGHTS", "")
+OLLAMA_BASE_URL_WEIGHTS = (
+    [float(weight.strip()) for weight in OLLAMA_BASE_URL_WEIGHTS.split(";")]
+    if OLLAMA_BASE_URL_WEIGHTS != ""
+    else []
+)
+
+# Interval in seconds for polling the models loaded on each backend (0 disables)
+OLLAMA_RESIDENCY_POLL_INTERVAL = float(
+    os.environ.get("OLLAMA_RESIDENCY_POLL_INTERVAL", "10")
+)
+# Backends with the model loaded are preferred until they have this many
+# requests in flight (per unit of weight), then cold backends share the load
+OLLAMA_WARM_MAX_INFLIGHT = float(os.environ.get("OLLAMA_WARM_MAX_INFLIGHT", "4"))
+
 
 ####################################
 # OPENAI_API
@@ -346,6 +385,53 @@ except:
 OPENAI_API_BASE_URL = "https://api.openai.com/v1"
 
 
+####################################
+# MODEL REGISTRY
+####################################
+
+# Seconds a cached model list is served before it is refreshed in the background
+MODEL_REGISTRY_TTL = float(os.environ.get("MODEL_REGISTRY_TTL", "60"))
+MODEL_REGISTRY_REFRESH_INTERVAL = float(
+    os.environ.get("MODEL_REGISTRY_REFRESH_INTERVAL", "30")
+)
+# Upper bound of the backoff applied to backends that fail to list their models
+MODEL_REGISTRY_MAX_BACKOFF = float(os.environ.get("MODEL_REGISTRY_MAX_BACKOFF", "300"))
+
+
+####################################
+# UPSTREAM HEALTH CHECKS
+####################################
+
+# Interval in seconds between health probes of each upstream (0 disables probing)
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", "15"))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", "5"))
+
+# Consecutive failures before an upstream is ejected
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "3")
+)
+# Seconds an ejected upstream waits before traffic is re-admitted
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = float(
+    os.environ.get("CIRCUIT_BREAKER_RECOVERY_TIMEOUT", "30")
+)
+# Successes needed while re-admitting traffic before the upstream is fully healthy
+CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES = int(
+    os.environ.get("CIRCUIT_BREAKER_HALF_OPEN_SUCCESSES", "3")
+)
+
+
+####################################
+# REQUEST CANCELLATION
+####################################
+
+# "memory" cancels streams of the worker handling the cancel request only,
+# "redis" broadcasts cancellations to every uvicorn worker
+CANCELLATION_BACKEND = os.environ.get("CANCELLATION_BACKEND", "memory")
+CANCELLATION_REDIS_URL = os.environ.get(
+    "CANCELLATION_REDIS_URL", "redis://localhost:6379/0"
+)
+
+
 ####################################
 # WEBUI
 ####################################
@@ -478,6 +564,110 @@ RAG_EMBEDDING_MODEL_TRUST_REMOTE_CODE = (
     os.environ.get("RAG_EMBEDDING_MODEL_TRUST_REMOTE_CODE", "").lower() == "true"
 )
 
+# Texts per embedding request (OpenAI) or per progress step (Ollama, local)
+RAG_EMBEDDING_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_BATCH_SIZE", "64"))
+# Concurrent single-text requests when embedding a batch with Ollama
+RAG_EMBEDDING_CONCURRENCY = int(os.environ.get("RAG_EMBEDDING_CONCURRENCY", "4"))
+RAG_EMBEDDING_MAX_RETRIES = int(os.environ.get("RAG_EMBEDDING_MAX_RETRIES", "3"))
+# Seconds before the first retry, doubled on every following attempt
+RAG_EMBEDDING_RETRY_BACKOFF = float(
+    os.environ.get("RAG_EMBEDDING_RETRY_BACKOFF", "1")
+)
+
+# Local SentenceTransformer: texts of concurrent requests are coalesced into
+# batches of up to RAG_EMBEDDING_SERVER_BATCH_SIZE, waiting at most
+# RAG_EMBEDDING_SERVER_MAX_WAIT seconds for more to arrive
+RAG_EMBEDDING_SERVER_BATCH_SIZE = int(
+    os.environ.get("RAG_EMBEDDING_SERVER_BATCH_SIZE", "64")
+)
+RAG_EMBEDDING_SERVER_MAX_WAIT = float(
+    os.environ.get("RAG_EMBEDDING_SERVER_MAX_WAIT", "0.01")
+)
+# Encode with a pool of this many processes (0 or 1 = in-process)
+RAG_EMBEDDING_SERVER_PROCESSES = int(
+    os.environ.get("RAG_EMBEDDING_SERVER_PROCESSES", "0")
+)
+
+# Embeddings are cached per (engine, model, sha256(text)) in memory and on disk
+ENABLE_RAG_EMBEDDING_CACHE = (
+    os.environ.get("ENABLE_RAG_EMBEDDING_CACHE", "True").lower() == "true"
+)
+# Embeddings kept in the in-process LRU tier
+RAG_EMBEDDING_CACHE_SIZE = int(os.environ.get("RAG_EMBEDDING_CACHE_SIZE", "10000"))
+
+# Background threads running document ingestion jobs, and how often a
+# failed job is retried
+RAG_INGESTION_WORKERS = int(os.environ.get("RAG_INGESTION_WORKERS", "2"))
+RAG_INGESTION_MAX_RETRIES = int(os.environ.get("RAG_INGESTION_MAX_RETRIES", "2"))
+
+# Processes loading the files of a DOCS_DIR scan (0 or 1 = in the scan thread)
+RAG_SCAN_PROCESSES = int(os.environ.get("RAG_SCAN_PROCESSES", "4"))
+# Seconds between automatic scans of DOCS_DIR (0 = only scan on request)
+RAG_SCAN_WATCH_INTERVAL = int(os.environ.get("RAG_SCAN_WATCH_INTERVAL", "0"))
+
+# Processes extracting the pages of an uploaded PDF (0 or 1 = in-process)
+RAG_PDF_PROCESSES = int(os.environ.get("RAG_PDF_PROCESSES", "4"))
+# Extract tables of PDFs with Camelot, disable for a fast text-only ingest
+RAG_PDF_EXTRACT_TABLES = (
+    os.environ.get("RAG_PDF_EXTRACT_TABLES", "True").lower() == "true"
+)
+# PDFs whose extracted pages are kept in CACHE_DIR/pdf, least recently used
+# ones are dropped past it
+RAG_PDF_CACHE_MAX_FILES = int(os.environ.get("RAG_PDF_CACHE_MAX_FILES", "200"))
+
+# Worker threads embedding and reranking for chats, shared by all requests
+RAG_EMBEDDING_WORKERS = int(os.environ.get("RAG_EMBEDDING_WORKERS", "2"))
+RAG_RERANKING_WORKERS = int(os.environ.get("RAG_RERANKING_WORKERS", "4"))
+# Chat requests augmented with retrieved context at once, shared by all requests
+RAG_REQUEST_WORKERS = int(os.environ.get("RAG_REQUEST_WORKERS", "16"))
+
+# Collections queried concurrently, shared by all requests
+RAG_RETRIEVAL_CONCURRENCY = int(os.environ.get("RAG_RETRIEVAL_CONCURRENCY", "8"))
+# Seconds a request may spend retrieving, slower collections are skipped (0 = no limit)
+RAG_RETRIEVAL_TIMEOUT = float(os.environ.get("RAG_RETRIEVAL_TIMEOUT", "10"))
+
+# Opt-in cache serving stored completions to RAG questions similar to a
+# question already answered with the same docs, model and RAG template
+ENABLE_RAG_ANSWER_CACHE = (
+    os.environ.get("ENABLE_RAG_ANSWER_CACHE", "False").lower() == "true"
+)
+RAG_ANSWER_CACHE_THRESHOLD = float(
+    os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", "0.95")
+)
+RAG_ANSWER_CACHE_TTL = int(os.environ.get("RAG_ANSWER_CACHE_TTL", "3600"))
+RAG_ANSWER_CACHE_MAX_ENTRIES = int(
+    os.environ.get("RAG_ANSWER_CACHE_MAX_ENTRIES", "1000")
+)
+
+# Chunks are fingerprinted (SHA-256 and 64 bit SimHash) when stored: exact
+# duplicates within a document are dropped, exact duplicates of another
+# document reuse its embedding. Near duplicates (at most RAG_DEDUP_MAX_DISTANCE
+# bits apart, up to 3) are embedded again, they only count as boilerplate
+ENABLE_RAG_DEDUP = os.environ.get("ENABLE_RAG_DEDUP", "True").lower() == "true"
+RAG_DEDUP_MAX_DISTANCE = int(os.environ.get("RAG_DEDUP_MAX_DISTANCE", "3"))
+# Drop chunks already stored in RAG_DEDUP_BOILERPLATE_COLLECTIONS other
+# collections, like headers, footers and signature blocks
+RAG_DEDUP_DROP_BOILERPLATE = (
+    os.environ.get("RAG_DEDUP_DROP_BOILERPLATE", "False").lower() == "true"
+)
+RAG_DEDUP_BOILERPLATE_COLLECTIONS = int(
+    os.environ.get("RAG_DEDUP_BOILERPLATE_COLLECTIONS", "5")
+)
+
+# Chunks of the persisted per-collection BM25 indexes kept loaded in memory
+RAG_BM25_MAX_CACHED_CHUNKS = int(os.environ.get("RAG_BM25_MAX_CACHED_CHUNKS", "50000"))
+
+# Pairs of concurrent requests scored in one cross-encoder batch, and the
+# seconds the batch waits for more pairs after the first one arrived
+RAG_RERANKING_BATCH_SIZE = int(os.environ.get("RAG_RERANKING_BATCH_SIZE", "64"))
+RAG_RERANKING_MAX_WAIT = float(os.environ.get("RAG_RERANKING_MAX_WAIT", "0.01"))
+# Reranking scores cached per (query, chunk id)
+RAG_RERANKING_CACHE_SIZE = int(os.environ.get("RAG_RERANKING_CACHE_SIZE", "10000"))
+# Hybrid search candidates reranked per collection, best fused rank first (0 = all)
+RAG_RERANKING_MAX_CANDIDATES = int(
+    os.environ.get("RAG_RERANKING_MAX_CANDIDATES", "50")
+)
+
 RAG_RERANKING_MODEL = os.environ.get("RAG_RERANKING_MODEL", "")
 if not RAG_RERANKING_MODEL == "":
     log.info(f"Reranking model set: {RAG_RERANKING_MODEL}"),
@@ -518,6 +708,13 @@ else:
 
 CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "1500"))
 CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "400"))
+# Unit of CHUNK_SIZE and CHUNK_OVERLAP: "character", or "token" to measure
+# chunks with the tokenizer of the embedding model, never longer than the
+# model embeds
+RAG_TEXT_SPLITTER = os.environ.get("RAG_TEXT_SPLITTER", "character")
+# Chunks embedded and stored at a time while a document is ingested, only
+# this many are held in memory whatever the size of the document
+RAG_INGESTION_BATCH_SIZE = int(os.environ.get("RAG_INGESTION_BATCH_SIZE", "256"))
 
 DEFAULT_RAG_TEMPLATE = """Use the following context as your learned knowledge, inside <context></context> XML tags.
 <context>
@@ -667,6 +864,74 @@ INITIAL_TOOLKITS = os.environ.get(
 
 INITIAL_TOOLKITS = json.loads(INITIAL_TOOLKITS)
 
+# "combined" asks the task model about every toolkit in a single call,
+# "parallel" runs one call per toolkit concurrently
+TOOLS_ROUTING_MODE = os.environ.get("TOOLS_ROUTING_MODE", "combined")
+
+# Keywords a query must share with a toolkit's descriptions before the task
+# model is asked about it (0 disables the prefilter)
+TOOLS_PREFILTER_MIN_OVERLAP = int(os.environ.get("TOOLS_PREFILTER_MIN_OVERLAP", "1"))
+
+# Local embedding classifier deciding whether a query calls a tool before the
+# task model is asked, see utils/tool_classifier.py
+ENABLE_TOOLS_INTENT_CLASSIFIER = (
+    os.environ.get("ENABLE_TOOLS_INTENT_CLASSIFIER", "False").lower() == "true"
+)
+# In shadow mode the classifier only logs its decision next to the LLM's, the
+# LLM still decides every tool call. Turn it off once the thresholds below
+# are tuned on those logs for the configured RAG embedding model.
+TOOLS_INTENT_SHADOW_MODE = (
+    os.environ.get("TOOLS_INTENT_SHADOW_MODE", "True").lower() == "true"
+)
+# Cosine similarities between the query and the closest function description
+# or example query, in the scale of the RAG embedding model:
+# - below TOOLS_INTENT_LOW_THRESHOLD no tool is called, the LLM is not asked
+# - at or above TOOLS_INTENT_HIGH_THRESHOLD (and above the closest "none"
+#   example) the closest function is called without asking the LLM
+# - in between, the LLM is asked about the toolkits scoring above the low one
+# The defaults are not calibrated, models differ widely in their scale.
+TOOLS_INTENT_LOW_THRESHOLD = float(os.environ.get("TOOLS_INTENT_LOW_THRESHOLD", "0.3"))
+TOOLS_INTENT_HIGH_THRESHOLD = float(
+    os.environ.get("TOOLS_INTENT_HIGH_THRESHOLD", "0.8")
+)
+
+# Labelled example queries per function name, "none" lists queries that must
+# not call any tool
+TOOLS_INTENT_EXAMPLES = os.environ.get(
+    "TOOLS_INTENT_EXAMPLES",
+    json.dumps(
+        {
+            "display_leave_application": [
+                "I want to apply for annual leave",
+                "How do I submit a sick leave request?",
+                "I need to take maternity leave, where is the form?",
+                "Apply for leave next week",
+                "Can you open the leave application form?",
+            ],
+            "request_hr_document": [
+                "I need a salary certificate",
+                "Please provide a bank letter",
+                "Can I get a salary certificate in Arabic?",
+                "Generate a no objection certificate for me",
+                "I would like to request a job letter",
+                "I need a salary transfer letter for my bank",
+                "Request a golden visa application letter",
+            ],
+            "none": [
+                "How many days of annual leave do I get?",
+                "What is the probation period?",
+                "Has my leave request been approved?",
+                "What does a job letter include?",
+                "Has my salary certificate been issued?",
+                "What is the sick leave policy?",
+                "Hello",
+                "What are the IT support hours?",
+            ],
+        }
+    ),
+)
+TOOLS_INTENT_EXAMPLES = json.loads(TOOLS_INTENT_EXAMPLES)
+
 
 ####################################
 # Microsoft SQL Server Database
@@ -49,6 +49,9 @@ class ERROR_MESSAGES(str, Enum):
     )
 
     FILE_NOT_SENT = "FILE_NOT_SENT"
+    FILE_TOO_LARGE = (
+        lambda size="": f"Oops! The file exceeds the maximum upload size of {size}."
+    )
     FILE_NOT_SUPPORTED = "Oops! It seems like the file format you're trying to upload is not supported. Please upload a file with a supported format (e.g., JPG, PNG, PDF, TXT) and try again."
 
     NOT_FOUND = "We could not find what you're looking for :/"
@@ -66,6 +69,7 @@ class ERROR_MESSAGES(str, Enum):
     MODEL_NOT_FOUND = lambda name="": f"Model '{name}' was not found"
     OPENAI_NOT_FOUND = lambda name="": "OpenAI API was not found"
     OLLAMA_NOT_FOUND = "WebUI could not connect to Ollama"
+    BACKEND_UNAVAILABLE = lambda name="": f"No healthy backend is currently available for '{name}'. Please try again in a few moments."
     CREATE_API_KEY_ERROR = "Oops! Something went wrong while creating your API key. Please try again later. If the issue persists, contact support for assistance."
 
     EMPTY_CONTENT = "The content provided is empty. Please ensure that there is text or data present before proceeding."
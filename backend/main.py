@@ -1,4 +1,5 @@
 from bs4 import BeautifulSoup
+import copy
 import json
 import markdown
 import time
@@ -16,26 +17,36 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers
 from starlette.responses import StreamingResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from apps.ollama.main import (
     app as ollama_app,
     OpenAIChatCompletionForm,
     generate_openai_chat_completion as generate_ollama_chat_completion,
+    start_residency_monitor,
+    start_model_registry as start_ollama_model_registry,
+    start_health_checks as start_ollama_health_checks,
+    start_cancellation_listener,
+)
+from apps.openai.main import (
+    app as openai_app,
+    start_model_registry as start_openai_model_registry,
+    start_health_checks as start_openai_health_checks,
 )
-from apps.openai.main import app as openai_app
 
 from apps.litellm.main import (
     app as litellm_app,
     start_litellm_background,
     shutdown_litellm_background,
+    start_model_registry as start_litellm_model_registry,
 )
 
 
 from apps.audio.main import app as audio_app
 from apps.images.main import app as images_app
-from apps.rag.main import app as rag_app
+from apps.rag.main import app as rag_app, start_docs_watcher
 from apps.web.main import app as webui_app
 
 import asyncio
@@ -49,12 +60,22 @@ from utils.utils import (
     get_current_user,
     get_http_authorization_cred,
 )
-from apps.rag.utils import rag_messages
+from apps.rag.utils import rag_messages_async
+from apps.rag.executors import EMBEDDING_EXECUTOR
+from apps.rag.answer_cache import (
+    CachedAnswer,
+    get_answer_content,
+    get_cached_answer_chunks,
+    get_docs_scope,
+)
 
 from utils.misc import get_last_user_message
 
 from apps.web.models.tools import Tools
-from apps.web.utils import load_toolkit_module_by_id, tools_function_calling_generation_template
+from apps.web.utils import load_toolkit_module_by_id
+from utils.tools import ToolsPromptCache, get_function_tool_ids
+from utils.tool_classifier import ToolIntent, ToolIntentClassifier
+from starlette.concurrency import run_in_threadpool
 
 from config import (
     CONFIG_DATA,
@@ -74,6 +95,13 @@ from config import (
     ENABLE_ADMIN_EXPORT,
     MAX_CITATION_DISTANCE,
     TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+    TOOLS_ROUTING_MODE,
+    TOOLS_PREFILTER_MIN_OVERLAP,
+    ENABLE_TOOLS_INTENT_CLASSIFIER,
+    TOOLS_INTENT_SHADOW_MODE,
+    TOOLS_INTENT_LOW_THRESHOLD,
+    TOOLS_INTENT_HIGH_THRESHOLD,
+    TOOLS_INTENT_EXAMPLES,
     INITIAL_TOOLKITS
 )
 from constants import ERROR_MESSAGES
@@ -149,15 +177,28 @@ async def initialize_toolkits():
         else:
             log.info(f"{toolkit_id} toolkit already exists.")
 
-async def get_function_call_response(prompt, tool_id, template, task_model_id, user):
-    tool = Tools.get_tool_by_id(tool_id)
-    tools_specs = json.dumps(tool.specs, indent=2)
-    tools_specs_dict = json.loads(tools_specs)
-    for tool in tools_specs_dict:
-        if "parameters" in tool:
-            tool["parameters"] = {}
-    modified_tools_specs = json.dumps(tools_specs_dict, indent=2)
-    content = tools_function_calling_generation_template(template, modified_tools_specs)
+TOOLS_PROMPT_CACHE = ToolsPromptCache()
+
+# Functions whose parameters are filled in by the server, not by the model
+SERVER_FILLED_FUNCTIONS = ["display_leave_application", "request_hr_document"]
+
+if ENABLE_TOOLS_INTENT_CLASSIFIER:
+    webui_app.state.TOOLS_CLASSIFIER = ToolIntentClassifier(
+        path=f"{CACHE_DIR}/tools/intent_index.json",
+        get_embedding_function=lambda: (
+            f"{rag_app.state.RAG_EMBEDDING_ENGINE}:{rag_app.state.RAG_EMBEDDING_MODEL}",
+            rag_app.state.EMBEDDING_FUNCTION,
+        ),
+        examples=TOOLS_INTENT_EXAMPLES,
+        low=TOOLS_INTENT_LOW_THRESHOLD,
+        high=TOOLS_INTENT_HIGH_THRESHOLD,
+    )
+
+
+async def get_tool_call(prompt, tools, template, task_model_id, user):
+    """Asks the task model which function of `tools`, if any, the prompt calls."""
+    function_tool_ids = get_function_tool_ids(tools)
+    content = TOOLS_PROMPT_CACHE.get_prompt(tools, template)
 
     payload = {
         "model": task_model_id,
@@ -167,10 +208,7 @@ async def get_function_call_response(prompt, tool_id, template, task_model_id, u
         ],
         "stream": False,
     }
-    print(f'user info: {user}')
-    print(f'user extra sso info: {user.extra_sso}')
 
-    response = None
     try:
         response = await generate_ollama_chat_completion(
             OpenAIChatCompletionForm(**payload), user=user
@@ -180,189 +218,406 @@ async def get_function_call_response(prompt, tool_id, template, task_model_id, u
         async for chunk in response.body_iterator:
             data = json.loads(chunk.decode("utf-8"))
             content = data["choices"][0]["message"]["content"]
-        log.info(f'the data from the call: {data}')
+        log.info(f"the data from the call: {data}")
         # Cleanup any remaining background tasks if necessary
         if response.background is not None:
             await response.background()
 
         # Parse the function response
-        if content is not None:
+        if content:
             result = json.loads(content)
-
-            # Call the function
-            if "name" in result:
-                if tool_id in webui_app.state.TOOLS:
-                    toolkit_module = webui_app.state.TOOLS[tool_id]
-                else:
-                    toolkit_module = load_toolkit_module_by_id(tool_id)
-                    webui_app.state.TOOLS[tool_id] = toolkit_module
-
-                function = getattr(toolkit_module, result["name"])
-                function_result = None
-                try:
-                    if result["name"] in ['display_leave_application', 'request_hr_document']:
-                        result["parameters"] = {}
-                        if user.extra_sso:
-                            extra_sso_dict = json.loads(user.extra_sso)
-                            user_type = extra_sso_dict.get("contract_type").lower() if extra_sso_dict.get("contract_type") else 'ad_user'
-                            print(f"FINAL user_type: {user_type}")
-                            result["parameters"]["user_type"] = user_type
-                        else: 
-                            result["parameters"]["user_type"] = None
-                        log.info(f'final resuls: {result}')
-                    function_result = function(**result["parameters"])
-                except Exception as e:
-                    print(e)
-
-                if function_result:
-                    response = {
-                        "model": data.get('model'),
-                        "created_at": data.get('created'),
-                        "message": {
-                            "role": "assistant",
-                            "content": function_result
-                        },
-                        "done_reason": "stop",
-                        "done": True,
-                    }
-                    return response
+            if "name" in result and result["name"] in function_tool_ids:
+                return function_tool_ids[result["name"]], result, data
     except Exception as e:
-        print(f"Error from the function call response: {e}")
+        log.error(f"Error from the function call response: {e}")
 
     return None
 
 
-class RAGMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        return_citations = False
+def call_tool_function(tool_id, result, data, user):
+    if tool_id in webui_app.state.TOOLS:
+        toolkit_module = webui_app.state.TOOLS[tool_id]
+    else:
+        toolkit_module = load_toolkit_module_by_id(tool_id)
+        webui_app.state.TOOLS[tool_id] = toolkit_module
 
-        if request.method == "POST" and (
-            "/api/chat" in request.url.path or "/chat/completions" in request.url.path
-        ):
-            log.debug(f"request.url.path: {request.url.path}")
-
-            # Read the original request body
-            body = await request.body()
-            # Decode body to string
-            body_str = body.decode("utf-8")
-            # Parse string to JSON
-            data = json.loads(body_str) if body_str else {}
-
-            return_citations = data.get("citations", False)
-            if "citations" in data:
-                del data["citations"]
-
-            tools = Tools.get_tools()
-
-            if tools:
-                task_model_id = data["model"]
-                
-                user = get_current_user(
-                    get_http_authorization_cred(request.headers.get("Authorization"))
+    function = getattr(toolkit_module, result["name"])
+    function_result = None
+    try:
+        if result["name"] in SERVER_FILLED_FUNCTIONS:
+            result["parameters"] = {}
+            if user.extra_sso:
+                extra_sso_dict = json.loads(user.extra_sso)
+                user_type = (
+                    extra_sso_dict.get("contract_type").lower()
+                    if extra_sso_dict.get("contract_type")
+                    else "ad_user"
                 )
-                prompt = get_last_user_message(data["messages"])
-                context = ""
-
-                for tool in tools:
-                    response = await get_function_call_response(
-                        prompt=prompt,
-                        tool_id=tool.id,
-                        template=TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
-                        task_model_id=task_model_id,
-                        user=user,
-                    )
+                log.debug(f"FINAL user_type: {user_type}")
+                result["parameters"]["user_type"] = user_type
+            else:
+                result["parameters"]["user_type"] = None
+            log.info(f"final resuls: {result}")
+        function_result = function(**result.get("parameters", {}))
+    except Exception as e:
+        log.error(e)
+
+    if function_result:
+        return {
+            "model": data.get("model"),
+            "created_at": data.get("created"),
+            "message": {"role": "assistant", "content": function_result},
+            "done_reason": "stop",
+            "done": True,
+        }
+
+    return None
+
+
+async def classify_tool_intent(prompt, tools):
+    classifier = webui_app.state.TOOLS_CLASSIFIER
+    if classifier is None:
+        return None
+
+    if classifier.is_stale(tools):
+        # Route through the LLM until the index caught up
+        classifier.schedule_rebuild(tools)
+        return None
+
+    try:
+        return await run_in_threadpool(classifier.classify, prompt)
+    except Exception as e:
+        log.error(f"Error classifying tool intent: {e}")
+        return None
+
+
+def log_shadow_tool_intent(intent, tool_call):
+    """Logs what the classifier would have done next to the LLM's choice."""
+    if intent is None:
+        return
+
+    best = intent.best
+    best_score = intent.scores[best] if best else 0.0
+    llm_choice = f"{tool_call[0]}.{tool_call[1]['name']}" if tool_call else "none"
+    log.info(
+        f"tool intent (shadow): {intent.decision} "
+        f"{'.'.join(best) if best else 'none'} {best_score:.3f} "
+        f"(none {intent.none_score:.3f}), LLM: {llm_choice}"
+    )
 
-                    if response:
-                        async def response_stream():
-                            # Yield the response as a single JSON object
-                            yield json.dumps(response)
-
-                        # Return as StreamingResponse
-                        return StreamingResponse(response_stream())
-
-            if "docs" in data:
-                data = {**data}
-                data["messages"], citations = rag_messages(
-                    docs=data["docs"],
-                    messages=data["messages"],
-                    template=rag_app.state.RAG_TEMPLATE,
-                    embedding_function=rag_app.state.EMBEDDING_FUNCTION,
-                    k=rag_app.state.TOP_K,
-                    reranking_function=rag_app.state.sentence_transformer_rf,
-                    r=rag_app.state.RELEVANCE_THRESHOLD,
-                    hybrid_search=rag_app.state.ENABLE_RAG_HYBRID_SEARCH,
+
+async def get_function_call_response(prompt, tools, template, task_model_id, user):
+    intent = await classify_tool_intent(prompt, tools)
+    shadow_intent = None
+    if intent is not None and TOOLS_INTENT_SHADOW_MODE:
+        # Logged next to the LLM's choice below, the LLM decides
+        shadow_intent, intent = intent, None
+
+    if intent is not None:
+        if intent.decision == ToolIntent.NONE:
+            return None
+
+        if intent.decision == ToolIntent.MATCH:
+            tool_id, name = intent.best
+            tool = next(tool for tool in tools if tool.id == tool_id)
+            spec = next(spec for spec in tool.specs if spec["name"] == name)
+
+            # Without model filled parameters there is nothing left to ask
+            if name in SERVER_FILLED_FUNCTIONS or not spec.get(
+                "parameters", {}
+            ).get("required"):
+                data = {"model": task_model_id, "created": int(time.time())}
+                return call_tool_function(
+                    tool_id, {"name": name, "parameters": {}}, data, user
                 )
-                del data["docs"]
 
-                log.debug(
-                    f"data['messages']: {data['messages']}, citations: {citations}"
+        # Only ask about the toolkits the query is close to
+        tool_ids = {
+            tool_id
+            for (tool_id, _), score in intent.scores.items()
+            if score >= TOOLS_INTENT_LOW_THRESHOLD
+        }
+        if tool_ids:
+            tools = [tool for tool in tools if tool.id in tool_ids]
+
+    # Toolkits sharing no keyword with the query are not worth an LLM call,
+    # unless no toolkit shares one (a paraphrase)
+    tools = TOOLS_PROMPT_CACHE.prefilter(tools, prompt, TOOLS_PREFILTER_MIN_OVERLAP)
+    if not tools:
+        log_shadow_tool_intent(shadow_intent, None)
+        return None
+
+    if TOOLS_ROUTING_MODE == "combined" and get_function_tool_ids(tools) is not None:
+        groups = [tools]
+    else:
+        groups = [[tool] for tool in tools]
+
+    tool_calls = await asyncio.gather(
+        *[
+            get_tool_call(prompt, group, template, task_model_id, user)
+            for group in groups
+        ]
+    )
+    log_shadow_tool_intent(
+        shadow_intent,
+        next((tool_call for tool_call in tool_calls if tool_call), None),
+    )
+
+    # Only the first toolkit (in toolkit order) that matched is executed
+    for tool_call in tool_calls:
+        if tool_call:
+            tool_id, result, data = tool_call
+            response = call_tool_function(tool_id, result, data, user)
+            if response:
+                return response
+
+    return None
+
+
+def filter_citations(citations):
+    log.info(f"check score: {citations}")
+
+    # Function to remove indices from a list if it is not None
+    def remove_indices(lst, indices):
+        return [item for i, item in enumerate(lst) if i not in indices]
+
+    # Get the indices where distances are greater than 1
+    indices_to_remove = [
+        i
+        for i, distance in enumerate(citations[0]["distances"])
+        if distance > MAX_CITATION_DISTANCE
+    ]
+
+    # List of keys to check and filter
+    keys_to_filter = ["metadata", "document"]
+
+    # Loop through each key and remove indices if the list is not None
+    for key in keys_to_filter:
+        if citations[0][key] is not None:
+            if isinstance(citations[0][key], list):
+                citations[0][key] = remove_indices(citations[0][key], indices_to_remove)
+
+    return citations
+
+
+class RAGMiddleware:
+    """
+    Pure ASGI middleware: the response is streamed straight through instead of
+    being re-wrapped chunk by chunk, and chat requests without docs, citations
+    or tools are replayed to the app as received, without copying the body.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and ("/api/chat" in scope["path"] or "/chat/completions" in scope["path"])
+        ):
+            return await self.app(scope, receive, send)
+
+        log.debug(f"request.url.path: {scope['path']}")
+
+        # Read the original request body
+        messages = []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request" or not message.get("more_body"):
+                break
+
+        chunks = [message.get("body", b"") for message in messages]
+        body = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+        tools = Tools.get_tools()
+
+        # Keys can only appear unescaped in the raw JSON, no need to parse it
+        if not tools and b'"docs"' not in body and b'"citations"' not in body:
+            return await self.app(scope, replay_receive(messages, receive), send)
+
+        data = json.loads(body) if body else {}
+
+        return_citations = data.pop("citations", False)
+        citations = []
+
+        if tools:
+            task_model_id = data["model"]
+
+            user = get_current_user(
+                get_http_authorization_cred(Headers(scope=scope).get("Authorization"))
+            )
+            prompt = get_last_user_message(data["messages"])
+
+            response = await get_function_call_response(
+                prompt=prompt,
+                tools=tools,
+                template=TOOLS_FUNCTION_CALLING_PROMPT_TEMPLATE,
+                task_model_id=task_model_id,
+                user=user,
+            )
+
+            if response:
+
+                async def response_stream():
+                    # Yield the response as a single JSON object
+                    yield json.dumps(response)
+
+                # Return as StreamingResponse
+                return await StreamingResponse(response_stream())(
+                    scope, receive, send
                 )
 
-            modified_body_bytes = json.dumps(data).encode("utf-8")
+        answer_cache = rag_app.state.ANSWER_CACHE
+        cache_scope = None
 
-            # Replace the request body with the modified one
-            request._body = modified_body_bytes
+        if "docs" in data and answer_cache is not None:
+            prompt = get_last_user_message(data["messages"])
+            if prompt:
+                cache_scope = answer_cache.get_scope(
+                    data["docs"], data.get("model"), rag_app.state.RAG_TEMPLATE
+                )
+                query_embedding = await EMBEDDING_EXECUTOR.arun(
+                    rag_app.state.EMBEDDING_FUNCTION, prompt
+                )
+
+                answer = answer_cache.lookup(cache_scope, query_embedding)
+                if answer is not None:
+                    log.info(f"Serving cached answer for: {prompt}")
+                    if return_citations and answer.citations:
+                        send = inject_citations(
+                            send, filter_citations(copy.deepcopy(answer.citations))
+                        )
+
+                    openai = "/chat/completions" in scope["path"]
+                    chunks, media_type = get_cached_answer_chunks(
+                        answer.content,
+                        data.get("model"),
+                        openai=openai,
+                        stream=data.get("stream", not openai),
+                    )
 
-            # Set custom header to ensure content-length matches new body length
-            request.headers.__dict__["_list"] = [
-                (b"content-length", str(len(modified_body_bytes)).encode("utf-8")),
-                *[
-                    (k, v)
-                    for k, v in request.headers.raw
-                    if k.lower() != b"content-length"
-                ],
-            ]
+                    async def answer_stream():
+                        for chunk in chunks:
+                            yield chunk
+
+                    return await StreamingResponse(
+                        answer_stream(), media_type=media_type
+                    )(scope, receive, send)
+
+        if "docs" in data:
+            collection_names, _ = get_docs_scope(data["docs"])
+            data["messages"], citations = await rag_messages_async(
+                docs=data["docs"],
+                messages=data["messages"],
+                template=rag_app.state.RAG_TEMPLATE,
+                embedding_function=rag_app.state.EMBEDDING_FUNCTION,
+                k=rag_app.state.TOP_K,
+                reranking_function=rag_app.state.RERANKING_FUNCTION,
+                r=rag_app.state.RELEVANCE_THRESHOLD,
+                hybrid_search=rag_app.state.ENABLE_RAG_HYBRID_SEARCH,
+            )
+            del data["docs"]
+
+            log.debug(f"data['messages']: {data['messages']}, citations: {citations}")
+
+        body = json.dumps(data).encode("utf-8")
+
+        # Set custom header to ensure content-length matches new body length
+        scope = {
+            **scope,
+            "headers": [
+                (b"content-length", str(len(body)).encode("utf-8")),
+                *[(k, v) for k, v in scope["headers"] if k.lower() != b"content-length"],
+            ],
+        }
+        receive = replay_receive(
+            [{"type": "http.request", "body": body, "more_body": False}], receive
+        )
 
-        response = await call_next(request)
+        if cache_scope is not None:
+            send = capture_answer(
+                send,
+                lambda content: answer_cache.store(
+                    cache_scope,
+                    CachedAnswer(
+                        query_embedding,
+                        content,
+                        collection_names,
+                        copy.deepcopy(citations),
+                    ),
+                ),
+            )
 
         if return_citations and citations != []:
-          
-            log.info(f"check score: {citations}")
-
-            # Function to remove indices from a list if it is not None
-            def remove_indices(lst, indices):
-                return [item for i, item in enumerate(lst) if i not in indices]
-
-            # Get the indices where distances are greater than 1
-            indices_to_remove = [i for i, distance in enumerate(citations[0]['distances']) if distance > MAX_CITATION_DISTANCE]
-
-            # List of keys to check and filter
-            keys_to_filter = ['metadata', 'document']
-
-            # Loop through each key and remove indices if the list is not None
-            for key in keys_to_filter:
-                if citations[0][key] is not None:
-                    if isinstance(citations[0][key], list):
-                        citations[0][key] = remove_indices(citations[0][key], indices_to_remove)
-
-            
-            # Inject the citations into the response
-            if isinstance(response, StreamingResponse):
-                # If it's a streaming response, inject it as SSE event or NDJSON line
-                content_type = response.headers.get("Content-Type")
-                if "text/event-stream" in content_type:
-                    return StreamingResponse(
-                        self.openai_stream_wrapper(response.body_iterator, citations),
-                    )
-                if "application/x-ndjson" in content_type:
-                    return StreamingResponse(
-                        self.ollama_stream_wrapper(response.body_iterator, citations),
-                    )
+            send = inject_citations(send, filter_citations(citations))
+
+        await self.app(scope, receive, send)
+
+
+def replay_receive(messages: list, receive: Receive) -> Receive:
+    messages = list(messages)
+
+    async def _receive():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return _receive
+
+
+def capture_answer(send: Send, on_answer) -> Send:
+    """Passes the response through, then hands its completion to `on_answer`."""
+    status_code = None
+    content_type = ""
+    chunks = []
 
-        return response
+    async def _send(message):
+        nonlocal status_code, content_type
 
-    async def _receive(self, body: bytes):
-        return {"type": "http.request", "body": body, "more_body": False}
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+        elif message["type"] == "http.response.body" and status_code == 200:
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                content = get_answer_content(b"".join(chunks), content_type)
+                if content:
+                    on_answer(content)
 
-    async def openai_stream_wrapper(self, original_generator, citations):
-        yield f"data: {json.dumps({'citations': citations})}\n\n"
-        async for data in original_generator:
-            yield data
+        await send(message)
 
-    async def ollama_stream_wrapper(self, original_generator, citations):
-        yield f"{json.dumps({'citations': citations})}\n"
-        async for data in original_generator:
-            yield data
+    return _send
+
+
+def inject_citations(send: Send, citations) -> Send:
+    async def _send(message):
+        await send(message)
+
+        if message["type"] == "http.response.start":
+            # Inject the citations into the response as SSE event or NDJSON line
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+
+            prefix = None
+            if "content-length" in headers:
+                pass
+            elif "text/event-stream" in content_type:
+                prefix = f"data: {json.dumps({'citations': citations})}\n\n"
+            elif "application/x-ndjson" in content_type:
+                prefix = f"{json.dumps({'citations': citations})}\n"
+
+            if prefix:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": prefix.encode("utf-8"),
+                        "more_body": True,
+                    }
+                )
+
+    return _send
 
 
 app.add_middleware(RAGMiddleware)
@@ -391,6 +646,18 @@ async def check_url(request: Request, call_next):
 async def on_startup():
     if ENABLE_LITELLM:
         asyncio.create_task(start_litellm_background())
+    asyncio.create_task(start_residency_monitor())
+
+    # Keep the model lists warm so requests never wait on the backends
+    asyncio.create_task(start_ollama_model_registry())
+    asyncio.create_task(start_openai_model_registry())
+    asyncio.create_task(start_litellm_model_registry())
+
+    asyncio.create_task(start_ollama_health_checks())
+    asyncio.create_task(start_openai_health_checks())
+    asyncio.create_task(start_cancellation_listener())
+    rag_app.state.INGESTION_JOBS.start()
+    asyncio.create_task(start_docs_watcher())
     # Initialize toolkits
     await initialize_toolkits()
 
@@ -549,3 +816,10 @@ else:
 async def shutdown_event():
     if ENABLE_LITELLM:
         await shutdown_litellm_background()
+
+    await ollama_app.state.HTTP_CLIENTS.close()
+    await openai_app.state.HTTP_CLIENTS.close()
+    await litellm_app.state.HTTP_CLIENTS.close()
+    await ollama_app.state.CANCELLATION.close()
+    rag_app.state.INGESTION_JOBS.stop()
+    rag_app.state.EMBEDDING_SERVER.close()
@@ -0,0 +1,116 @@
+import os
+import sys
+
+# Add the backend root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from langchain_core.documents import Document
+
+from apps.rag.chunker import approximate_token_count, iter_chunks
+
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliett kilo lima "
+    "mike november oscar papa quebec romeo sierra tango uniform victor whiskey"
+).split()
+
+
+def make_text(words: int, offset: int = 0) -> str:
+    lines = []
+    for i in range(0, words, 12):
+        lines.append(
+            " ".join(WORDS[(offset + j) % len(WORDS)] for j in range(i, i + 12))
+        )
+    return ".\n".join(lines) + "."
+
+
+def test_chunks_respect_size_and_overlap():
+    text = make_text(600)
+    chunks = list(iter_chunks([Document(page_content=text)], 200, 50))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert 0 < len(chunk.page_content) <= 200
+        start = chunk.metadata["start_index"]
+        assert text[start : start + len(chunk.page_content)] == chunk.page_content
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        previous_end = previous.metadata["start_index"] + len(previous.page_content)
+        overlap = previous_end - chunk.metadata["start_index"]
+        assert 0 < overlap <= 50
+
+    # Nothing is left out
+    assert chunks[0].metadata["start_index"] == 0
+    assert chunks[-1].page_content.endswith(text[-20:])
+
+
+def test_chunks_are_measured_with_the_length_function():
+    text = make_text(600)
+    chunks = list(
+        iter_chunks(
+            [Document(page_content=text)],
+            60,
+            15,
+            length_function=approximate_token_count,
+        )
+    )
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert approximate_token_count(chunk.page_content) <= 60
+
+
+def test_chunks_run_over_pages():
+    pages = [
+        Document(page_content=make_text(40, offset=page), metadata={"page": page})
+        for page in range(3)
+    ]
+    chunks = list(iter_chunks(pages, 200, 40))
+
+    for chunk in chunks:
+        if "page_end" in chunk.metadata:
+            assert chunk.metadata["page"] < chunk.metadata["page_end"] <= 2
+
+    # A sentence split by a page break ends up in a chunk spanning both pages
+    assert any(chunk.metadata.get("page_end") for chunk in chunks)
+    assert {chunk.metadata["page"] for chunk in chunks} == {0, 1, 2}
+
+
+def test_tables_are_chunked_on_their_own():
+    table = "name: alpha | value: 1\nname: bravo | value: 2"
+    documents = [
+        Document(page_content=make_text(30), metadata={"page": 0}),
+        Document(page_content=table, metadata={"page": 0, "type": "tables"}),
+        Document(page_content=make_text(30, offset=5), metadata={"page": 1}),
+    ]
+    chunks = list(iter_chunks(documents, 1000, 100))
+
+    tables = [chunk for chunk in chunks if chunk.metadata.get("type") == "tables"]
+    texts = [chunk for chunk in chunks if "type" not in chunk.metadata]
+
+    assert [chunk.page_content for chunk in tables] == [table]
+    # The text around the table flows on as one chunk
+    assert len(texts) == 1
+    assert texts[0].metadata["page"] == 0 and texts[0].metadata["page_end"] == 1
+    assert "name: alpha" not in texts[0].page_content
+
+
+def test_metadata_is_kept_storable():
+    documents = [
+        Document(
+            page_content="Some text.",
+            metadata={"page": 0, "title": "Report", "coordinates": [1, 2]},
+        )
+    ]
+    [chunk] = iter_chunks(documents, 100, 10, file_path="/data/report.pdf")
+
+    assert chunk.metadata == {
+        "page": 0,
+        "title": "Report",
+        "source": "/data/report.pdf",
+        "start_index": 0,
+    }
+
+
+def test_empty_documents_have_no_chunks():
+    documents = [Document(page_content=" \n\n "), Document(page_content="")]
+    assert list(iter_chunks(documents, 100, 10)) == []
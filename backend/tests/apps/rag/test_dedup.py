@@ -0,0 +1,127 @@
+import os
+import sys
+
+import pytest
+
+# Add the backend root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from apps.rag.dedup import (
+    ChunkFingerprintStore,
+    Fingerprint,
+    get_distance,
+    get_simhash,
+)
+
+NAMESPACE = ":sentence-transformers/all-MiniLM-L6-v2"
+
+TEXT = (
+    "The quarterly report covers revenue, operating costs and headcount for "
+    "every region. Revenue grew in the northern and western regions while "
+    "the southern region stayed flat. Operating costs were reduced by moving "
+    "two data centers to a shared facility and by renegotiating the support "
+    "contracts. Headcount grew by twelve people, mostly in engineering and "
+    "customer support, and the hiring plan for next quarter is unchanged. "
+    "Sales in the northern region were driven by the renewal of three large "
+    "contracts with public hospitals, which together account for a fifth of "
+    "the revenue of the region. The western region signed its first customers "
+    "in the logistics sector after a pilot that ran for most of the spring. "
+    "Marketing spending was kept at the level of the previous quarter, with a "
+    "larger share going to events and a smaller one to online advertising. "
+    "The board approved the budget for the new office, which is expected to "
+    "open in the autumn and to host the growing customer support team. Cash "
+    "flow from operations was positive for the third quarter in a row, and "
+    "the company has no debt. The outlook for the rest of the year is stable, "
+    "with the main risk being delays in the public procurement processes that "
+    "several of the larger deals depend on."
+)
+# One word changed
+EDITED_TEXT = TEXT.replace("twelve", "fifteen")
+# Extracted again with other line breaks and casing
+REFLOWED_TEXT = TEXT.upper().replace(". ", ".\n")
+OTHER_TEXT = (
+    "To reset your password open the settings page, choose security and "
+    "follow the link sent to the email address of your account. The link "
+    "expires after one hour, after which a new one has to be requested."
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkFingerprintStore(str(tmp_path / "fingerprints.db"), max_distance=3)
+
+
+def test_simhash_ignores_case_and_punctuation():
+    assert get_simhash("Hello, World! How are you?") == get_simhash(
+        "hello world how are you"
+    )
+    assert get_simhash("") == 0
+
+
+def test_simhash_distance():
+    simhash = get_simhash(TEXT)
+    assert get_distance(simhash, get_simhash(REFLOWED_TEXT)) == 0
+    assert get_distance(simhash, get_simhash(EDITED_TEXT)) < 8
+    assert get_distance(simhash, get_simhash(OTHER_TEXT)) > 16
+
+
+def test_check_drops_exact_duplicates(store):
+    dedup = store.deduplicator(NAMESPACE, "a")
+
+    assert dedup.check(Fingerprint(TEXT), "1") == (True, None)
+    assert dedup.check(Fingerprint(TEXT), "2") == (False, None)
+    assert dedup.get_stats()["exact"] == 1
+
+
+def test_check_embeds_near_duplicates_again(store):
+    dedup = store.deduplicator(NAMESPACE, "a")
+    dedup.check(Fingerprint(TEXT), "1")
+
+    # Counted, but the wording differs from the stored chunk
+    assert dedup.check(Fingerprint(REFLOWED_TEXT), "2") == (True, None)
+    assert dedup.check(Fingerprint(OTHER_TEXT), "3") == (True, None)
+    assert dedup.get_stats()["near"] == 1
+    assert dedup.get_stats()["reused"] == 0
+
+
+def test_check_matches_other_collections(store):
+    dedup = store.deduplicator(NAMESPACE, "a")
+    fingerprint = Fingerprint(TEXT)
+    dedup.check(fingerprint, "1")
+    dedup.add(["1"], [fingerprint])
+
+    keep, match = store.deduplicator(NAMESPACE, "b").check(Fingerprint(TEXT), "9")
+    assert keep
+    assert (match.collection_name, match.chunk_id) == ("a", "1")
+
+    # A near duplicate of another collection is not reused
+    dedup = store.deduplicator(NAMESPACE, "b")
+    assert dedup.check(Fingerprint(REFLOWED_TEXT), "9") == (True, None)
+    assert dedup.get_stats()["near"] == 1
+
+    # Embeddings of another model are never reused
+    keep, match = store.deduplicator("openai:other", "b").check(Fingerprint(TEXT), "9")
+    assert keep and match is None
+
+
+def test_check_drops_boilerplate(tmp_path):
+    store = ChunkFingerprintStore(
+        str(tmp_path / "fingerprints.db"),
+        drop_boilerplate=True,
+        boilerplate_collections=2,
+    )
+    for collection_name in ["a", "b"]:
+        store.deduplicator(NAMESPACE, collection_name).add(
+            [f"{collection_name}1"], [Fingerprint(TEXT)]
+        )
+
+    dedup = store.deduplicator(NAMESPACE, "c")
+    assert dedup.check(Fingerprint(TEXT), "1") == (False, None)
+    # Near duplicates count as boilerplate too
+    assert dedup.check(Fingerprint(REFLOWED_TEXT), "2") == (False, None)
+    assert dedup.get_stats()["boilerplate"] == 2
+
+    # Removed from one collection, it is no longer boilerplate
+    store.remove("b", ["b1"])
+    keep, match = store.deduplicator(NAMESPACE, "d").check(Fingerprint(TEXT), "1")
+    assert keep and match.collection_name == "a"
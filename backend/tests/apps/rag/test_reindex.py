@@ -0,0 +1,124 @@
+import os
+import sys
+
+# Add the backend root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from langchain_core.documents import Document
+
+from apps.rag.reindex import (
+    ADDED,
+    MOVED,
+    UNCHANGED,
+    ChunkDiff,
+    get_chunk_id,
+    get_collection_metadata,
+    get_stamped_metadata,
+    get_staging_collection_name,
+    is_same_embedding,
+    is_same_namespace,
+)
+
+NAMESPACE = ":sentence-transformers/all-MiniLM-L6-v2"
+
+
+def chunk(text: str, page: int) -> Document:
+    return Document(page_content=text, metadata={"source": "report.pdf", "page": page})
+
+
+def store(docs):
+    """Metadata by chunk id of `docs` as stored by a first ingest."""
+    diff = ChunkDiff(NAMESPACE, {})
+    return {diff.add(doc)[0]: doc.metadata for doc in docs}
+
+
+def test_chunk_id_is_deterministic():
+    chunk_id = get_chunk_id(NAMESPACE, "Some text.", 0)
+
+    assert chunk_id == get_chunk_id(NAMESPACE, "Some text.", 0)
+    assert len(chunk_id) == 32
+    assert chunk_id != get_chunk_id(NAMESPACE, "Some text.", 1)
+    assert chunk_id != get_chunk_id(NAMESPACE, "Other text.", 0)
+    assert chunk_id != get_chunk_id("openai:text-embedding-3-small", "Some text.", 0)
+
+
+def test_repeated_chunks_get_distinct_ids():
+    diff = ChunkDiff(NAMESPACE, {})
+    ids = [diff.add(chunk("Confidential", page))[0] for page in range(3)]
+
+    assert len(set(ids)) == 3
+
+
+def test_unchanged_document():
+    docs = [chunk("Introduction.", 0), chunk("Results.", 1)]
+    diff = ChunkDiff(NAMESPACE, store(docs))
+
+    assert [diff.add(doc)[1] for doc in docs] == [UNCHANGED, UNCHANGED]
+    assert diff.get_deleted() == []
+
+
+def test_added_moved_and_deleted_chunks():
+    previous = store(
+        [chunk("Introduction.", 0), chunk("Old results.", 1), chunk("Outlook.", 2)]
+    )
+    diff = ChunkDiff(NAMESPACE, previous)
+
+    changes = [
+        diff.add(doc)[1]
+        for doc in [
+            chunk("Introduction.", 0),
+            chunk("Summary.", 1),
+            chunk("New results.", 2),
+            chunk("Outlook.", 3),
+        ]
+    ]
+    assert changes == [UNCHANGED, ADDED, ADDED, MOVED]
+
+    [deleted] = diff.get_deleted()
+    assert previous[deleted] == {"source": "report.pdf", "page": 1}
+
+
+def test_chunks_of_another_model_are_all_added():
+    docs = [chunk("Introduction.", 0), chunk("Results.", 1)]
+    diff = ChunkDiff("openai:text-embedding-3-small", store(docs))
+
+    assert [diff.add(doc)[1] for doc in docs] == [ADDED, ADDED]
+    assert len(diff.get_deleted()) == 2
+
+
+def test_collection_namespace():
+    metadata = get_collection_metadata(NAMESPACE)
+
+    assert is_same_namespace(metadata, NAMESPACE)
+    assert not is_same_namespace(metadata, "openai:text-embedding-3-small")
+    # Collections stored before the namespace was recorded
+    assert not is_same_namespace(None, NAMESPACE)
+    assert not is_same_namespace({"hnsw:space": "l2"}, NAMESPACE)
+
+
+def test_stamped_metadata_records_the_namespace():
+    metadata = get_stamped_metadata({"hnsw:space": "l2", "owner": "a"}, NAMESPACE)
+
+    assert is_same_namespace(metadata, NAMESPACE)
+    # Chroma refuses to change the distance function
+    assert metadata == {"owner": "a", "embedding_namespace": NAMESPACE}
+    assert get_stamped_metadata(None, NAMESPACE) == get_collection_metadata(NAMESPACE)
+
+
+def test_staging_collection_name():
+    collection_name = "a" * 63
+    staging_name = get_staging_collection_name(collection_name, NAMESPACE)
+
+    assert len(staging_name) <= 63
+    assert staging_name != get_staging_collection_name(
+        collection_name, "openai:text-embedding-3-small"
+    )
+    assert staging_name == get_staging_collection_name(collection_name, NAMESPACE)
+
+
+def test_same_embedding():
+    assert is_same_embedding([0.6, 0.8], [0.6001, 0.7999])
+    assert not is_same_embedding([0.6, 0.8], [0.8, -0.6])
+    # Models of another dimension
+    assert not is_same_embedding([0.6, 0.8], [0.6, 0.8, 0.0])
+    assert not is_same_embedding([0.0, 0.0], [0.0, 0.0])
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class LocalCancellationBackend:
+    """Single worker: every cancellation is handled by the local registry."""
+
+    async def publish(self, request_id: str):
+        pass
+
+    async def listen(self, on_cancel: Callable[[str], bool]):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RedisCancellationBackend:
+    """
+    Broadcasts cancellations over a redis pub/sub channel so the worker that
+    owns the stream aborts it, whichever worker received the cancel request.
+    """
+
+    def __init__(self, url: str, channel: str = "open-webui:cancel"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.channel = channel
+
+    async def publish(self, request_id: str):
+        await self.client.publish(self.channel, request_id)
+
+    async def listen(self, on_cancel: Callable[[str], bool]):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    on_cancel(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            await pubsub.close()
+
+    async def close(self):
+        await self.client.close()
+
+
+def get_cancellation_backend(name: str, redis_url: Optional[str] = None):
+    if name == "redis":
+        try:
+            return RedisCancellationBackend(redis_url)
+        except ImportError:
+            log.warning("redis not installed, cancelling requests in this worker only")
+    elif name != "memory":
+        log.warning(f"Unknown cancellation backend: {name}, using memory")
+
+    return LocalCancellationBackend()
+
+
+class CancellationRegistry:
+    """
+    request id -> abort callback of the streams running in this worker.
+
+    Lookups are O(1) and `cancel` aborts the upstream right away instead of
+    waiting for the next chunk. Cancellations for streams owned by another
+    worker are forwarded through the shared backend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalCancellationBackend()
+        self._callbacks: Dict[str, Callable[[], None]] = {}
+
+    def register(self, request_id: str, on_cancel: Callable[[], None]):
+        self._callbacks[request_id] = on_cancel
+
+    def unregister(self, request_id: str):
+        self._callbacks.pop(request_id, None)
+
+    def is_active(self, request_id: str) -> bool:
+        return request_id in self._callbacks
+
+    def cancel_local(self, request_id: str) -> bool:
+        on_cancel = self._callbacks.pop(request_id, None)
+        if on_cancel is None:
+            return False
+
+        log.info(f"Cancelling request {request_id}")
+        on_cancel()
+        return True
+
+    async def cancel(self, request_id: str):
+        if not self.cancel_local(request_id):
+            await self.backend.publish(request_id)
+
+    async def run(self):
+        while True:
+            try:
+                await self.backend.listen(self.cancel_local)
+                return
+            except Exception as e:
+                log.error(f"Cancellation listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        self._callbacks = {}
+        await self.backend.close()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """StreamingResponse that reports an ASGI client disconnect."""
+
+    def __init__(
+        self, *args, on_disconnect: Optional[Callable[[], None]] = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.on_disconnect = on_disconnect
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        # Returns only on http.disconnect, it is cancelled once the body is sent
+        await super().listen_for_disconnect(receive)
+        if self.on_disconnect:
+            self.on_disconnect()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class CircuitBreaker:
+    """
+    closed: traffic flows, consecutive failures are counted.
+    open: the backend is ejected until `recovery_timeout` has passed or an
+          active probe succeeds.
+    half_open: traffic is re-admitted gradually, the share of requests let
+               through grows with every success until `half_open_successes`
+               successes close the circuit. Any failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30,
+        half_open_successes: int = 3,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_successes = half_open_successes
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.successes = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.successes = 0
+
+    def _half_open(self):
+        self.state = self.HALF_OPEN
+        self.successes = 0
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            if time.time() - self.opened_at < self.recovery_timeout:
+                return False
+            self._half_open()
+
+        if self.state == self.HALF_OPEN:
+            admitted = (self.successes + 1) / (self.half_open_successes + 1)
+            return random.random() < admitted
+
+        return True
+
+    def record_success(self):
+        if self.state == self.CLOSED:
+            self.failures = 0
+            return
+
+        if self.state == self.OPEN:
+            self._half_open()
+
+        self.successes += 1
+        if self.successes >= self.half_open_successes:
+            log.info("circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, error: Optional[str] = None):
+        self.last_error = error
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "successes": self.successes,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+        }
+
+
+class HealthChecker:
+    """
+    Probes a set of upstreams on an interval and keeps a circuit breaker per
+    upstream URL. Real traffic feeds the same breakers through
+    `record_success` / `record_failure`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        get_urls: Callable[[], List[str]],
+        probe: Callable[[int, str], Awaitable[bool]],
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30,
+        half_open_successes: int = 3,
+    ):
+        self.name = name
+        self.get_urls = get_urls
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_successes = half_open_successes
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._checked_at: Dict[str, float] = {}
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=self.failure_threshold,
+                recovery_timeout=self.recovery_timeout,
+                half_open_successes=self.half_open_successes,
+            )
+            self._breakers[url] = breaker
+        return breaker
+
+    def is_available(self, url: str) -> bool:
+        return self.get_breaker(url).allow_request()
+
+    def record_success(self, url: str):
+        self.get_breaker(url).record_success()
+
+    def record_failure(self, url: str, error: Optional[str] = None):
+        breaker = self.get_breaker(url)
+        state = breaker.state
+        breaker.record_failure(error)
+        if breaker.state == CircuitBreaker.OPEN and state != CircuitBreaker.OPEN:
+            log.warning(f"{self.name}: ejecting {url}: {error}")
+
+    async def _check(self, idx: int, url: str):
+        try:
+            healthy = await self.probe(idx, url)
+            error = None if healthy else "health check failed"
+        except Exception as e:
+            healthy = False
+            error = str(e)
+
+        self._checked_at[url] = time.time()
+        if healthy:
+            self.record_success(url)
+        else:
+            self.record_failure(url, error)
+
+    async def check(self):
+        urls = self.get_urls()
+        await asyncio.gather(*[self._check(idx, url) for idx, url in enumerate(urls)])
+
+    async def run(self, interval: float):
+        log.info(f"{self.name}: health checks started, probing every {interval}s")
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                log.exception(e)
+            await asyncio.sleep(interval)
+
+    def get_status(self, urls: List[str]) -> List[dict]:
+        return [
+            {
+                "idx": idx,
+                "url": url,
+                "checked_at": self._checked_at.get(url),
+                **self.get_breaker(url).to_dict(),
+            }
+            for idx, url in enumerate(urls)
+        ]
@@ -0,0 +1,56 @@
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class HTTPClientPool:
+    """
+    Long-lived aiohttp sessions keyed by upstream base URL.
+
+    Every base URL gets its own connector so keep-alive connections are reused
+    across requests and the connection limit applies per backend rather than
+    to the process as a whole.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        keepalive_timeout: float = 30,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+    ):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def get_session(self, base_url: str) -> aiohttp.ClientSession:
+        # Sessions are bound to the running event loop, so this must only be
+        # called from async code.
+        session = self._sessions.get(base_url)
+        if session is None or session.closed:
+            log.debug(f"creating http session for {base_url}")
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[base_url] = session
+        return session
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions = {}
+        for session in sessions:
+            if not session.closed:
+                await session.close()
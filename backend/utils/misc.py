@@ -1,5 +1,6 @@
 from pathlib import Path
 import hashlib
+import math
 import re
 from datetime import timedelta
 from typing import Optional, List
@@ -119,3 +120,13 @@ def parse_duration(duration: str) -> Optional[timedelta]:
             total_duration += timedelta(weeks=number)
 
     return total_duration
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    # Vectors of different embedding models are not comparable
+    if len(a) != len(b):
+        return 0.0
+
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
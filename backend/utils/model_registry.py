@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import SRC_LOG_LEVELS
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
+
+class ModelRegistry:
+    """
+    TTL cache of the merged model list of a set of backends.
+
+    - `fetch(idx, url)` returns the raw model list of one backend, or None
+      when the backend could not be reached.
+    - `merge(responses)` turns the per-backend responses (None for skipped or
+      failed backends) into the value served to clients.
+    - `on_update(value)` is called after every refresh, e.g. to rebuild the
+      model -> backend lookup table of the app.
+
+    Reads never wait on the backends once a value exists: a stale value is
+    returned while a single background refresh runs (stale-while-revalidate).
+    Backends that fail are skipped with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        get_urls: Callable[[], List[str]],
+        fetch: Callable[[int, str], Awaitable[Optional[Any]]],
+        merge: Callable[[List[Optional[Any]]], dict],
+        on_update: Optional[Callable[[dict], None]] = None,
+        ttl: float = 60,
+        backoff: float = 5,
+        max_backoff: float = 300,
+    ):
+        self.name = name
+        self.get_urls = get_urls
+        self.fetch = fetch
+        self.merge = merge
+        self.on_update = on_update
+        self.ttl = ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.value: Optional[dict] = None
+        self.updated_at = 0.0
+
+        self._failures: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def is_stale(self) -> bool:
+        return time.time() - self.updated_at > self.ttl
+
+    async def get(self, force: bool = False) -> dict:
+        if self.value is None or force:
+            await self.refresh()
+        elif self.is_stale():
+            self.schedule_refresh()
+
+        # Callers are free to filter the top level lists of their copy
+        return dict(self.value)
+
+    def schedule_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+
+    async def refresh(self):
+        # Concurrent callers share the same in-flight refresh
+        await asyncio.shield(self.schedule_refresh())
+
+    def invalidate(self, reset_backoff: bool = False):
+        """Marks the cache stale and refreshes it in the background."""
+        self.updated_at = 0.0
+        if reset_backoff:
+            self._failures = {}
+            self._retry_at = {}
+
+        try:
+            self.schedule_refresh()
+        except RuntimeError:
+            # No running event loop, the next read will refresh
+            pass
+
+    async def _fetch_backend(self, idx: int, url: str) -> Optional[Any]:
+        if time.time() < self._retry_at.get(url, 0):
+            log.debug(f"{self.name}: skipping {url}, backing off")
+            return None
+
+        try:
+            response = await self.fetch(idx, url)
+        except Exception as e:
+            log.error(f"{self.name}: error fetching models from {url}: {e}")
+            response = None
+
+        if response is None:
+            failures = self._failures.get(url, 0) + 1
+            self._failures[url] = failures
+            self._retry_at[url] = time.time() + min(
+                self.backoff * 2 ** (failures - 1), self.max_backoff
+            )
+        else:
+            self._failures.pop(url, None)
+            self._retry_at.pop(url, None)
+
+        return response
+
+    async def _refresh(self):
+        log.info(f"{self.name}: refreshing models")
+        urls = self.get_urls()
+        responses = await asyncio.gather(
+            *[self._fetch_backend(idx, url) for idx, url in enumerate(urls)]
+        )
+
+        value = self.merge(list(responses))
+        self.value = value
+        self.updated_at = time.time()
+
+        if self.on_update:
+            self.on_update(value)
+
+    async def run(self, interval: float):
+        """Keeps the cache warm so page loads never wait on the backends."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.exception(e)
+            await asyncio.sleep(interval)
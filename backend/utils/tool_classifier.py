@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config import SRC_LOG_LEVELS
+from utils.misc import cosine_similarity
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class ToolIntent:
+    NONE = "none"
+    MATCH = "match"
+    AMBIGUOUS = "ambiguous"
+
+    def __init__(
+        self,
+        decision: str,
+        scores: Dict[Tuple[str, str], float],
+        none_score: float = 0.0,
+    ):
+        self.decision = decision
+        # (toolkit id, function name) -> best similarity
+        self.scores = scores
+        self.none_score = none_score
+
+    @property
+    def best(self) -> Optional[Tuple[str, str]]:
+        if not self.scores:
+            return None
+        return max(self.scores, key=self.scores.get)
+
+
+class ToolIntentClassifier:
+    """
+    Scores a query against the embedded descriptions and labelled example
+    queries of every toolkit function, with the RAG embedding function.
+
+    - best score below `low`: no tool applies, the LLM is not asked
+    - best score at or above `high` (and above the closest "none" example):
+      the function is picked without asking the LLM
+    - anything in between is ambiguous and escalated to the LLM
+
+    The index is persisted to `path` and rebuilt per toolkit when the
+    toolkit version (updated_at) or the embedding model changes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        get_embedding_function: Callable[[], Tuple[str, Callable]],
+        examples: Optional[Dict[str, List[str]]] = None,
+        low: float = 0.3,
+        high: float = 0.8,
+    ):
+        self.path = path
+        self.get_embedding_function = get_embedding_function
+        self.examples = examples or {}
+        self.low = low
+        self.high = high
+
+        # toolkit id -> {"version": updated_at, "functions": {name: [vectors]}}
+        self.tools: Dict[str, dict] = {}
+        self.none_vectors: List[List[float]] = []
+        self.embedding_key: Optional[str] = None
+
+        # Indexes are built aside and swapped in whole, classify reads them
+        # while they are rebuilt, writers take turns
+        self._write_lock = threading.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                index = json.load(f)
+            self.embedding_key = index["embedding_key"]
+            self.tools = index["tools"]
+            self.none_vectors = index["none"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.error(f"Error loading tool intent index: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "embedding_key": self.embedding_key,
+                    "tools": self.tools,
+                    "none": self.none_vectors,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def is_stale(self, tools: list) -> bool:
+        embedding_key, _ = self.get_embedding_function()
+        if embedding_key != self.embedding_key:
+            return True
+
+        versions = {tool.id: tool.updated_at for tool in tools}
+        return versions != {
+            tool_id: index["version"] for tool_id, index in self.tools.items()
+        }
+
+    def _get_base(
+        self, embedding_key: str, embedding_function: Callable
+    ) -> Tuple[Dict[str, dict], List[List[float]]]:
+        """Copies of the indexes to update, empty for another embedding model."""
+        if embedding_key == self.embedding_key:
+            return dict(self.tools), self.none_vectors
+
+        none_vectors = (
+            embedding_function(self.examples["none"]) if "none" in self.examples else []
+        )
+        return {}, none_vectors
+
+    def _swap(
+        self,
+        embedding_key: str,
+        tools: Dict[str, dict],
+        none_vectors: List[List[float]],
+    ):
+        self.tools = tools
+        self.none_vectors = none_vectors
+        self.embedding_key = embedding_key
+        self.save()
+
+    def _index_tool(self, tool, embedding_function: Callable) -> dict:
+        functions = {}
+        for spec in tool.specs:
+            texts = [spec.get("description") or spec["name"]]
+            texts.extend(self.examples.get(spec["name"], []))
+            functions[spec["name"]] = embedding_function(texts)
+        return {"version": tool.updated_at, "functions": functions}
+
+    def rebuild_tool(self, tool):
+        """Re-embeds one toolkit, e.g. after it was created or updated."""
+        embedding_key, embedding_function = self.get_embedding_function()
+        with self._write_lock:
+            tools, none_vectors = self._get_base(embedding_key, embedding_function)
+            log.info(f"Indexing tool intents of {tool.id}")
+            tools[tool.id] = self._index_tool(tool, embedding_function)
+            self._swap(embedding_key, tools, none_vectors)
+
+    def remove_tool(self, tool_id: str):
+        with self._write_lock:
+            if tool_id in self.tools:
+                tools = {
+                    other_id: index
+                    for other_id, index in self.tools.items()
+                    if other_id != tool_id
+                }
+                self._swap(self.embedding_key, tools, self.none_vectors)
+
+    def rebuild(self, tools: list):
+        embedding_key, embedding_function = self.get_embedding_function()
+        with self._write_lock:
+            base, none_vectors = self._get_base(embedding_key, embedding_function)
+
+            indexes = {}
+            for tool in tools:
+                index = base.get(tool.id)
+                if index is None or index.get("version") != tool.updated_at:
+                    log.info(f"Indexing tool intents of {tool.id}")
+                    index = self._index_tool(tool, embedding_function)
+                indexes[tool.id] = index
+            self._swap(embedding_key, indexes, none_vectors)
+
+    def schedule_rebuild(self, tools: list) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(
+                run_in_threadpool(self.rebuild, tools)
+            )
+        return self._refresh_task
+
+    def classify(self, query: str) -> ToolIntent:
+        embedding_key, embedding_function = self.get_embedding_function()
+        tools, none_vectors = self.tools, self.none_vectors
+        if embedding_key != self.embedding_key or not tools:
+            return ToolIntent(ToolIntent.AMBIGUOUS, {})
+
+        vector = embedding_function(query)
+
+        scores = {
+            (tool_id, name): max(
+                (cosine_similarity(vector, v) for v in vectors), default=0.0
+            )
+            for tool_id, index in tools.items()
+            for name, vectors in index["functions"].items()
+        }
+        none_score = max(
+            (cosine_similarity(vector, v) for v in none_vectors), default=0.0
+        )
+
+        best_score = max(scores.values(), default=0.0)
+        if best_score < self.low:
+            decision = ToolIntent.NONE
+        elif best_score >= self.high and best_score > none_score:
+            decision = ToolIntent.MATCH
+        else:
+            decision = ToolIntent.AMBIGUOUS
+
+        log.debug(f"tool intent: {decision} {best_score:.3f} (none {none_score:.3f})")
+        return ToolIntent(decision, scores, none_score)
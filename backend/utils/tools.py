@@ -1,5 +1,9 @@
 import inspect
-from typing import get_type_hints, List, Dict, Any
+import json
+import re
+from typing import get_type_hints, List, Dict, Any, Optional, Set, Tuple
+
+from apps.web.utils import tools_function_calling_generation_template
 
 
 def doc_to_dict(docstring):
@@ -71,3 +75,101 @@ def get_tools_specs(tools) -> List[dict]:
         )
 
     return specs
+
+
+STOPWORDS = set("""
+    about and any are but can could does for from have how into not only please
+    should that the their them then there these this those was what when where
+    which who why will with would you your
+    """.split())
+
+
+def get_keywords(text: str) -> Set[str]:
+    keywords = set()
+    # Any script, an Arabic query has to match an Arabic description
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) < (3 if word.isascii() else 2) or word in STOPWORDS:
+            continue
+        # Cheap plural folding so "certificates" matches "certificate"
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        keywords.add(word)
+    return keywords
+
+
+class ToolsPromptCache:
+    """
+    Function calling prompts and keywords prepared from the specs of the
+    toolkits, keyed by toolkit id and version (updated_at) so an updated
+    toolkit is picked up without explicit invalidation.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._prompts: Dict[Tuple, str] = {}
+        self._keywords: Dict[Tuple, Set[str]] = {}
+
+    def _evict(self, cache: dict):
+        # Old versions of updated toolkits are never looked up again
+        while len(cache) >= self.maxsize:
+            cache.pop(next(iter(cache)))
+
+    def get_keywords(self, tool) -> Set[str]:
+        key = (tool.id, tool.updated_at)
+        keywords = self._keywords.get(key)
+        if keywords is None:
+            text = " ".join(
+                f"{spec['name'].replace('_', ' ')} {spec.get('description', '')}"
+                for spec in tool.specs
+            )
+            keywords = get_keywords(f"{text} {tool.meta.description or ''}")
+
+            self._evict(self._keywords)
+            self._keywords[key] = keywords
+        return keywords
+
+    def get_prompt(self, tools: list, template: str) -> str:
+        key = (tuple((tool.id, tool.updated_at) for tool in tools), template)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            # Parameters are filled in by the server, only names and
+            # descriptions are shown to the model
+            specs = [
+                {**spec, "parameters": {}} if "parameters" in spec else spec
+                for tool in tools
+                for spec in tool.specs
+            ]
+            prompt = tools_function_calling_generation_template(
+                template, json.dumps(specs, indent=2)
+            )
+
+            self._evict(self._prompts)
+            self._prompts[key] = prompt
+        return prompt
+
+    def matches(self, tool, prompt: str, min_overlap: int = 1) -> bool:
+        """Keyword prefilter run before asking the model about a toolkit."""
+        keywords = get_keywords(prompt)
+        if min_overlap <= 0 or not keywords:
+            return True
+        return len(self.get_keywords(tool) & keywords) >= min_overlap
+
+    def prefilter(self, tools: list, prompt: str, min_overlap: int = 1) -> list:
+        """
+        The toolkits sharing keywords with the prompt, in toolkit order. A
+        paraphrase sharing no keyword with any toolkit keeps them all, the
+        prefilter only narrows down, it never decides there is no tool.
+        """
+        matched = [tool for tool in tools if self.matches(tool, prompt, min_overlap)]
+        return matched or tools
+
+
+def get_function_tool_ids(tools: list) -> Optional[Dict[str, str]]:
+    """Function name -> toolkit id, None when function names are ambiguous."""
+    function_tool_ids = {}
+    for tool in tools:
+        for spec in tool.specs:
+            if spec["name"] in function_tool_ids:
+                return None
+            function_tool_ids[spec["name"]] = tool.id
+    return function_tool_ids
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, Optional
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds the limit of {max_size} bytes")
+        self.max_size = max_size
+
+
+class StoredUpload:
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+
+def save_upload(
+    file: BinaryIO,
+    path: str,
+    max_size: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    Streams `file` to `path` one chunk at a time, hashing as it writes, so
+    memory stays bounded by `chunk_size` whatever the size of the upload.
+
+    The upload is written to a temporary file next to `path` and renamed
+    into place once complete, so readers never see a partial file. Raises
+    UploadTooLargeError, leaving nothing behind, once more than `max_size`
+    bytes were received.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{uuid.uuid4()}.part")
+
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise UploadTooLargeError(max_size)
+
+                sha256.update(chunk)
+                f.write(chunk)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StoredUpload(path, size, sha256.hexdigest())
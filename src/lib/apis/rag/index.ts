@@ -158,6 +158,49 @@ export const updateQuerySettings = async (token: string, settings: QuerySettings
 	return res;
 };
 
+export const getIngestionJob = async (token: string, job_id: string) => {
+	let error = null;
+
+	const res = await fetchApi(`${RAG_API_BASE_URL}/jobs/${job_id}`, {
+		method: 'GET',
+		headers: {
+			Accept: 'application/json',
+			authorization: `Bearer ${token}`
+		}
+	})
+		.then(async (res) => {
+			if (!res.ok) throw await res.json();
+			return res.json();
+		})
+		.catch((err) => {
+			error = err.detail;
+			console.log(err);
+			return null;
+		});
+
+	if (error) {
+		throw error;
+	}
+
+	return res;
+};
+
+// Documents are loaded and embedded by a background job, their collection
+// only exists once it completed
+export const waitForIngestionJob = async (token: string, job_id: string, interval = 1000) => {
+	while (true) {
+		const job = await getIngestionJob(token, job_id);
+		if (job.status === 'completed') {
+			return job;
+		}
+		if (job.status === 'failed') {
+			throw job.error ?? 'Failed to process the document';
+		}
+
+		await new Promise((resolve) => setTimeout(resolve, interval));
+	}
+};
+
 export const uploadDocToVectorDB = async (token: string, collection_name: string, file: File) => {
 	const data = new FormData();
 	data.append('file', file);
@@ -187,6 +230,10 @@ export const uploadDocToVectorDB = async (token: string, collection_name: string
 		throw error;
 	}
 
+	if (res?.job_id) {
+		await waitForIngestionJob(token, res.job_id);
+	}
+
 	return res;
 };
 
@@ -219,6 +266,10 @@ export const uploadWebToVectorDB = async (token: string, collection_name: string
 		throw error;
 	}
 
+	if (res?.job_id) {
+		await waitForIngestionJob(token, res.job_id);
+	}
+
 	return res;
 };
 
@@ -250,6 +301,10 @@ export const uploadYoutubeTranscriptionToVectorDB = async (token: string, url: s
 		throw error;
 	}
 
+	if (res?.job_id) {
+		await waitForIngestionJob(token, res.job_id);
+	}
+
 	return res;
 };
 
@@ -350,6 +405,19 @@ export const scanDocs = async (token: string) => {
 		throw error;
 	}
 
+	if (res?.job_id) {
+		// The scan queues a job per new or changed file
+		const job = await waitForIngestionJob(token, res.job_id);
+		const results = await Promise.allSettled(
+			(job.result?.jobs ?? []).map((job_id: string) => waitForIngestionJob(token, job_id))
+		);
+
+		const failed = results.filter((result) => result.status === 'rejected');
+		if (failed.length > 0) {
+			throw `${failed.length} of ${results.length} files could not be processed`;
+		}
+	}
+
 	return res;
 };
 